@@ -1,47 +1,8 @@
-import re
+""" Stage 1 on its own: prints the tokens of an example program. The lexer is minilang.lexer. """
+from minilang.lexer import lex, lex_stream
 
-# Define token patterns
-token_patterns = {
-    'KEYWORD': r'\b(if|else|while|function|return|input|output)\b',
-    'IDENTIFIER': r'\b[a-zA-Z_][a-zA-Z0-9_]*\b',
-    'NUMBER': r'\b\d+\b',
-    'OPERATOR': r'[+\-*/=<>!]',
-    'DELIMITER': r'[;(),{}]',  # Include curly braces
-    'WHITESPACE': r'\s+',
-    'COMMENT': r'//.*|/\*.*?\*/',  # Single-line and multi-line comments
-    'MISMATCH': r'.',  # Any other character that doesn't match the above
-}
-
-# Compile the regex patterns
-token_regex = '|'.join(f'(?P<{key}>{pattern})' for key, pattern in token_patterns.items())
-
-# Lexical analyzer function
-def lex(code):
-    tokens = []
-    line_number = 1
-    for mo in re.finditer(token_regex, code):
-        kind = mo.lastgroup
-        value = mo.group()
-        
-        # Skip whitespace and comments
-        if kind == 'WHITESPACE' or kind == 'COMMENT':
-            continue
-
-        # Handle unrecognized symbols
-        elif kind == 'MISMATCH':
-            print(f"Error: Unrecognized symbol '{value}' at line {line_number}")
-            continue
-
-        # Append token to the list
-        tokens.append((kind, value))
-        
-        # Increment line number for each newline character
-        line_number += value.count('\n')
-        
-    return tokens
-
-# Example usage
-mini_lang_code = '''
+if __name__ == "__main__":
+    mini_lang_code = '''
 function main() {
     x = 5;
     if (x > 10) {
@@ -50,6 +11,6 @@ function main() {
 }
 '''
 
-tokens = lex(mini_lang_code)
-for token in tokens:
-    print(token)
+    tokens = lex(mini_lang_code)
+    for token in tokens:
+        print(token)
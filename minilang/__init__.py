@@ -0,0 +1,41 @@
+""" The MiniLang compiler as a library.
+
+Importing the package runs nothing and loads no stage: each name below is imported from its
+module the first time it is used, so `from minilang import lex` pays for the lexer alone and
+the optimizer and backend load only when asked for.
+"""
+import importlib
+
+# Public name -> the module that defines it
+EXPORTS = {
+    'lex': 'lexer', 'lex_stream': 'lexer', 'lex_file': 'lexer', 'token_patterns': 'lexer', 'DFAScanner': 'lexer',
+    'lex_regex': 'regex_lexer', 'TokenBuffer': 'lexer', 'Diagnostic': 'lexer', 'SourceMap': 'lexer',
+    'Node': 'syntax', 'NodeVisitor': 'syntax', 'Parser': 'syntax', 'PackedParser': 'syntax',
+    'SymbolTable': 'semantic', 'SemanticAnalyzer': 'semantic',
+    'IRCode': 'ir', 'Instruction': 'ir', 'IntermediateCodeGenerator': 'ir',
+    'SyntaxDirectedTranslator': 'translator',
+    'ControlFlowGraph': 'optimizer', 'OptimizedIntermediateCodeGenerator': 'optimizer',
+    'AssemblyCodeGenerator': 'backend', 'InstructionSelector': 'backend', 'Tile': 'backend',
+    'PeepholeOptimizer': 'backend', 'PeepholeRule': 'backend',
+    'ObjectWriter': 'objfile', 'ObjectFile': 'objfile',
+    'VirtualMachine': 'vm', 'check_equivalence': 'vm',
+    'IncrementalDocument': 'incremental',
+    'Instrumentation': 'instrumentation',
+    'COMPILER_VERSION': 'cache', 'CompilationCache': 'cache', 'MemoryCache': 'cache',
+    'compile_source': 'driver', 'compile_batch': 'driver',
+    'CompileServer': 'server', 'CompileClient': 'server', 'compile_remote': 'client',
+    'generate_program': 'benchmark',
+}
+
+__all__ = sorted(EXPORTS)
+
+def __getattr__(name):
+    module = EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,562 @@
+""" Stage 6: register allocation, assembly generation and the peephole pass. """
+from itertools import chain, islice
+from collections import Counter
+
+from .ir import (IR_BINARY, IR_COPY, IR_DECLARE, IR_GOTO, IR_IF, IR_LABEL, IR_OPERATOR, IR_RETURN, SYM_CONSTANT,
+                 SYM_TEMP, Instruction)
+from .optimizer import ControlFlowGraph, instruction_def, instruction_uses
+
+class LiveInterval:
+    """ Range of IR positions over which a temp holds a value that is still needed. """
+    __slots__ = ('symbol', 'start', 'end', 'register')
+
+    def __init__(self, symbol, start, end):
+        self.symbol = symbol
+        self.start = start
+        self.end = end
+        self.register = None
+
+# Two-address instruction for each IR operator: "OP Rd, src" computes Rd = Rd <op> src
+ASSEMBLY_MNEMONICS = {
+    IR_BINARY['+']: 'ADD', IR_BINARY['-']: 'SUB', IR_BINARY['*']: 'MUL', IR_BINARY['/']: 'DIV',
+    IR_BINARY['=']: 'EQ', IR_BINARY['<']: 'LT', IR_BINARY['>']: 'GT', IR_BINARY['!']: 'NE',
+}
+ARITHMETIC_MNEMONICS = tuple(ASSEMBLY_MNEMONICS.values())
+MOVE_MNEMONICS = ('LOAD', 'STORE')  # "LOAD src, dest" and "STORE src, dest" both copy src to dest
+BRANCH_MNEMONICS = ('IFGT', 'IFLT', 'IFEQ', 'IFNE', 'IFGE', 'IFLE')
+NEGATED_BRANCHES = {'IFGT': 'IFLE', 'IFLT': 'IFGE', 'IFEQ': 'IFNE', 'IFNE': 'IFEQ', 'IFGE': 'IFLT', 'IFLE': 'IFGT'}
+EXECUTABLE_MNEMONICS = MOVE_MNEMONICS + ARITHMETIC_MNEMONICS + BRANCH_MNEMONICS + ('CMP', 'GOTO', 'RETURN')
+LABEL = 'LABEL'  # mnemonic of a parsed "L0:" line
+# The branch that "CMP a, b" takes exactly when a <op> b holds, per comparison opcode
+COMPARE_BRANCHES = {IR_BINARY['=']: 'IFEQ', IR_BINARY['<']: 'IFLT', IR_BINARY['>']: 'IFGT', IR_BINARY['!']: 'IFNE'}
+# Opcodes whose operands can trade places: a <op> b is b <SWAPPED_OPERATORS[op]> a
+SWAPPED_OPERATORS = {IR_BINARY[left]: IR_BINARY[right]
+                     for left, right in (('+', '+'), ('*', '*'), ('=', '='), ('!', '!'), ('<', '>'), ('>', '<'))}
+
+def parse_assembly(line):
+    """ An assembly line as a (mnemonic, *operands) tuple. """
+    if line.endswith(':'):
+        return (LABEL, line[:-1])
+    mnemonic, _, rest = line.partition(' ')
+    return (mnemonic, *rest.split(', ')) if rest else (mnemonic,)
+
+def format_assembly(instruction):
+    if instruction[0] == LABEL:
+        return f"{instruction[1]}:"
+    return f"{instruction[0]} {', '.join(instruction[1:])}" if len(instruction) > 1 else instruction[0]
+
+# Where each mnemonic's read operands, written operand and jump target sit in a parsed instruction
+READ_OPERANDS = dict.fromkeys(MOVE_MNEMONICS + ('RETURN',), slice(1, 2))
+READ_OPERANDS.update(dict.fromkeys(ARITHMETIC_MNEMONICS + ('CMP',), slice(1, 3)))
+WRITTEN_OPERAND = dict.fromkeys(MOVE_MNEMONICS, 2)
+WRITTEN_OPERAND.update(dict.fromkeys(ARITHMETIC_MNEMONICS, 1))
+JUMP_TARGET = dict.fromkeys(BRANCH_MNEMONICS + ('GOTO',), 1)
+NO_OPERANDS = slice(0, 0)
+
+def assembly_reads(instruction):
+    """ Operands whose values a parsed assembly instruction reads. """
+    return instruction[READ_OPERANDS.get(instruction[0], NO_OPERANDS)]
+
+def assembly_write(instruction):
+    """ Operand a parsed assembly instruction writes, if any. """
+    index = WRITTEN_OPERAND.get(instruction[0])
+    return None if index is None else instruction[index]
+
+def assembly_target(instruction):
+    """ Label a parsed assembly instruction jumps to, if any. """
+    index = JUMP_TARGET.get(instruction[0])
+    return None if index is None else instruction[index]
+
+# Registers and spill slots share the assembly namespace with source variables, so they carry
+# sigils that no identifier can contain: %R0, %R1, ... and $t3 for spilled temp t3
+REGISTER_PREFIX = '%R'
+SPILL_PREFIX = '$'
+
+def register_name(number):
+    return f"{REGISTER_PREFIX}{number}"
+
+def is_register(operand):
+    return operand.startswith(REGISTER_PREFIX)
+
+def is_constant(operand):
+    return operand.lstrip('-').isdigit()
+
+def move_mnemonic(bindings):
+    """ STORE for a register written to memory, LOAD otherwise, as generate_assembly() chooses. """
+    return 'STORE' if is_register(bindings['a']) and not is_register(bindings['c']) else 'LOAD'
+
+class PeepholeRule:
+    """ A window of instruction patterns, a constraint on what they bind, and what replaces the window.
+
+    A pattern is (mnemonics, *operands): a mnemonic or a tuple of alternatives, then a variable
+    per operand, or '*' for any operands. A variable that appears twice must match the same
+    operand both times, and the matched mnemonics are bound to their window positions. In the
+    replacement an int copies that window instruction; anything else is a pattern whose variables
+    are filled in, and whose mnemonic may be a function of the bindings. constraint(optimizer,
+    bindings) can veto a match. Every rule shrinks the code, so rewriting always terminates.
+    """
+    __slots__ = ('name', 'pattern', 'replacement', 'constraint', 'shapes', 'first', 'slots', 'equal')
+
+    def __init__(self, name, pattern, replacement, constraint=None):
+        self.name = name
+        self.pattern = [((item[0],) if isinstance(item[0], str) else item[0], *item[1:]) for item in pattern]
+        self.replacement = replacement
+        self.constraint = constraint
+        # The pattern compiled for match(): allowed mnemonics and instruction length per position,
+        # where each variable is first bound, and the operand pairs a repeated variable makes equal
+        self.shapes = [(frozenset(item[0]), None if item[1:] == ('*',) else len(item)) for item in self.pattern]
+        self.first = self.shapes[0][0]
+        self.slots, self.equal = {}, []
+        for position, item in enumerate(self.pattern):
+            if item[1:] == ('*',):
+                continue
+            for index, variable in enumerate(item[1:], 1):
+                if variable in self.slots:
+                    self.equal.append((*self.slots[variable], position, index))
+                else:
+                    self.slots[variable] = (position, index)
+
+    def match(self, window):
+        """ Bindings if window matches the pattern, else None. """
+        for (mnemonics, length), instruction in zip(self.shapes, window):
+            if instruction[0] not in mnemonics or length is not None and len(instruction) != length:
+                return None
+        for position, index, other, other_index in self.equal:
+            if window[position][index] != window[other][other_index]:
+                return None
+        bindings = {variable: window[position][index] for variable, (position, index) in self.slots.items()}
+        bindings.update(enumerate(instruction[0] for instruction in window))
+        return bindings
+
+    def build(self, window, bindings):
+        instructions = []
+        for item in self.replacement:
+            if isinstance(item, int):
+                instructions.append(window[item])
+            else:
+                mnemonic = item[0] if isinstance(item[0], str) else item[0](bindings)
+                instructions.append((mnemonic, *(bindings[variable] for variable in item[1:])))
+        return instructions
+
+# Tried in this order at each position, longest windows first
+PEEPHOLE_RULES = [
+    # "GOTO L2" to a branch's fall-through: branch the other way instead
+    PeepholeRule('branch-over-jump', [(BRANCH_MNEMONICS, 't'), ('GOTO', 'f'), (LABEL, 't')],
+                 [(lambda bindings: NEGATED_BRANCHES[bindings[0]], 'f'), 2]),
+    # A value moved just to be returned (nothing after the RETURN runs, so the move is dead)
+    PeepholeRule('return-moved', [(MOVE_MNEMONICS, 'a', 'b'), ('RETURN', 'b')], [('RETURN', 'a')]),
+    # A value moved through a location nothing reads afterwards
+    PeepholeRule('forward-move', [(MOVE_MNEMONICS, 'a', 'b'), (MOVE_MNEMONICS, 'b', 'c')], [(move_mnemonic, 'a', 'c')],
+                 lambda optimizer, bindings: optimizer.dead(bindings['b'])),
+    # Moving a value back where it came from
+    PeepholeRule('repeated-move', [(MOVE_MNEMONICS, 'a', 'b'), (MOVE_MNEMONICS, 'b', 'a')], [0]),
+    PeepholeRule('jump-to-next', [('GOTO', 'l'), (LABEL, 'l')], [1]),
+    PeepholeRule('unreachable', [(('GOTO', 'RETURN'), '*'), (EXECUTABLE_MNEMONICS, '*')], [0]),
+    PeepholeRule('self-move', [(MOVE_MNEMONICS, 'a', 'a')], []),
+    PeepholeRule('dead-move', [(MOVE_MNEMONICS, 'a', 'b')], [],
+                 lambda optimizer, bindings: optimizer.dead(bindings['b'])),
+    PeepholeRule('unused-label', [(LABEL, 'l')], [], lambda optimizer, bindings: not optimizer.jumps[bindings['l']]),
+]
+
+class PeepholeOptimizer:
+    """ Rewrites assembly by matching PEEPHOLE_RULES against a sliding window of instructions.
+
+    Each pass walks the code once. Instructions move from the input to the output one at a
+    time, and every rule is tried on the window that ends at the newest output instruction.
+    A rewrite pushes its replacement, and the output instruction before it, back onto the
+    input, so they are matched again together with the instructions before them. A rewrite can
+    still make code further back dead, so passes repeat until one changes nothing. fired counts
+    rewrites per rule.
+    """
+    LOOKAHEAD = 32  # instructions dead() scans past a window before assuming a value is still read
+
+    def __init__(self, rules=None):
+        self.rules = sorted(rules if rules is not None else PEEPHOLE_RULES, key=lambda rule: -len(rule.pattern))
+        self.candidates = {}  # (mnemonic before, last mnemonic) of the window -> rules that may match it
+        self.fired = Counter()
+
+    def candidates_for(self, key):
+        """ The rules whose last two patterns accept the mnemonics in key, as (size, rule) pairs. """
+        before, last = key
+        self.candidates[key] = candidates = [
+            (len(rule.pattern), rule) for rule in self.rules
+            if last in rule.shapes[-1][0] and (len(rule.pattern) == 1 or before in rule.shapes[-2][0])]
+        return candidates
+
+    def optimize(self, assembly_code):
+        return list(map(format_assembly, self.optimize_instructions(list(map(parse_assembly, assembly_code)))))
+
+    def optimize_instructions(self, code):
+        """ optimize() on parsed (mnemonic, *operands) instructions. """
+        self.reads = Counter(chain.from_iterable(map(assembly_reads, code)))
+        self.jumps = Counter(filter(None, map(assembly_target, code)))
+        changed = True
+        while changed:
+            code, changed = self.rewrite(code)
+        return code
+
+    def rewrite(self, code):
+        """ One pass over code; returns the rewritten code and whether any rule fired. """
+        self.pending = pending = code[::-1]  # input, next instruction last
+        output, changed = [], False
+        candidates, candidates_for = self.candidates, self.candidates_for
+        while pending:
+            output.append(pending.pop())
+            key = (output[-2][0] if len(output) > 1 else None, output[-1][0])
+            rules = candidates.get(key)
+            for size, rule in rules if rules is not None else candidates_for(key):
+                if size > len(output) or output[-size][0] not in rule.first:
+                    continue
+                self.window = window = output[-size:]
+                bindings = rule.match(window)
+                if bindings is None or rule.constraint is not None and not rule.constraint(self, bindings):
+                    continue
+                replacement = rule.build(window, bindings)
+                del output[-size:]
+                self.account(window, -1)
+                self.account(replacement, 1)
+                pending.extend(reversed(replacement))
+                if output:
+                    pending.append(output.pop())
+                self.fired[rule.name] += 1
+                changed = True
+                break
+        return output, changed
+
+    def account(self, instructions, sign):
+        """ Add (sign 1) or remove (sign -1) instructions' operand reads and jumps from the counts. """
+        for instruction in instructions:
+            for operand in assembly_reads(instruction):
+                self.reads[operand] += sign
+            target = assembly_target(instruction)
+            if target is not None:
+                self.jumps[target] += sign
+
+    def dead(self, name):
+        """ Whether the value name holds after the matched window is never read.
+
+        It is if nothing else in the function reads name. A register, which holds one value after
+        another, is also dead if the code just after the window overwrites it (or returns) before
+        reading it. Stores to variables that are overwritten later are left to the IR optimizer.
+        """
+        reads = self.reads[name]
+        for instruction in self.window:
+            reads -= instruction[READ_OPERANDS.get(instruction[0], NO_OPERANDS)].count(name)
+        if not reads:
+            return True
+        if not is_register(name):
+            return False
+        for instruction in islice(reversed(self.pending), self.LOOKAHEAD):
+            mnemonic = instruction[0]
+            if name in instruction[READ_OPERANDS.get(mnemonic, NO_OPERANDS)]:
+                return False
+            index = WRITTEN_OPERAND.get(mnemonic)
+            if index is not None and instruction[index] == name or mnemonic == 'RETURN':
+                return True
+            if mnemonic == LABEL or mnemonic in JUMP_TARGET:
+                return False  # another path may read it
+        return False
+
+class Tile:
+    """ An instruction-selection pattern: a window of IR opcodes and the assembly that implements it.
+
+    pattern holds the opcodes allowed at each position of the window. select(selector, window)
+    returns the window's code as parsed (mnemonic, *operands) tuples, or None if the tile
+    cannot implement this particular window. A tile costs what its code costs (see
+    InstructionSelector.cost), so tiles need no fixed prices.
+    """
+    __slots__ = ('name', 'pattern', 'select')
+
+    def __init__(self, name, pattern, select):
+        self.name = name
+        self.pattern = [frozenset(opcodes) for opcodes in pattern]
+        self.select = select
+
+def select_declare(selector, window):
+    instruction = window[0]
+    return [('declare', f"{selector.names[instruction.arg1]} {selector.names[instruction.dest]}")]
+
+def select_copy(selector, window):
+    instruction, registers = window[0], selector.registers
+    if instruction.arg1 in registers and registers.get(instruction.dest) == registers[instruction.arg1]:
+        return []  # Source and destination share a register
+    mnemonic = 'STORE' if instruction.arg1 in registers and instruction.dest not in registers else 'LOAD'
+    return [(mnemonic, selector.read(instruction.arg1), selector.read(instruction.dest))]
+
+def select_forwarded_copy(selector, window):
+    # "t = a; x = t" is "LOAD a, x" when nothing else reads t
+    first, second = window
+    if second.arg1 != first.dest or selector.kinds[first.dest] != SYM_TEMP or selector.uses[first.dest] != 1:
+        return None
+    return select_copy(selector, [Instruction(IR_COPY, second.dest, first.arg1)])
+
+def select_operation(selector, window):
+    instruction = window[0]
+    return selector.operation(instruction.opcode, instruction.dest, instruction.arg1, instruction.arg2)
+
+def select_swapped_operation(selector, window):
+    instruction = window[0]
+    return selector.operation(SWAPPED_OPERATORS[instruction.opcode], instruction.dest, instruction.arg2, instruction.arg1)
+
+def select_compare_branch(selector, window):
+    # "t = a < b; if t goto L" is "CMP a, b; IFLT L" when nothing else reads t
+    compare, branch = window
+    if branch.arg1 != compare.dest or selector.kinds[compare.dest] != SYM_TEMP or selector.uses[compare.dest] != 1:
+        return None
+    return [('CMP', selector.read(compare.arg1), selector.read(compare.arg2)),
+            (COMPARE_BRANCHES[compare.opcode], selector.names[branch.dest])]
+
+def select_branch(selector, window):
+    branch = window[0]
+    return [('CMP', selector.read(branch.arg1), '0'), ('IFNE', selector.names[branch.dest])]
+
+def select_constant_branch(selector, window):
+    branch = window[0]
+    if selector.kinds[branch.arg1] != SYM_CONSTANT:
+        return None
+    return [('GOTO', selector.names[branch.dest])] if selector.values[branch.arg1] else []
+
+def select_goto(selector, window):
+    return [('GOTO', selector.names[window[0].dest])]
+
+def select_return(selector, window):
+    return [('RETURN', selector.read(window[0].arg1))]
+
+def select_label(selector, window):
+    return [(LABEL, selector.names[window[0].dest])]
+
+# Every IR opcode has at least one tile that always applies
+SELECTION_TILES = [
+    Tile('declare', [(IR_DECLARE,)], select_declare),
+    Tile('copy', [(IR_COPY,)], select_copy),
+    Tile('forwarded-copy', [(IR_COPY,), (IR_COPY,)], select_forwarded_copy),
+    Tile('operation', [IR_OPERATOR], select_operation),
+    Tile('swapped-operation', [SWAPPED_OPERATORS], select_swapped_operation),
+    Tile('compare-branch', [COMPARE_BRANCHES, (IR_IF,)], select_compare_branch),
+    Tile('branch', [(IR_IF,)], select_branch),
+    Tile('constant-branch', [(IR_IF,)], select_constant_branch),
+    Tile('goto', [(IR_GOTO,)], select_goto),
+    Tile('return', [(IR_RETURN,)], select_return),
+    Tile('label', [(IR_LABEL,)], select_label),
+]
+
+class InstructionSelector:
+    """ Covers a function's IR with tiles so that the total cost of the code is least.
+
+    Tiles can span several IR instructions, and several can match at one place, so the cover
+    is chosen by dynamic programming from the last instruction back: the best cover of the
+    code from i on is the cheapest tile matching at i plus the best cover after that tile.
+    Ties go to the tile listed first. Operands are read through the register assignment, so
+    tiles see which values already sit in which register.
+    """
+    def __init__(self, ir_code, registers, scratch, tiles=None):
+        symbols = ir_code.symbols
+        self.instructions = list(ir_code)
+        self.names, self.kinds, self.values = symbols.names, symbols.kinds, symbols.values
+        self.registers = registers  # temp -> register name
+        self.scratch = scratch  # register for shuttling spilled temps, or None
+        self.uses = Counter(chain.from_iterable(map(instruction_uses, self.instructions)))
+        self.tiles = {}  # first opcode -> the tiles whose window may start with it
+        for tile in tiles if tiles is not None else SELECTION_TILES:
+            for opcode in tile.pattern[0]:
+                self.tiles.setdefault(opcode, []).append(tile)
+        self.chosen = Counter()  # tile name -> how many times the cover uses it
+        self.memory = {}  # operand -> whether it is a memory location rather than a register or constant
+
+    def read(self, symbol):
+        registers = self.registers
+        if symbol in registers:
+            return registers[symbol]
+        name = self.names[symbol]
+        return SPILL_PREFIX + name if self.kinds[symbol] == SYM_TEMP else name
+
+    def operation(self, opcode, dest, left, right):
+        """ dest = left <opcode> right as "OP Rd, right" on the register of dest, or None if that clobbers right. """
+        target = self.registers.get(dest, self.scratch)
+        source, operand = self.read(left), self.read(right)
+        if operand == target and source != target:
+            return None  # loading left into the register would overwrite right
+        code = [] if source == target else [('LOAD', source, target)]
+        code.append((ASSEMBLY_MNEMONICS[opcode], target, operand))
+        if dest not in self.registers:
+            code.append(('STORE', target, self.read(dest)))
+        return code
+
+    def cost(self, code):
+        """ One per instruction, plus one per operand it reads from or writes to memory. """
+        memory = self.memory
+        cost = len(code)
+        for instruction in code:
+            mnemonic = instruction[0]
+            index = WRITTEN_OPERAND.get(mnemonic)
+            for operand in instruction[READ_OPERANDS.get(mnemonic, NO_OPERANDS)] if index is None else (
+                    *instruction[READ_OPERANDS[mnemonic]], instruction[index]):
+                in_memory = memory.get(operand)
+                if in_memory is None:
+                    in_memory = memory[operand] = not is_register(operand) and not is_constant(operand)
+                cost += in_memory
+        return cost
+
+    def select(self):
+        """ The function's code as parsed assembly instructions. """
+        instructions, tiles, cost = self.instructions, self.tiles, self.cost
+        count = len(instructions)
+        best = [0] * (count + 1)  # cost of the best cover of instructions[i:]
+        choices = [None] * count  # (tile, size, code) that starts it
+        for position in range(count - 1, -1, -1):
+            least = None
+            for tile in tiles[instructions[position].opcode]:
+                size = len(tile.pattern)
+                window = instructions[position:position + size]
+                if size > 1 and (len(window) < size or any(
+                        instruction.opcode not in opcodes for instruction, opcodes in zip(window, tile.pattern))):
+                    continue
+                code = tile.select(self, window)
+                if code is None:
+                    continue
+                total = cost(code) + best[position + size]
+                if least is None or total < least:
+                    least, choices[position] = total, (tile, size, code)
+            best[position] = least
+        assembly, position = [], 0
+        while position < count:
+            tile, size, code = choices[position]
+            assembly.extend(code)
+            self.chosen[tile.name] += 1
+            position += size
+        return assembly
+
+def memory_accesses(instructions):
+    """ (loads, stores): how many operand reads and writes in parsed instructions go to memory. """
+    loads = stores = 0
+    for instruction in instructions:
+        loads += sum(not is_register(operand) and not is_constant(operand) for operand in assembly_reads(instruction))
+        target = assembly_write(instruction)
+        stores += target is not None and not is_register(target)
+    return loads, stores
+
+class AssemblyCodeGenerator:
+    def __init__(self, num_registers=4, peephole=True):
+        self.num_registers = num_registers
+        self.peephole = peephole  # run PeepholeOptimizer over each function's code
+        self.reports = []  # One register allocation report per generated function
+
+    def compute_live_intervals(self, ir_code):
+        """ Live interval of every temp, using block liveness so values live around jumps are covered. """
+        kinds = ir_code.symbols.kinds
+        cfg = ControlFlowGraph(list(ir_code))
+        live_out = cfg.solve_liveness()
+        intervals = {}
+
+        def extend(symbol, position):
+            if kinds[symbol] != SYM_TEMP:
+                return
+            interval = intervals.get(symbol)
+            if interval is None:
+                intervals[symbol] = LiveInterval(symbol, position, position)
+            elif position < interval.start:
+                interval.start = position
+            elif position > interval.end:
+                interval.end = position
+
+        position = len(ir_code)
+        for block, live in zip(reversed(cfg.blocks), reversed(live_out)):
+            block_end = position - 1
+            position -= len(block.instructions)
+            live = set(live)
+            for symbol in live:
+                extend(symbol, block_end)
+            for offset in range(len(block.instructions) - 1, -1, -1):
+                instruction = block.instructions[offset]
+                target = instruction_def(instruction)
+                if target is not None:
+                    extend(target, position + offset)
+                    live.discard(target)
+                for symbol in instruction_uses(instruction):
+                    extend(symbol, position + offset)
+                    live.add(symbol)
+            for symbol in live:
+                extend(symbol, position)
+        return sorted(intervals.values(), key=lambda interval: interval.start)
+
+    def linear_scan(self, intervals, num_registers, hints=None):
+        """ Assign registers by linear scan; returns (spilled intervals, peak number of live temps).
+
+        hints maps a temp to the operand whose register it may take over when that
+        operand's interval ends at the instruction defining the temp (t1 = t0 + x).
+        """
+        hints = hints or {}
+        free = list(range(num_registers - 1, -1, -1))
+        active = []  # Sorted by end position
+        spilled = []
+        max_pressure = 0
+        for interval in intervals:
+            interval.register = None
+            while active and active[0].end < interval.start:
+                free.append(active.pop(0).register)
+            hint = hints.get(interval.symbol)
+            dying = next((other for other in active
+                          if other.symbol == hint and other.end == interval.start), None)
+            if dying is not None:
+                active.remove(dying)
+            max_pressure = max(max_pressure, len(active) + 1)
+            if dying is not None:
+                interval.register = dying.register
+            elif free:
+                interval.register = free.pop()
+            elif active and active[-1].end > interval.end:
+                # Spill whichever live interval ends last
+                victim = active.pop()
+                interval.register, victim.register = victim.register, None
+                spilled.append(victim)
+            else:
+                spilled.append(interval)
+                continue
+            index = len(active)
+            while index and active[index - 1].end > interval.end:
+                index -= 1
+            active.insert(index, interval)
+        return spilled, max_pressure
+
+    def generate_assembly(self, ir_code):
+        kinds = ir_code.symbols.kinds
+
+        intervals = self.compute_live_intervals(ir_code)
+        hints = {}
+        for instruction in ir_code:
+            if instruction_def(instruction) is None:
+                continue
+            if kinds[instruction.arg1] == SYM_TEMP:
+                hints[instruction.dest] = instruction.arg1
+            elif instruction.opcode in SWAPPED_OPERATORS and kinds[instruction.arg2] == SYM_TEMP:
+                hints[instruction.dest] = instruction.arg2  # the operands are swapped to compute it in place
+        spilled, max_pressure = self.linear_scan(intervals, self.num_registers, hints)
+        scratch = None
+        if spilled:
+            # Keep the last register free for shuttling spilled temps through memory
+            scratch = register_name(self.num_registers - 1)
+            spilled, max_pressure = self.linear_scan(intervals, self.num_registers - 1, hints)
+        registers = {interval.symbol: register_name(interval.register)
+                     for interval in intervals if interval.register is not None}
+
+        selector = InstructionSelector(ir_code, registers, scratch)
+        code = selector.select()
+
+        rewrites = {}
+        if self.peephole:
+            optimizer = PeepholeOptimizer()
+            code = optimizer.optimize_instructions(code)
+            rewrites = dict(optimizer.fired)
+        loads, stores = memory_accesses(code)
+        self.reports.append({
+            'function': ir_code.name,
+            'registers': self.num_registers,
+            'registers_used': len(set(registers.values())) + (scratch is not None),
+            'max_pressure': max_pressure,
+            'spilled': len(spilled),
+            'loads': loads,
+            'stores': stores,
+            'peephole': rewrites,
+            'tiles': dict(selector.chosen),
+        })
+        return list(map(format_assembly, code))
@@ -0,0 +1,329 @@
+""" Generated benchmark programs and the per-stage benchmark suite. """
+import os
+import sys
+import json
+import random
+import tracemalloc
+import argparse
+import statistics
+import subprocess
+import time
+
+from .lexer import lex, lex_stream
+from .regex_lexer import lex_regex
+from .syntax import Parser, count_nodes
+from .semantic import SemanticAnalyzer
+from .ir import IntermediateCodeGenerator
+from .translator import SyntaxDirectedTranslator
+from .optimizer import OptimizedIntermediateCodeGenerator
+from .backend import AssemblyCodeGenerator
+from .vm import VirtualMachine
+from .instrumentation import Instrumentation
+from .incremental import IncrementalDocument
+
+def generate_program(statements=1000, depth=0, chain=4, declarations=10, nesting=0, seed=0, functions=1, loops=0):
+    """ Generate a semantically valid MiniLang program of a chosen shape.
+
+    declarations int variables are declared up front, then at least `statements` statements
+    follow: plain assignments whose right-hand side chains `chain` operands together, or,
+    with depth > 0, if/else nests `depth` levels deep with an assignment on every level.
+    With nesting > 0, each right-hand side is wrapped in `nesting` levels of parentheses,
+    one operand and operator per level: a - (b + (c - ...)).
+    With loops > 0, the statements come as while loops that count a variable i up to loops;
+    each body assigns a chain that no iteration changes (for loop-invariant code motion),
+    adds i times a constant to a running total (for strength reduction) and steps i.
+    Chains use only + and -: every value is a known constant, and the optimizer folds
+    with Python ints, so repeated multiplication would grow numbers without bound.
+    With functions > 1 the statements are shared out between that many functions, main, f1,
+    f2, ..., each declaring the variables afresh: one module for the per-function pool.
+    """
+    rng = random.Random(seed)
+    names = [f"v{index}" for index in range(max(declarations, 1))]
+
+    def operand():
+        return rng.choice(names) if rng.random() < 0.6 else str(rng.randrange(1, 100))
+
+    def expression(length):
+        parts = [operand()]
+        for _ in range(length - 1):
+            parts.append(rng.choice('+-'))
+            parts.append(operand())
+        return ' '.join(parts)
+
+    def invariant_loop():
+        target, total = rng.sample(names, 2) if len(names) > 1 else (names[0], names[0])
+        others = [name for name in names if name not in (target, total)]
+        parts = [rng.choice(others) if others and rng.random() < 0.6 else str(rng.randrange(1, 100))
+                 for _ in range(chain)]
+        invariant = parts[0] + ''.join(f" {rng.choice('+-')} {part}" for part in parts[1:])
+        return ["i = 0;", f"while (i < {loops}) {{", f"{target} = {invariant};",
+                f"{total} = {total} + i * {rng.randrange(2, 10)};", "i = i + 1;", "}"]
+
+    def assignment():
+        if not nesting:
+            return f"{rng.choice(names)} = {expression(chain)};"
+        prefix = ''.join(f"{operand()} {rng.choice('+-')} (" for _ in range(nesting))
+        return f"{rng.choice(names)} = {prefix}{expression(chain)}{')' * nesting};"
+
+    lines = []
+    functions = max(functions, 1)
+    for function in range(functions):
+        lines.append(f"function {f'f{function}' if function else 'main'}() {{")
+        lines.extend(f"int {name} = {rng.randrange(100)};" for name in names)
+        if loops:
+            lines.append("int i = 0;")
+        emitted = 0
+        while emitted < -(-statements // functions):
+            if loops:
+                lines.extend(invariant_loop())
+                emitted += 5  # the loop, its three statements and the reset of i
+            elif depth:
+                # Each level is one if statement plus an assignment in its then and else branches
+                for _ in range(depth):
+                    lines.append(f"if ({rng.choice(names)} < {expression(chain)}) {{")
+                    lines.append(assignment())
+                for _ in range(depth):
+                    lines.append("} else {")
+                    lines.append(assignment())
+                    lines.append("}")
+                emitted += 3 * depth
+            else:
+                lines.append(assignment())
+                emitted += 1
+        lines.append(f"return {names[0]};")
+        lines.append("}")
+    return '\n'.join(lines) + '\n'
+
+# Suite shapes at --scale 1; statements and declarations are multiplied by the scale
+BENCHMARK_CASES = {
+    'straight_line': {'statements': 20000, 'chain': 4, 'declarations': 50},
+    'nested_if': {'statements': 1500, 'depth': 50, 'chain': 2, 'declarations': 20},
+    'long_chains': {'statements': 200, 'chain': 250, 'declarations': 50},
+    'deep_expressions': {'statements': 20, 'chain': 4, 'nesting': 2500, 'declarations': 50},
+    'declarations': {'statements': 2000, 'chain': 2, 'declarations': 20000},
+    'loops': {'statements': 1000, 'chain': 4, 'declarations': 50, 'loops': 100},
+}
+
+BENCHMARK_STAGES = ('lex', 'lex_regex', 'parse', 'semantic', 'ir', 'fused', 'optimize', 'codegen')
+
+def benchmark_stages(code, instrumentation):
+    """ Run each stage once on code under instrumentation; returns the work each stage processed.
+
+    Code generation runs on the unoptimized IR: the generated programs are all constants, so the
+    optimized IR is a handful of instructions and would not exercise register allocation.
+    """
+    stage = instrumentation.stage
+    with stage('lex'):
+        tokens = lex(code, [])
+    with stage('lex_regex'):
+        lex_regex(code, [])
+    with stage('parse'):
+        ast = Parser(tokens).parse_program()
+    with stage('semantic'):
+        SemanticAnalyzer().analyze(ast)
+    with stage('ir'):
+        ir_code = IntermediateCodeGenerator().generate_ir(ast)
+    with stage('fused'):
+        # lex through ir in one SyntaxDirectedTranslator pass
+        SyntaxDirectedTranslator(lex_stream(code, errors=[])).parse_program()
+    with stage('optimize'):
+        optimized = OptimizedIntermediateCodeGenerator().optimize_ir(ir_code)
+    with stage('codegen'):
+        assembly = AssemblyCodeGenerator().generate_assembly(ir_code)
+    nodes = count_nodes(ast)
+    # What each stage's throughput is measured in
+    return {'lex': (len(code), 'bytes'), 'lex_regex': (len(code), 'bytes'), 'parse': (len(tokens), 'tokens'), 'semantic': (nodes, 'nodes'),
+            'ir': (nodes, 'nodes'), 'fused': (len(code), 'bytes'), 'optimize': (len(ir_code), 'instructions'),
+            'codegen': (len(ir_code), 'instructions')}, len(optimized), len(assembly)
+
+def peak_memory(code):
+    """ Peak bytes allocated (tracemalloc) while each stage runs, holding its input but not earlier garbage. """
+    peaks = {}
+    tracemalloc.start()
+    try:
+        def measured(name, function, *args):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            result = function(*args)
+            peaks[name] = tracemalloc.get_traced_memory()[1] - base
+            return result
+        measured('fused', lambda: SyntaxDirectedTranslator(lex_stream(code, errors=[])).parse_program())
+        tokens = measured('lex', lex, code, [])
+        ast = measured('parse', lambda: Parser(tokens).parse_program())
+        measured('semantic', lambda: SemanticAnalyzer().analyze(ast))
+        ir_code = measured('ir', lambda: IntermediateCodeGenerator().generate_ir(ast))
+        measured('optimize', lambda: OptimizedIntermediateCodeGenerator().optimize_ir(ir_code))
+        measured('codegen', lambda: AssemblyCodeGenerator().generate_assembly(ir_code))
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def executed_instructions(code):
+    """ IR instructions the VM executes running code, before and after optimization. """
+    ir_code = IntermediateCodeGenerator().generate_ir(Parser(lex(code)).parse_program())
+    vm = VirtualMachine()
+    executed = {}
+    for name, version in (('ir', ir_code), ('optimized', OptimizedIntermediateCodeGenerator().optimize_ir(ir_code))):
+        vm.run(vm.load_ir(version))
+        executed[name] = vm.steps
+    return executed
+
+def run_benchmarks(cases, scale=1.0, repeat=3, memory=True):
+    """ Time every stage on each generated case (best of repeat runs) and optionally measure peak memory. """
+    results = {}
+    for name, shape in cases.items():
+        shape = dict(shape)
+        for key in ('statements', 'declarations'):
+            if key in shape:
+                shape[key] = max(1, int(shape[key] * scale))
+        code = generate_program(**shape)
+        case = {'shape': shape, 'bytes': len(code), 'stages': {}}
+        try:
+            best = {}
+            for _ in range(repeat):
+                instrumentation = Instrumentation()
+                work, case['optimized_instructions'], case['assembly_instructions'] = benchmark_stages(
+                    code, instrumentation)
+                for stage, timing in instrumentation.stages.items():
+                    if stage not in best or timing['wall'] < best[stage]['wall']:
+                        best[stage] = timing
+            for stage in BENCHMARK_STAGES:
+                amount, unit = work[stage]
+                seconds = best[stage]['wall']
+                case['stages'][stage] = {'seconds': seconds, 'cpu': best[stage]['cpu'],
+                                         'throughput': amount / seconds if seconds else float('inf'),
+                                         'unit': f"{unit}/s"}
+            if memory:
+                for stage, peak in peak_memory(code).items():
+                    case['stages'][stage]['peak_bytes'] = peak
+            if shape.get('loops'):
+                # What loop-invariant code motion and strength reduction save at run time
+                case['executed'] = executed_instructions(code)
+        except RecursionError:
+            case['error'] = "RecursionError: program too deeply nested for the recursive stages"
+        results[name] = case
+    return results
+
+def compare_benchmarks(results, baseline, tolerance=0.15):
+    """ List the stages that got slower (or hungrier) than the baseline by more than tolerance. """
+    regressions = []
+    for name, case in results.items():
+        reference = baseline.get(name)
+        if not reference or case.get('error') or reference.get('error') or reference['shape'] != case['shape']:
+            continue
+        for stage, current in case['stages'].items():
+            previous = reference['stages'].get(stage)
+            if not previous:
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                if metric in current and metric in previous and current[metric] > previous[metric] * (1 + tolerance):
+                    regressions.append((name, stage, metric, previous[metric], current[metric]))
+    return regressions
+
+def print_benchmarks(results, regressions=()):
+    flagged = {(name, stage) for name, stage, *_ in regressions}
+    for name, case in results.items():
+        print(f"{name}: {case['bytes'] / 1024:.0f} KiB, {case['shape']}")
+        if case.get('error'):
+            print(f"    {case['error']}")
+            continue
+        for stage, timing in case['stages'].items():
+            peak = f"{timing['peak_bytes'] / (1 << 20):8.1f} MiB peak" if 'peak_bytes' in timing else ''
+            mark = '  REGRESSION' if (name, stage) in flagged else ''
+            print(f"    {stage:<9} {timing['seconds'] * 1000:9.1f} ms  "
+                  f"{timing['throughput']:12,.0f} {timing['unit']:<15}{peak}{mark}")
+        if 'executed' in case:
+            executed = case['executed']
+            print(f"    VM: {executed['ir']:,} IR instructions executed, {executed['optimized']:,} once optimized")
+        if 'lex_regex' in case['stages'] and case['stages']['lex']['seconds']:
+            speedup = case['stages']['lex_regex']['seconds'] / case['stages']['lex']['seconds']
+            print(f"    DFA scanner: {speedup:.1f}x the regex lexer")
+    for name, stage, metric, previous, current in regressions:
+        print(f"Regression in {name}/{stage}: {metric} {previous:.4g} -> {current:.4g} "
+              f"(+{(current / previous - 1) * 100:.0f}%)")
+
+# What a short-lived tool imports: the lazy package, a front-end stage, the server client, everything
+IMPORT_TIMED_MODULES = ('minilang', 'minilang.lexer', 'minilang.syntax', 'minilang.client', 'minilang.driver',
+                        'minilang.server')
+IMPORT_TIMER = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+def import_times(modules=IMPORT_TIMED_MODULES, repeat=5):
+    """ Best-of-repeat seconds each module takes to import, each run in a fresh interpreter. """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (root, os.environ.get('PYTHONPATH')))))
+    times = {}
+    for module in modules:
+        command = [sys.executable, '-c', IMPORT_TIMER.format(module=module)]
+        times[module] = min(float(subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout)
+                            for _ in range(repeat))
+    return times
+
+def incremental_times(sizes=(1000, 10000, 100000), edits=200, seed=0):
+    """ Build time and median edit latency of an IncrementalDocument per program size in statements.
+
+    Each edit changes one digit somewhere in the program, which keeps its shape: with the work
+    per edit independent of the file, the latency should stay flat as the size grows.
+    """
+    times = {}
+    for size in sizes:
+        code = generate_program(size, declarations=10, seed=seed)
+        start = time.perf_counter()
+        document = IncrementalDocument(code)
+        build = time.perf_counter() - start
+        digits = [offset for offset, char in enumerate(code) if char.isdigit()]
+        rng = random.Random(seed)
+        latencies = []
+        for _ in range(edits):
+            start = time.perf_counter()
+            document.edit(rng.choice(digits), 1, str(rng.randint(1, 9)))
+            latencies.append(time.perf_counter() - start)
+        times[size] = {'build': build, 'edit': statistics.median(latencies)}
+    return times
+
+def benchmark_main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark each compiler stage on generated MiniLang programs.")
+    parser.add_argument('--cases', default=','.join(BENCHMARK_CASES),
+                        help="comma-separated cases to run (default: all)")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply statement and declaration counts")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case; the fastest is kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak-memory pass")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="stored results to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown before flagging (0.15 = 15%%)")
+    parser.add_argument('--imports', action='store_true', help="time importing the package's modules instead")
+    parser.add_argument('--incremental', action='store_true',
+                        help="time IncrementalDocument builds and edits at growing sizes instead")
+    args = parser.parse_args(argv)
+
+    if args.incremental:
+        sizes = [max(1, int(size * args.scale)) for size in (1000, 10000, 100000)]
+        times = incremental_times(sizes)
+        smallest = times[sizes[0]]
+        for size, timing in times.items():
+            # Growth against the smallest size: linear builds track the size, flat edits stay near 1x
+            print(f"    {size:>9,} statements  build {timing['build'] * 1000:9.1f} ms "
+                  f"({timing['build'] / smallest['build']:6.1f}x)  edit {timing['edit'] * 1000:6.2f} ms "
+                  f"({timing['edit'] / smallest['edit']:4.1f}x)")
+        return 0
+
+    if args.imports:
+        for module, seconds in import_times(repeat=args.repeat).items():
+            print(f"    {module:<18} {seconds * 1000:7.1f} ms")
+        return 0
+
+    names = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARK_CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    results = run_benchmarks({name: BENCHMARK_CASES[name] for name in names}, args.scale,
+                             args.repeat, not args.no_memory)
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_benchmarks(results, json.load(f), args.tolerance)
+    print_benchmarks(results, regressions)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    return 1 if regressions else 0
@@ -0,0 +1,140 @@
+""" The on-disk and in-memory caches of per-stage artifacts. """
+import os
+import zlib
+import pickle
+import struct
+import hashlib
+
+COMPILER_VERSION = 11  # bump whenever a stage's output changes so stale cache entries stop matching
+
+CACHE_MAGIC = b'MLC'
+CACHE_STAGES = ('tokens', 'ast', 'ir', 'assembly')
+CACHE_HEADER = struct.Struct('<3sBBI')  # magic, format version, stage index, uncompressed payload size
+
+class CompilationCache:
+    """ Content-addressed on-disk cache of per-stage artifacts with least-recently-used eviction.
+
+    An entry's key hashes the source text, the compiler version, the stage name and the options that
+    stage depends on, so a changed file or flag simply misses. Entries are zlib-compressed pickles
+    behind a small header, and a hit refreshes the file's mtime, which is the LRU clock.
+    """
+    def __init__(self, directory, max_bytes=64 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.entries())
+        self.hits = dict.fromkeys(CACHE_STAGES, 0)
+        self.misses = dict.fromkeys(CACHE_STAGES, 0)
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    @staticmethod
+    def stage_options(stage, optimize, num_registers):
+        """ The options each stage's output depends on; earlier stages ignore later flags. """
+        if stage == 'ir':
+            return (optimize,)
+        if stage == 'assembly':
+            return (optimize, num_registers)
+        return ()
+
+    def key(self, source_hash, stage, options=()):
+        text = f"{source_hash}:{COMPILER_VERSION}:{stage}:{options!r}"
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def entries(self):
+        """ Yield (path, size, mtime) for every entry currently on disk. """
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def get(self, key, stage):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            magic, version, stage_index, size = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC or version != COMPILER_VERSION or CACHE_STAGES[stage_index] != stage:
+                raise ValueError("stale cache entry")
+            value = pickle.loads(zlib.decompress(data[CACHE_HEADER.size:]))
+            os.utime(path)
+        except (OSError, ValueError, IndexError, struct.error, zlib.error, pickle.UnpicklingError, EOFError):
+            self.misses[stage] += 1
+            return None
+        self.hits[stage] += 1
+        self.bytes_saved += size
+        return value
+
+    def put(self, key, stage, value):
+        try:
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # pickle recurses once per AST level; trees too deep for it are simply not cached
+            return
+        data = CACHE_HEADER.pack(CACHE_MAGIC, COMPILER_VERSION, CACHE_STAGES.index(stage), len(payload))
+        data += zlib.compress(payload, 1)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)  # atomic, so concurrent readers never see half an entry
+        self.total_bytes += len(data)
+        if self.total_bytes > self.max_bytes:
+            self.evict(self.max_bytes * 9 // 10)  # leave headroom so the next puts don't rescan the directory
+
+    def evict(self, target=None):
+        """ Delete least recently used entries until the cache fits in target (default max_bytes). """
+        target = self.max_bytes if target is None else target
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': dict(self.hits), 'misses': dict(self.misses),
+                'bytes_saved': self.bytes_saved, 'evictions': self.evictions}
+
+class MemoryCache(CompilationCache):
+    """ A CompilationCache held in process memory, for long-lived workers such as the compile server's.
+
+    Artifacts are kept as the objects themselves, so a hit costs no unpickling. The limit counts
+    entries rather than bytes, and a dict in least-recently-used order does the bookkeeping.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.artifacts = {}
+        self.hits = dict.fromkeys(CACHE_STAGES, 0)
+        self.misses = dict.fromkeys(CACHE_STAGES, 0)
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def get(self, key, stage):
+        value = self.artifacts.pop(key, None)
+        if value is None:
+            self.misses[stage] += 1
+            return None
+        self.artifacts[key] = value  # move to the most recently used end
+        self.hits[stage] += 1
+        return value
+
+    def put(self, key, stage, value):
+        self.artifacts[key] = value
+        while len(self.artifacts) > self.max_entries:
+            del self.artifacts[next(iter(self.artifacts))]
+            self.evictions += 1
@@ -0,0 +1,36 @@
+""" The command line: `python -m minilang`. Each mode imports only the modules it needs. """
+import os
+import sys
+import glob
+
+def expand_inputs(patterns):
+    """ Expand paths and glob patterns (including '**') into a sorted, de-duplicated file list. """
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        paths.extend(match for match in matches if not os.path.isdir(match))
+    return sorted(set(paths))
+
+def main(argv=None):
+    """ Dispatch on the first argument: a server, client, load-test or benchmark mode, a batch of
+    files to compile, or, with no arguments, the stage-by-stage example. """
+    argv = sys.argv[1:] if argv is None else argv
+    mode, rest = argv[:1], argv[1:]
+    if mode == ['--benchmark']:
+        from .benchmark import benchmark_main
+        return benchmark_main(rest)
+    if mode == ['--serve']:
+        from .server import serve_main
+        return serve_main(rest)
+    if mode == ['--client']:
+        from .client import client_main
+        return client_main(rest)
+    if mode == ['--load-test']:
+        from .server import load_test_main
+        return load_test_main(rest)
+    if argv:
+        from .driver import compile_main
+        return compile_main(argv)
+    from .example import run_example
+    run_example()
+    return 0
@@ -0,0 +1,54 @@
+""" The compile server's wire protocol and a blocking client for short-lived tools. """
+import json
+import socket
+import argparse
+
+from .cli import expand_inputs
+
+SERVER_OUTPUTS = ('tokens', 'ast', 'ir', 'assembly', 'diagnostics')
+SERVER_LINE_LIMIT = 64 << 20  # longest request or reply line, which bounds the largest source accepted
+
+def compile_remote(path, requests):
+    """ Send request dicts, each with its own 'id', to a CompileServer; returns the replies by id.
+
+    This client blocks and does not use asyncio, so a tool that sends one batch starts fast. Every
+    request is sent before any reply is read, and the server compiles them concurrently.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(b''.join(json.dumps(request).encode('utf-8', 'surrogatepass') + b'\n'
+                                    for request in requests))
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile('rb') as replies:
+            return {reply['id']: reply for reply in map(json.loads, replies)}
+
+def client_main(argv):
+    parser = argparse.ArgumentParser(description="Compile files through a running compile server.")
+    parser.add_argument('socket', help="path of the server's Unix socket")
+    parser.add_argument('inputs', nargs='+', help="source files or glob patterns (quote '**' patterns)")
+    parser.add_argument('--emit', default='assembly',
+                        help=f"comma-separated outputs to return: {', '.join(SERVER_OUTPUTS)}")
+    parser.add_argument('--registers', type=int, default=4, help="physical registers for allocation")
+    parser.add_argument('--no-optimize', action='store_true', help="skip the IR optimizer")
+    parser.add_argument('--fused', action='store_true', help="use the single-pass front end")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no input files matched")
+    emit = [output.strip() for output in args.emit.split(',') if output.strip()]
+    options = {'optimize': not args.no_optimize, 'registers': args.registers, 'fused': args.fused}
+
+    requests = []
+    for request_id, path in enumerate(paths):
+        with open(path, encoding='utf-8') as f:
+            requests.append({'id': request_id, 'source': f.read(), 'emit': emit, **options})
+    replies = compile_remote(args.socket, requests)
+
+    failed = False
+    for request_id, path in enumerate(paths):
+        reply = replies[request_id]
+        reply['path'] = path
+        failed |= reply['failed']
+        print(json.dumps(reply))  # one JSON reply per line, in input order
+    return 1 if failed else 0
@@ -0,0 +1,449 @@
+""" Compiling sources and batches of files, and the batch command line. """
+import os
+import json
+import time
+import argparse
+import multiprocessing
+import hashlib
+
+from .lexer import Diagnostic, SourceMap, lex, lex_stream
+from .syntax import Parser, count_nodes
+from .semantic import SemanticAnalyzer
+from .ir import IntermediateCodeGenerator
+from .translator import SyntaxDirectedTranslator
+from .optimizer import OptimizedIntermediateCodeGenerator
+from .backend import AssemblyCodeGenerator
+from .objfile import ObjectWriter
+from .instrumentation import Instrumentation, stderr_trace
+from .cache import CACHE_STAGES, CompilationCache, MemoryCache
+from .cli import expand_inputs
+
+def compile_source(code, optimize=True, num_registers=4, cache=None, instrumentation=None, diagnostics=None,
+                   fused=False, until='assembly', pool=None):
+    """ Run every stage on one source string. Returns the IR and assembly text plus any diagnostics.
+
+    A source is a module of one or more functions. Once it is parsed, each function goes through
+    the remaining stages on its own, as a compile_function() job. pool, if given, is anything with
+    an order-preserving map(), such as a multiprocessing.Pool, and runs the jobs in parallel; the
+    results are merged in source order either way, and timings lists each function's stage times.
+    With a cache, the deepest cached stage is loaded and only the stages after it are run.
+    Stage timings and counters go to instrumentation; diagnostics, if given, holds the errors
+    found so far even when a later stage raises. fused replaces lexing, parsing, semantic
+    analysis and IR generation with one SyntaxDirectedTranslator pass over lex_stream(); its
+    IR and diagnostics are the same, so it shares cache entries from the IR stage on. until
+    stops after an earlier stage in CACHE_STAGES and returns that stage's artifact instead.
+    """
+    instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+    stage, traced = instrumentation.stage, instrumentation.traced
+    diagnostics = diagnostics if diagnostics is not None else []
+    keys = {}
+    if cache is not None:
+        source_hash = hashlib.blake2b(code.encode('utf-8', 'surrogatepass')).hexdigest()
+        keys = {name: cache.key(source_hash, name, cache.stage_options(name, optimize, num_registers))
+                for name in CACHE_STAGES}
+
+    def load(name):
+        if cache is None:
+            return None
+        with stage('cache'):
+            return cache.get(keys[name], name)
+
+    def store(name, value):
+        if cache is not None:
+            with stage('cache'):
+                cache.put(keys[name], name, value)
+        return value
+
+    def translate():
+        errors = []
+        translator = traced(SyntaxDirectedTranslator)(lex_stream(code, errors=errors))
+        with stage('translate'):
+            try:
+                functions = translator.parse_module()
+            finally:
+                tokens = translator.finish()
+                diagnostics[:] = errors
+        if functions is None:
+            raise SyntaxError("Program must start with a 'function' keyword")
+        return functions, {'errors': errors + translator.analyzer.errors,
+                           'counters': {'tokens': tokens, 'functions': len(functions)}}
+
+    # Resume from the deepest cached stage; the fused front end leaves no tokens or AST to resume from
+    fused = fused and until in ('ir', 'assembly')
+    stages = CACHE_STAGES[CACHE_STAGES.index('ir') if fused else 0:CACHE_STAGES.index(until) + 1]
+    found = value = None
+    for name in reversed(stages):
+        value = load(name)
+        if value is not None:
+            found = name
+            break
+    if found is None and not fused:
+        errors = []
+        with stage('lex'):
+            tokens = lex(code, errors)
+        found, value = 'tokens', store('tokens', {'tokens': tokens, 'errors': errors})
+    if value is not None:
+        diagnostics[:] = value['errors']  # each artifact carries every error found up to its stage
+
+    timings = []
+    if found != until:
+        if found == 'tokens':
+            with stage('parse'):
+                module = traced(Parser)(value['tokens']).parse_module()
+            if module is None:
+                raise SyntaxError("Program must start with a 'function' keyword")
+            with stage('semantic'):
+                errors = traced(SemanticAnalyzer)().check_functions(
+                    [(function.name, function.token) for function in module.functions])
+            front_end = {'ast': module, 'errors': value['errors'] + errors,
+                         'counters': {'tokens': len(value['tokens']), 'ast_nodes': count_nodes(module),
+                                      'functions': len(module.functions)}}
+            functions, first = module.functions, 'semantic'
+        elif found == 'ast':
+            front_end, functions, first = value, value['ast'].functions, 'ir'
+        elif found == 'ir':
+            front_end, functions, first = value, value['ir'], 'codegen'
+        else:
+            functions, front_end = translate()
+            first = 'optimize'
+
+        jobs = [(function, first, until, optimize, num_registers, instrumentation.trace) for function in functions]
+        outputs = run_functions(jobs, pool)
+        errors = front_end['errors'] + [error for output in outputs for error in output.get('errors', ())]
+        diagnostics[:] = errors
+        for output in outputs:
+            instrumentation.merge(output['timing'])
+            timings.append({'function': output['name'], 'seconds': output['seconds'],
+                            'stages': output['timing']['stages']})
+        for output in outputs:
+            if 'failure' in output:
+                raise output['failure']
+
+        counters = dict(front_end['counters'])
+        value = front_end
+        if first == 'semantic':
+            value = store('ast', dict(front_end, errors=errors))
+        if first == 'codegen':
+            ir_codes = value['ir']
+        elif until != 'ast':
+            ir_codes = [output['ir'] for output in outputs]
+            counters.update(ir_instructions=sum(output['ir_instructions'] for output in outputs),
+                            ir_instructions_optimized=sum(len(ir_code) for ir_code in ir_codes))
+            value = store('ir', {'ir': ir_codes, 'errors': errors, 'counters': counters})
+        if until == 'assembly':
+            reports = [output['registers'] for output in outputs]
+            listings = [(output['name'], output['assembly']) for output in outputs]
+            counters.update(assembly_instructions=sum(len(assembly) for _, assembly in listings),
+                            registers_allocated=sum(report['registers_used'] for report in reports),
+                            spilled=sum(report['spilled'] for report in reports),
+                            peephole_rewrites=sum(sum(report['peephole'].values()) for report in reports))
+            value = store('assembly', {
+                'errors': errors, 'ir': module_listing([(ir_code.name, ir_code.to_text()) for ir_code in ir_codes]),
+                'assembly': module_listing(listings), 'functions': listings, 'registers': reports,
+                'counters': counters})
+
+    result = dict(value, timings=timings)
+    if until == 'tokens':
+        result['counters'] = {'tokens': len(result['tokens'])}
+    for name, amount in result['counters'].items():
+        instrumentation.count(name, amount)
+    if until != 'tokens':
+        result['tokens'] = result['counters']['tokens']
+    return result
+
+FUNCTION_STAGES = ('semantic', 'ir', 'optimize', 'codegen')
+
+def compile_function(job):
+    """ Pool worker: run one function through the stages from first on, as far as until needs.
+
+    A (function, first, until, optimize, num_registers, trace) job carries the function's
+    Program when first is 'semantic' or 'ir', its IRCode when first is 'optimize', and its
+    optimized IRCode when first is 'codegen'. Returns what the stages produced with the
+    function's own timings; a failure is returned too, so the caller still gets every other
+    function's diagnostics before raising it.
+    """
+    function, first, until, optimize, num_registers, trace = job
+    start = time.perf_counter()
+    instrumentation = Instrumentation(trace)
+    stage, traced = instrumentation.stage, instrumentation.traced
+    output = {'name': function.name}
+    run = FUNCTION_STAGES.index(first)
+    try:
+        if run == 0:
+            with stage('semantic'):
+                output['errors'] = traced(SemanticAnalyzer)().analyze(function)
+        if until != 'ast' and run <= 2:
+            if run <= 1:
+                with stage('ir'):
+                    function = traced(IntermediateCodeGenerator)().generate_ir(function)
+            output['ir_instructions'] = len(function)
+            if optimize:
+                with stage('optimize'):
+                    function = traced(OptimizedIntermediateCodeGenerator)().optimize_ir(function)
+            output['ir'] = function
+        if until == 'assembly':
+            with stage('codegen'):
+                assembly_generator = traced(AssemblyCodeGenerator)(num_registers)
+                output['assembly'] = assembly_generator.generate_assembly(function)
+            output['registers'] = assembly_generator.reports[0]
+    except Exception as error:  # raised by compile_source once every function has reported
+        output['failure'] = error
+    output['timing'] = instrumentation.report()
+    output['seconds'] = time.perf_counter() - start
+    return output
+
+def run_functions(jobs, pool=None):
+    """ compile_function() over jobs, in order: in this process, or spread over pool if there are several. """
+    if pool is None or len(jobs) < 2:
+        return [compile_function(job) for job in jobs]
+    chunksize = max(1, len(jobs) // ((os.cpu_count() or 1) * 4))
+    return list(pool.map(compile_function, jobs, chunksize=chunksize))
+
+def module_listing(functions):
+    """ One IR or assembly listing for a module from (name, lines) pairs.
+
+    A lone function's lines are the whole listing; with several, each function's lines
+    follow a 'function name()' header, in source order.
+    """
+    if len(functions) == 1:
+        return list(functions[0][1])
+    listing = []
+    for name, lines in functions:
+        listing.append(f"function {name}()")
+        listing.extend(lines)
+    return listing
+
+WORKER_CACHES = {}  # one CompilationCache per cache directory (or MemoryCache size) in each worker process
+
+def worker_cache(options):
+    if options.get('cache_dir'):
+        key = (options['cache_dir'], options['cache_size'])
+        if key not in WORKER_CACHES:
+            WORKER_CACHES[key] = CompilationCache(*key)
+        return WORKER_CACHES[key]
+    if options.get('cache_entries'):
+        key = (None, options['cache_entries'])
+        if key not in WORKER_CACHES:
+            WORKER_CACHES[key] = MemoryCache(options['cache_entries'])
+        return WORKER_CACHES[key]
+    return None
+
+def compile_file(job, pool=None):
+    """ Pool worker: compile one (index, path, options) job, turning failures into a per-file error.
+
+    pool, when the file is compiled in the parent process instead, spreads its functions over workers.
+    """
+    index, path, options = job
+    start = time.perf_counter()
+    result = {'index': index, 'path': path, 'bytes': 0, 'errors': [], 'failed': False, 'timings': []}
+    cache = worker_cache(options)
+    before = cache.stats() if cache else None
+    instrumentation = Instrumentation(stderr_trace if options.get('trace') else None)
+    diagnostics = []
+    code = None
+    try:
+        with instrumentation.stage('read'):
+            with open(path, encoding='utf-8') as f:
+                code = f.read()
+        result['bytes'] = len(code)
+        result.update(compile_source(code, options['optimize'], options['registers'], cache,
+                                     instrumentation, diagnostics, options.get('fused', False), pool=pool))
+    except Exception as error:  # a compiler bug on one file must not abort the batch
+        result['failed'] = True
+        result['errors'] = diagnostics + [failure_diagnostic(error)]
+    if result['errors'] and code is not None:
+        source_map = SourceMap(code)
+        result['errors'] = [source_map.render(error) for error in result['errors']]
+    if cache:
+        result['cache'] = cache_delta(before, cache.stats())
+    result['report'] = instrumentation.report()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def failure_diagnostic(error):
+    """ The error that stopped a compilation, keeping the position of a Diagnostic it carries. """
+    cause = error.args[0] if error.args else None
+    failure = f"{type(error).__name__}: {error}"
+    if isinstance(cause, Diagnostic):
+        failure = Diagnostic(failure, cause.token, cause.offset)
+    return failure
+
+def cache_delta(before, after):
+    """ What one job added to a worker's running cache counters. """
+    return {'hits': {stage: after['hits'][stage] - before['hits'][stage] for stage in CACHE_STAGES},
+            'misses': {stage: after['misses'][stage] - before['misses'][stage] for stage in CACHE_STAGES},
+            'bytes_saved': after['bytes_saved'] - before['bytes_saved'],
+            'evictions': after['evictions'] - before['evictions']}
+
+def merge_cache_stats(results):
+    totals = {'hits': dict.fromkeys(CACHE_STAGES, 0), 'misses': dict.fromkeys(CACHE_STAGES, 0),
+              'bytes_saved': 0, 'evictions': 0}
+    for result in results:
+        stats = result.get('cache')
+        if not stats:
+            continue
+        for stage in CACHE_STAGES:
+            totals['hits'][stage] += stats['hits'][stage]
+            totals['misses'][stage] += stats['misses'][stage]
+        totals['bytes_saved'] += stats['bytes_saved']
+        totals['evictions'] += stats['evictions']
+    return totals
+
+EMIT_KINDS = ('asm', 'ir', 'obj')  # the outputs write_outputs() can write
+
+def write_outputs(results, output_dir, emit, root):
+    """ Write each file's requested outputs with one write call per output file. """
+    for result in results:
+        if result['failed']:
+            continue
+        relative = os.path.relpath(result['path'], root) if root else os.path.basename(result['path'])
+        target = os.path.join(output_dir, os.path.splitext(relative)[0])
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        for kind in emit:
+            if kind == 'obj':
+                writer = ObjectWriter()
+                for name, assembly in result['functions']:
+                    writer.add_function(name, assembly)
+                writer.write(f"{target}.mlo")
+                continue
+            with open(f"{target}.{kind}", 'w', encoding='utf-8') as f:
+                f.write('\n'.join(result['ir' if kind == 'ir' else 'assembly']) + '\n')
+
+def compile_batch(paths, output_dir=None, emit=('asm',), workers=None, chunksize=None,
+                  optimize=True, num_registers=4, flush_every=256, cache_dir=None, cache_size=64 << 20,
+                  trace=False, fused=False):
+    """ Compile many files on a process pool, sending work in chunks and writing outputs in batches.
+
+    With fewer files than workers, the files are compiled one at a time in this process instead,
+    each with its functions spread over the pool, so that a single large module uses every worker.
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(paths) // (workers * 4))
+    options = {'optimize': optimize, 'registers': num_registers, 'cache_dir': cache_dir, 'cache_size': cache_size,
+               'trace': trace, 'fused': fused}
+    jobs = [(index, path, options) for index, path in enumerate(paths)]
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else None
+    paths_for_output = [os.path.abspath(path) for path in paths]
+
+    results = []
+    pending = []
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        if len(paths) < workers:
+            compiled = (compile_file(job, pool) for job in jobs)
+        else:
+            compiled = pool.imap_unordered(compile_file, jobs, chunksize)
+        for result in compiled:
+            result['path'] = paths_for_output[result['index']]
+            results.append(result)
+            if output_dir:
+                pending.append(result)
+                if len(pending) >= flush_every:
+                    write_outputs(pending, output_dir, emit, root)
+                    pending = []
+    if output_dir and pending:
+        write_outputs(pending, output_dir, emit, root)
+    elapsed = time.perf_counter() - start
+    if cache_dir:
+        CompilationCache(cache_dir, cache_size).evict()  # workers' size estimates drift; settle it once here
+
+    results.sort(key=lambda result: result['index'])
+    for result, path in zip(results, paths):
+        result['path'] = path
+    total_bytes = sum(result['bytes'] for result in results)
+    totals = Instrumentation()
+    for result in results:
+        totals.merge(result['report'])
+    summary = {
+        'files': len(results),
+        'failed': sum(result['failed'] for result in results),
+        'with_errors': sum(bool(result['errors']) for result in results),
+        'bytes': total_bytes,
+        'seconds': elapsed,
+        'files_per_second': len(results) / elapsed if elapsed else 0.0,
+        'bytes_per_second': total_bytes / elapsed if elapsed else 0.0,
+        'workers': workers,
+        'chunksize': chunksize,
+        'cache': merge_cache_stats(results) if cache_dir else None,
+        'report': totals.report(),
+    }
+    return results, summary
+
+def print_batch_summary(results, summary):
+    for result in results:
+        if result['errors']:
+            status = 'FAILED' if result['failed'] else f"{len(result['errors'])} error(s)"
+            print(f"{result['path']}: {status}")
+            for error in result['errors']:
+                print(f"    {error}")
+    print(f"\nCompiled {summary['files']} file(s) with {summary['workers']} worker(s) "
+          f"(chunks of {summary['chunksize']}): {summary['failed']} failed, "
+          f"{summary['with_errors']} with diagnostics")
+    print(f"{summary['bytes']} bytes in {summary['seconds']:.3f}s: "
+          f"{summary['files_per_second']:.1f} files/s, {summary['bytes_per_second'] / 1024:.1f} KiB/s")
+    report = summary['report']
+    if report['stages']:
+        print("Stage times (summed over files):")
+        for name, timing in report['stages'].items():
+            print(f"    {name:<9} {timing['wall'] * 1000:9.1f} ms wall {timing['cpu'] * 1000:9.1f} ms cpu")
+        print("Counters: " + ', '.join(f"{name} {value}" for name, value in report['counters'].items()))
+    timings = sorted(((timing['seconds'], result['path'], timing['function'])
+                      for result in results for timing in result['timings']), reverse=True)
+    if len(timings) > len(results):  # some file held several functions
+        print("Slowest functions:")
+        for seconds, path, name in timings[:5]:
+            print(f"    {seconds * 1000:9.1f} ms  {path}: {name}")
+    cache = summary.get('cache')
+    if cache:
+        per_stage = ', '.join(f"{stage} {cache['hits'][stage]}/{cache['hits'][stage] + cache['misses'][stage]}"
+                              for stage in CACHE_STAGES)
+        print(f"Cache: {sum(cache['hits'].values())} hit(s), {sum(cache['misses'].values())} miss(es) "
+              f"({per_stage}); {cache['bytes_saved'] / 1024:.1f} KiB of artifacts reused, "
+              f"{cache['evictions']} evicted")
+
+def write_report(path, results, summary):
+    """ One JSON object per line: a record per compilation, then the batch totals. """
+    with open(path, 'w', encoding='utf-8') as f:
+        for result in results:
+            record = {'path': result['path'], 'bytes': result['bytes'], 'failed': result['failed'],
+                      'errors': len(result['errors']), 'seconds': result['seconds'], 'functions': result['timings'],
+                      **result['report']}
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+        totals = {key: value for key, value in summary.items() if key != 'report'}
+        f.write(json.dumps({'summary': totals, **summary['report']}, sort_keys=True) + '\n')
+
+def compile_main(argv):
+    parser = argparse.ArgumentParser(description="Compile MiniLang files in parallel.")
+    parser.add_argument('inputs', nargs='+', help="source files or glob patterns (quote '**' patterns)")
+    parser.add_argument('-o', '--output-dir', help="directory for the generated .asm/.ir/.mlo files")
+    parser.add_argument('--emit', default='asm', help="comma-separated outputs to write: asm, ir, obj")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=None, help="files sent to a worker at a time")
+    parser.add_argument('--registers', type=int, default=4, help="physical registers for allocation (at least 2)")
+    parser.add_argument('--no-optimize', action='store_true', help="skip the IR optimizer")
+    parser.add_argument('--fused', action='store_true',
+                        help="translate straight to IR in one pass, without building an AST")
+    parser.add_argument('--cache-dir', help="reuse stage outputs cached in this directory")
+    parser.add_argument('--cache-size', type=int, default=64, help="cache size limit in MiB (default: 64)")
+    parser.add_argument('--report', help="write a JSON-lines timing and counter report to this file")
+    parser.add_argument('--trace', action='store_true', help="trace every parse/visit/generate call on stderr")
+    args = parser.parse_args(argv)
+
+    if args.registers < 2:
+        parser.error("--registers must be at least 2")  # one for values and one for shuttling spills
+    emit = [kind.strip() for kind in args.emit.split(',') if kind.strip()]
+    unknown = [kind for kind in emit if kind not in EMIT_KINDS]
+    if unknown or not emit:
+        parser.error(f"--emit must list outputs from {', '.join(EMIT_KINDS)}")
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no input files matched")
+    results, summary = compile_batch(paths, args.output_dir, emit, args.jobs, args.chunksize,
+                                     not args.no_optimize, args.registers,
+                                     cache_dir=args.cache_dir, cache_size=args.cache_size << 20,
+                                     trace=args.trace, fused=args.fused)
+    print_batch_summary(results, summary)
+    if args.report:
+        write_report(args.report, results, summary)
+    return 1 if summary['failed'] else 0
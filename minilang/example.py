@@ -0,0 +1,73 @@
+""" The example program the pipeline walks through stage by stage. """
+import json
+
+from .lexer import SourceMap, lex
+from .syntax import Parser
+from .semantic import SemanticAnalyzer
+from .optimizer import OptimizedIntermediateCodeGenerator
+from .backend import AssemblyCodeGenerator
+from .vm import VirtualMachine, check_equivalence
+
+def run_example():
+    # Example input
+    code = '''
+    function main() {
+        int x = 5;
+        if (x > 10) {
+            return x + 1;
+        } else {
+            return x - 1;
+        }
+    }
+    '''
+
+    # Tokenization
+    tokens = lex(code)
+    print("Tokens:", tokens)
+
+    # Parsing
+    parser = Parser(tokens)
+    ast = parser.parse_program()
+    print("AST:", json.dumps(ast.to_dict(), indent=4))
+
+    # Semantic Analysis
+    semantic_analyzer = SemanticAnalyzer()
+    errors = semantic_analyzer.analyze(ast)
+
+    if errors:
+        print("\nSemantic Errors:")
+        source_map = SourceMap(code)
+        for error in errors:
+            print(source_map.render(error))
+    else:
+        print("\nNo Semantic Errors: Program is valid!")
+
+    # Stage 4: Intermediate Code Generation
+    ir_generator = OptimizedIntermediateCodeGenerator()
+    ir_code = ir_generator.generate_ir(ast)
+
+    print("\nOptimized Intermediate Code:")
+    for line in ir_code.to_text():
+        print(line)
+
+    # Stage 5: Assembly-like Code Generation
+    assembly_generator = AssemblyCodeGenerator()
+    assembly_code = assembly_generator.generate_assembly(ir_code)
+
+    print("\nGenerated Assembly Code:")
+    for line in assembly_code:
+        print(line)
+
+    print("\nRegister Allocation:")
+    for report in assembly_generator.reports:
+        print(f"{report['function']}: {report['registers_used']}/{report['registers']} registers used, "
+              f"pressure {report['max_pressure']}, {report['spilled']} spilled, "
+              f"{report['loads']} loads, {report['stores']} stores, "
+              f"{sum(report['peephole'].values())} peephole rewrites")
+
+    # Stage 7: Execution
+    vm = VirtualMachine()
+    result = vm.run(vm.load_assembly(assembly_code))
+    print("\nExecution Result:", result)
+    matches, outcomes = check_equivalence(ast)
+    print("Optimized and unoptimized code agree:" if matches else "MISMATCH between optimized and unoptimized code:", outcomes)
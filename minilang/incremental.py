@@ -0,0 +1,710 @@
+""" Incremental compilation of one document under text edits. """
+import operator
+from bisect import bisect_left
+from itertools import accumulate
+
+from .lexer import Diagnostic, SourceMap, token_scanner
+from .syntax import (AssignmentStatement, DeclarationStatement, Identifier, IfStatement, Module, Operator, Parser,
+                     Program, ReturnStatement, WhileStatement)
+from .semantic import SemanticAnalyzer, storage_name
+from .ir import IRCode, IR_GOTO, IR_IF, Instruction, IntermediateCodeGenerator
+
+class StatementSpan:
+    """ One statement's place in the token stream plus what incremental compilation cached for it.
+
+    Positions are relative: a span knows only how many tokens it covers, and gaps holds the
+    token counts around its nested blocks (an if's header, '} else {' and closing brace), so
+    an edit updates just the spans on the path down to it. ir holds one instruction list per gap.
+    The token indices in the node's diagnostics count from wherever its parse began; origin is
+    the span's first token in that same count.
+    """
+    __slots__ = ('node', 'length', 'gaps', 'blocks', 'origin', 'reads', 'declares', 'errors', 'ir',
+                 'parent', 'scope', 'depth', 'sizes', 'order')
+
+    def __init__(self, node, length, gaps, blocks, origin=0):
+        self.node = node
+        self.length = length
+        self.gaps = gaps
+        self.blocks = blocks  # one list of child StatementSpans per nested block
+        self.origin = origin
+        self.reads = ()
+        self.declares = None  # (name, type) for declarations
+        self.errors = []
+        self.ir = []
+        self.parent = None  # span of the enclosing statement (the root span for top-level statements)
+        self.scope = None   # the block list this span sits in
+        self.depth = -1     # scope depth: 0 for top-level statements
+        self.sizes = []     # PrefixSums of the child lengths, one per nested block
+        self.order = 0      # sort key that grows in source order; see IncrementalDocument.label
+
+    def enclosing_blocks(self):
+        """ The blocks this span sits in, innermost first: exactly the scopes it can see. """
+        blocks, span = [], self
+        while span.parent is not None:
+            blocks.append(span.scope)
+            span = span.parent
+        return blocks
+
+SPAN_LENGTH = operator.attrgetter('length')
+ORDER = operator.attrgetter('order')
+ORDER_GAP = 1 << 40  # room for 40 halvings before a run of insertions at one spot forces a relabel
+
+def fenwick(values):
+    """ A Fenwick tree (1-based) over values. """
+    tree = [0, *values]
+    for index in range(1, len(tree)):
+        parent = index + (index & -index)
+        if parent < len(tree):
+            tree[parent] += tree[index]
+    return tree
+
+def fenwick_add(tree, index, delta):
+    index += 1
+    while index < len(tree):
+        tree[index] += delta
+        index += index & -index
+
+def fenwick_prefix(tree, count):
+    """ The sum of the first count values. """
+    total = 0
+    while count:
+        total += tree[count]
+        count &= count - 1
+    return total
+
+def fenwick_search(tree, target):
+    """ How many leading values sum to less than target, and what target exceeds that sum by. """
+    position, step = 0, 1 << (len(tree) - 1).bit_length() >> 1
+    while step:
+        if position + step < len(tree) and tree[position + step] < target:
+            position += step
+            target -= tree[position]
+        step >>= 1
+    return position, target
+
+class PrefixSums:
+    """ A list of non-negative integers that supports splicing, prefix sums and searches in logarithmic time.
+
+    The values sit in chunks of about CHUNK, with Fenwick trees over the chunk sizes and
+    totals; a splice rewrites the chunks it touches and updates both trees in place unless
+    it needs more chunks than it replaced.
+    """
+    CHUNK = 256
+
+    def __init__(self, values=()):
+        values = list(values)
+        self.chunks = [values[i:i + self.CHUNK] for i in range(0, len(values), self.CHUNK)]
+        self.rebuild()
+
+    def rebuild(self):
+        self.chunks = [chunk for chunk in self.chunks if chunk] or [[]]
+        self.counts = fenwick(map(len, self.chunks))
+        self.totals = fenwick(map(sum, self.chunks))
+        self.length = sum(map(len, self.chunks))
+        self.total = sum(map(sum, self.chunks))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def locate(self, index):
+        """ The chunk holding values[index] (or the end, for index == len) and the index within it. """
+        if index >= self.length:
+            return len(self.chunks) - 1, len(self.chunks[-1])
+        chunk, within = fenwick_search(self.counts, index + 1)
+        return chunk, within - 1
+
+    def prefix(self, count):
+        """ sum(values[:count]) """
+        if count >= self.length:
+            return self.total
+        chunk, within = self.locate(count)
+        return fenwick_prefix(self.totals, chunk) + sum(self.chunks[chunk][:within])
+
+    def bisect(self, target):
+        """ How many leading values sum to less than target: bisect_left(list(accumulate(values)), target). """
+        if target <= 0:
+            return 0
+        if target > self.total:
+            return self.length
+        chunk, target = fenwick_search(self.totals, target)
+        count = fenwick_prefix(self.counts, chunk)
+        for value in self.chunks[chunk]:
+            target -= value
+            if target <= 0:
+                break
+            count += 1
+        return count
+
+    def add(self, index, delta):
+        """ values[index] += delta """
+        chunk, within = self.locate(index)
+        self.chunks[chunk][within] += delta
+        fenwick_add(self.totals, chunk, delta)
+        self.total += delta
+
+    def splice(self, first, last, values):
+        """ values[first:last] = new values """
+        first_chunk, first_within = self.locate(first)
+        last_chunk, last_within = self.locate(last)
+        chunks = self.chunks
+        old = chunks[first_chunk:last_chunk + 1]
+        merged = chunks[first_chunk][:first_within] + list(values) + chunks[last_chunk][last_within:]
+        if len(merged) <= 2 * self.CHUNK:
+            new = [merged]
+        else:
+            new = [merged[i:i + self.CHUNK] for i in range(0, len(merged), self.CHUNK)]
+        if len(new) > len(old):
+            chunks[first_chunk:last_chunk + 1] = new
+            self.rebuild()
+            return
+        new += [[] for _ in range(len(old) - len(new))]  # emptied chunks keep the trees' indices valid
+        for chunk, (before, after) in enumerate(zip(old, new), first_chunk):
+            fenwick_add(self.counts, chunk, len(after) - len(before))
+            fenwick_add(self.totals, chunk, sum(after) - sum(before))
+            chunks[chunk] = after
+        self.length += len(merged) - sum(map(len, old))
+        self.total += sum(merged) - sum(map(sum, old))
+
+def last_descendant(span):
+    """ The last span in preorder among span and everything nested in it. """
+    while True:
+        for block in reversed(span.blocks):
+            if block:
+                span = block[-1]
+                break
+        else:
+            return span
+
+def node_blocks(node):
+    """ The statement lists nested directly inside a node, in source order. """
+    if isinstance(node, Module):
+        return [node.functions]
+    if isinstance(node, Program):
+        return [node.statements]
+    if isinstance(node, IfStatement):
+        return [node.then, node.else_]
+    if isinstance(node, WhileStatement):
+        return [node.body]
+    return []
+
+def adopt(spans, parent, block):
+    """ Record parent, scope, depth and child sizes for spans (members of parent's block) and everything nested in them. """
+    pending = [(spans, parent, block)]
+    while pending:
+        spans, parent, block = pending.pop()
+        depth = parent.depth + 1
+        for span in spans:
+            span.parent, span.scope, span.depth = parent, block, depth
+            span.sizes = [PrefixSums(map(SPAN_LENGTH, child_block)) for child_block in span.blocks]
+            pending.extend((child_block, span, child_block) for child_block in span.blocks)
+
+def preorder(spans):
+    """ Yield spans and everything nested in them in source (and semantic analysis) order. """
+    stack = list(reversed(spans))
+    while stack:
+        span = stack.pop()
+        yield span
+        for block in reversed(span.blocks):
+            stack.extend(reversed(block))
+
+def statement_reads(node):
+    """ Names a statement looks up in the symbol table, not counting its nested statements. """
+    names = set()
+    if isinstance(node, DeclarationStatement):
+        pending = [node.value]
+    elif isinstance(node, (IfStatement, WhileStatement)):
+        pending = [node.condition]
+    elif isinstance(node, ReturnStatement):
+        pending = [node.expression]
+    elif isinstance(node, AssignmentStatement):
+        names.add(node.variable)
+        pending = [node.value]
+    else:
+        pending = []
+    while pending:
+        expression = pending.pop()
+        if isinstance(expression, Identifier):
+            names.add(expression.name)
+        elif isinstance(expression, Operator):
+            pending.append(expression.left)
+            pending.append(expression.right)
+    return names
+
+class SpanParser(Parser):
+    """ Parser that also records a StatementSpan for every function and statement it parses. """
+    def __init__(self, tokens):
+        super().__init__(tokens)
+        self.spans = []      # spans of the statements parsed so far in the current block
+        self.block_log = []  # (start, end, spans) of finished blocks not yet claimed by a statement
+
+    def parse_statements(self):
+        start, outer = self.pos, self.spans
+        self.spans = []
+        try:
+            statements = super().parse_statements()
+            self.block_log.append((start, self.pos, self.spans))
+        finally:
+            self.spans = outer
+        return statements
+
+    def parse_program(self):
+        start, mark = self.pos, len(self.block_log)
+        function = super().parse_program()
+        if function is not None:
+            self.spans.append(self.claim_blocks(function, start, mark))
+        return function
+
+    def parse_statement(self):
+        start, mark = self.pos, len(self.block_log)
+        statement = super().parse_statement()
+        if statement is not None:
+            self.spans.append(self.claim_blocks(statement, start, mark))
+        return statement
+
+    def claim_blocks(self, node, start, mark):
+        """ Build the span for a node that began at token start, taking the blocks logged since mark. """
+        blocks = self.block_log[mark:]
+        del self.block_log[mark:]
+        gaps, previous = [], start
+        for block_start, block_end, _ in blocks:
+            gaps.append(block_start - previous)
+            previous = block_end
+        gaps.append(self.pos - previous)
+        return StatementSpan(node, self.pos - start, gaps, [spans for _, _, spans in blocks], start)
+
+class StatementAnalyzer(SemanticAnalyzer):
+    """ Checks one statement at a time: the blocks of an if or while are checked as statements of their own. """
+    def visit_if_statement(self, node):
+        self.visit(node.condition)
+
+    def visit_while_statement(self, node):
+        self.visit(node.condition)
+
+class FragmentGenerator(IntermediateCodeGenerator):
+    """ Generates IR one statement at a time, leaving the blocks of an if or while to their own fragments. """
+    def fragment(self, node, storage):
+        """ IR for one statement, as one instruction list per gap around its nested blocks.
+
+        storage maps each name the statement uses or declares to the storage name of the
+        declaration it refers to, as IncrementalDocument resolved it.
+        """
+        self.storage = storage
+        self.available.clear()  # the statements around this one can change under it
+        self.readers.clear()
+        self.segments = []
+        self.ir_code.instructions = []
+        self.visit(node)
+        self.cut()
+        return self.segments
+
+    def cut(self):
+        self.segments.append(self.ir_code.instructions)
+        self.ir_code.instructions = []
+
+    def declare_variable(self, name, var_type):
+        return self.symbols.variable(self.storage[name])
+
+    def variable(self, name):
+        return self.symbols.variable(self.storage.get(name, name))
+
+    def visit_if_statement(self, node):
+        # Same code as IntermediateCodeGenerator.visit_if_statement, split where the branches go
+        condition = self.visit(node.condition)
+        true_label = self.generate_label()
+        false_label = self.generate_label()
+        emit = self.ir_code.emit
+        emit(IR_IF, true_label, condition)
+        emit(IR_GOTO, false_label)
+        self.start_block(true_label)
+        self.cut()
+        emit(IR_GOTO, false_label)
+        self.start_block(false_label)
+        self.cut()
+
+    def visit_while_statement(self, node):
+        # Same code as IntermediateCodeGenerator.visit_while_statement, split where the body goes
+        start_label = self.generate_label()
+        body_label = self.generate_label()
+        end_label = self.generate_label()
+        emit = self.ir_code.emit
+        self.start_block(start_label)
+        condition = self.visit(node.condition)
+        emit(IR_IF, body_label, condition)
+        emit(IR_GOTO, end_label)
+        self.start_block(body_label)
+        self.cut()
+        emit(IR_GOTO, start_label)
+        self.start_block(end_label)
+
+class IncrementalDocument:
+    """ Keeps one source file's tokens, AST, semantic errors and IR up to date under text edits.
+
+    The file is a module of one or more functions, as parse_module() reads it. Each function
+    is a span of the root, holding the statements of its body, and gets its own IR generator.
+
+    edit() relexes only the lines the edit touches and reparses only the statements in the
+    innermost enclosing block, stopping as soon as the new parse lines up with an old
+    statement boundary; untouched subtrees (and their AST nodes) are reused as they are. Only
+    the new statements are analyzed and lowered to IR, plus the later statements that read a
+    variable whose declaration changed. Temp and label numbers are never reused, so the IR
+    can differ in naming from a full rebuild but not in behaviour.
+    """
+    def __init__(self, code):
+        self.text = code
+        self.lexical_errors = []  # unrecognized symbols in the initial text
+        self.tokens, offsets = self.scan(0, len(code), self.lexical_errors)
+        self.advances = PrefixSums(offset - previous for offset, previous in zip(offsets, [0] + offsets[:-1]))
+        self.parse_all()
+
+    def scan(self, start, end, errors):
+        """ Tokens in text[start:end] with their start offsets; diagnostics are appended to errors. """
+        return token_scanner.tokenize(self.text, errors, start, end)
+
+    def parse_all(self):
+        """ Full parse, analysis and IR generation; the fallback when an edit changes the program's shape. """
+        self.ast = self.root = None
+        self.flat = []  # every function and statement span in source order, so also in order of span.order
+        self.readers = {}  # name -> spans that read it
+        self.declarations = {}  # name -> spans that declare it, in source order
+        self.generators = {}  # function span -> the FragmentGenerator lowering its statements
+        parser = SpanParser(self.tokens)
+        ast = parser.parse_module()
+        if ast is None:
+            raise SyntaxError("Program must start with a 'function' keyword")
+        functions = parser.spans
+        self.ast, self.root = ast, StatementSpan(ast, parser.pos, [0, 0], [functions])
+        self.root.depth = -2  # functions sit at depth -1, so their statements are at the top level, depth 0
+        self.root.ir = [[], []]
+        self.root.sizes = [PrefixSums(map(SPAN_LENGTH, functions))]
+        self.replace_statements([], functions, 0, self.root, functions)
+        # A function's header never changes without a full parse, so these errors stay with its span
+        by_token = {function.node.token: function for function in functions}
+        definitions = [(function.name, function.token) for function in ast.functions]
+        for error in SemanticAnalyzer().check_functions(definitions):
+            by_token[error.token].errors.append(error)
+        return len(self.flat)
+
+    def edit(self, offset, removed, inserted):
+        """ Replace text[offset:offset + removed] with inserted and bring every stage up to date.
+
+        Returns how many tokens were relexed and how many statements were reparsed and reanalyzed,
+        plus any unrecognized symbols in the relexed lines.
+        """
+        old = self.text
+        if not 0 <= offset <= offset + removed <= len(old):
+            raise ValueError(f"Edit {offset}+{removed} is outside the {len(old)}-character source")
+        line_start = old.rfind('\n', 0, offset) + 1
+        line_end = old.find('\n', offset + removed)
+        line_end = len(old) if line_end < 0 else line_end
+        shift = len(inserted) - removed
+        self.text = old[:offset] + inserted + old[offset + removed:]
+
+        # Relex whole lines: no token spans a newline, so line starts are safe restart points
+        first, last = self.advances.bisect(line_start), self.advances.bisect(line_end)
+        lexical_errors = []
+        tokens, offsets = self.scan(line_start, line_end + shift, lexical_errors)
+        previous = self.advances.prefix(first)
+        advances = [offset - before for offset, before in zip(offsets, [previous] + offsets[:-1])]
+        if last < len(self.advances):
+            advances.append(self.advances.prefix(last + 1) + shift - (offsets[-1] if offsets else previous))
+            last_advance = last + 1
+        else:
+            last_advance = last
+        self.advances.splice(first, last_advance, advances)
+        old_tokens = self.tokens[first:last]
+        self.tokens[first:last] = tokens
+
+        # Narrow the damage to the tokens that actually changed
+        prefix = 0
+        while prefix < min(len(old_tokens), len(tokens)) and old_tokens[prefix] == tokens[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(old_tokens), len(tokens)) - prefix
+               and old_tokens[-1 - suffix] == tokens[-1 - suffix]):
+            suffix += 1
+        damage_start, damage_end = first + prefix, last - suffix
+        delta = len(tokens) - len(old_tokens)
+        stats = {'relexed': len(tokens), 'reparsed': 0, 'reanalyzed': 0, 'lexical_errors': lexical_errors}
+        if damage_start == damage_end and delta == 0:
+            return stats  # whitespace-only edit
+        if self.root is None:
+            stats['reparsed'] = stats['reanalyzed'] = self.parse_all()
+            return stats
+        # One token of context either side catches insertions between statements and lookahead changes
+        stats.update(self.reparse(max(damage_start - 1, 0), damage_end + 1, delta))
+        return stats
+
+    def reparse(self, start, end, delta):
+        """ Reparse the smallest run of statements covering old tokens [start, end). """
+        root = self.root
+        path = []  # (span, block index, block start, first, last) from the root down
+        span, base = root, 0
+        if root.gaps[0] <= start and end <= root.length - root.gaps[-1]:
+            while True:
+                located = self.locate_block(span, base, start, end)
+                if located is None:
+                    break
+                index, position = located
+                sizes = span.sizes[index]
+                first = sizes.bisect(start - position + 1)
+                last = sizes.bisect(end - position)
+                path.append((span, index, position, first, last))
+                child = span.blocks[index][first]
+                if first != last or not child.blocks:
+                    break
+                span, base = child, position + sizes.prefix(first)
+        while path:
+            span, index, position, first, last = path.pop()
+            if span is root:
+                break  # an edit across function boundaries, or in a header, needs a full parse
+            counts = self.reparse_block(span, index, position, first, last, end, delta)
+            if counts is not None:
+                for ancestor, index, _, first, _ in path:
+                    ancestor.length += delta
+                    ancestor.sizes[index].add(first, delta)
+                return counts
+            # The edit changed the block's shape; retry with the enclosing statement as the damage
+        statements = self.parse_all()
+        return {'reparsed': statements, 'reanalyzed': statements}
+
+    def locate_block(self, span, base, start, end):
+        """ The nested block of span (starting at token base) that contains [start, end), with its first token. """
+        position = base
+        for index, sizes in enumerate(span.sizes):
+            position += span.gaps[index]
+            if position <= start and end <= position + sizes.total:
+                return index, position
+            position += sizes.total
+        return None
+
+    def reparse_block(self, span, index, block_start, first, last, end, delta):
+        """ Reparse from child first until the parse meets an old statement boundary at or after end. """
+        block, sizes = span.blocks[index], span.sizes[index]
+        start = block_start + sizes.prefix(first)
+        block_end = block_start + sizes.total + delta
+        tokens = self.tokens
+        parser = SpanParser(map(tokens.__getitem__, range(start, len(tokens))))
+        resync = last
+        bound = block_start + sizes.prefix(last + 1)  # where old child resync ends
+        try:
+            while True:
+                position = start + parser.pos
+                while resync < len(block) and bound + delta < position:
+                    resync += 1
+                    if resync < len(block):
+                        bound += block[resync].length
+                if resync < len(block) and bound >= end and bound + delta == position:
+                    break
+                kind = parser.current_kind()
+                if kind is None or kind == parser.DELIMITER or position > block_end:
+                    return None
+                if parser.parse_statement() is None:
+                    return None
+        except SyntaxError:
+            return None
+        new_spans = parser.spans
+        old_spans = block[first:resync + 1]
+        node_blocks(span.node)[index][first:resync + 1] = [child.node for child in new_spans]
+        block[first:resync + 1] = new_spans
+        sizes.splice(first, resync + 1, map(SPAN_LENGTH, new_spans))
+        span.length += delta
+        position = bisect_left(self.flat, old_spans[0].order, key=ORDER)
+        return self.replace_statements(old_spans, new_spans, position, span, block)
+
+    def replace_statements(self, old_spans, new_spans, position, owner, block):
+        """ Swap old spans (at flat index position, in owner's block) for new ones, then redo analysis and IR where needed. """
+        old_flat = list(preorder(old_spans))
+        new_flat = list(preorder(new_spans))
+        adopt(new_spans, owner, block)
+        self.flat[position:position + len(old_flat)] = new_flat
+        for span in old_flat:
+            for name in span.reads:
+                self.readers[name].discard(span)
+            if span.declares:
+                spans = self.declarations[span.declares[0]]
+                del spans[bisect_left(spans, span.order, key=ORDER)]
+        self.label(position, len(new_flat))
+        declared = {}
+        for span in new_flat:
+            span.reads = statement_reads(span.node)
+            for name in span.reads:
+                self.readers.setdefault(name, set()).add(span)
+            if isinstance(span.node, DeclarationStatement):
+                span.declares = (span.node.variable, span.node.var_type)
+                declared.setdefault(span.node.variable, []).append(span)
+        for name, spans in declared.items():
+            existing = self.declarations.setdefault(name, [])
+            found = bisect_left(existing, spans[0].order, key=ORDER)
+            existing[found:found] = spans
+        self.refresh(new_spans)
+
+        # A declaration directly in the block is visible to the rest of it, nested blocks included;
+        # those nested in the new statements end with them
+        old_final = dict(span.declares for span in old_spans if span.declares)
+        new_final = dict(span.declares for span in new_spans if span.declares)
+        changed = [name for name in old_final.keys() | new_final.keys() if old_final.get(name) != new_final.get(name)]
+        after = position + len(new_flat)
+        before = self.flat[after - 1].order if after else 0  # the rest of the block comes after this order
+        later = {}
+        if changed and block:
+            end = last_descendant(block[-1]).order
+            for name in changed:
+                for span in self.readers.get(name, ()):
+                    if before < span.order <= end:
+                        later[span.order] = span
+        for order in sorted(later):
+            span = later[order]
+            blocks = span.enclosing_blocks()
+            self.update(span, {name: self.binding(name, order, blocks) for name in span.reads})
+        return {'reparsed': len(new_flat), 'reanalyzed': len(new_flat) + len(later)}
+
+    def label(self, position, count):
+        """ Give the count spans at flat index position orders between their neighbours'.
+
+        Orders start ORDER_GAP apart, so a new run normally fits into the gap it lands in and
+        no other span changes; only when the gap is used up is every span relabelled.
+        """
+        flat = self.flat
+        low = flat[position - 1].order if position else 0
+        end = position + count
+        high = flat[end].order if end < len(flat) else low + (count + 1) * ORDER_GAP
+        step = (high - low) // (count + 1)
+        if step:
+            for index in range(position, end):
+                flat[index].order = low + (index - position + 1) * step
+        else:
+            for index, span in enumerate(flat, 1):
+                span.order = index * ORDER_GAP
+
+    def binding(self, name, order, blocks):
+        """ The declaration span name refers to from the span with the given order, given the blocks enclosing it. """
+        spans = self.declarations.get(name)
+        if not spans:
+            return None
+        for found in range(bisect_left(spans, order, key=ORDER) - 1, -1, -1):
+            declaration = spans[found]
+            if any(declaration.scope is block for block in blocks):
+                return declaration
+        return None
+
+    def refresh(self, spans):
+        """ Analyze and lower consecutive sibling spans, which already have their orders, and all nested spans.
+
+        Bindings are tracked while walking the run, scope by scope, so only names that reach
+        outside it are looked up in the declaration lists.
+        """
+        outer_blocks = spans[0].enclosing_blocks() if spans else []
+        outer = {}
+        visible, undo = {}, []
+        stack = [[iter(spans), None]]  # one entry per open block: its iterator and undo mark
+        while stack:
+            entry = stack[-1]
+            if entry[1] is None:
+                entry[1] = len(undo)
+            span = next(entry[0], None)
+            if span is None:
+                stack.pop()
+                while len(undo) > entry[1]:
+                    name, shadowed = undo.pop()
+                    if shadowed is None:
+                        del visible[name]
+                    else:
+                        visible[name] = shadowed
+                continue
+            bindings = {}
+            for name in span.reads:
+                if name in visible:
+                    bindings[name] = visible[name]
+                else:
+                    if name not in outer:
+                        outer[name] = self.binding(name, spans[0].order, outer_blocks)
+                    bindings[name] = outer[name]
+            self.update(span, bindings)
+            if span.declares:
+                name = span.declares[0]
+                undo.append((name, visible.get(name)))
+                visible[name] = span
+            stack.extend([iter(block), None] for block in reversed(span.blocks))
+
+    def update(self, span, bindings):
+        """ Semantic checks and IR for one statement, given the declaration span (or None) each name it reads refers to. """
+        if isinstance(span.node, Program):  # a function: only its statements have checks and IR
+            span.errors, span.ir = [], [[], []]
+            self.generators[span] = generator = FragmentGenerator()
+            generator.ir_code.name = span.node.name
+            return
+        function = span.parent
+        while function.depth >= 0:
+            function = function.parent
+        analyzer = StatementAnalyzer()
+        storage = {}
+        for name, declaration in bindings.items():
+            if declaration is None:
+                storage[name] = name
+            else:
+                analyzer.symbols.declare(name, declaration.declares[1])
+                storage[name] = storage_name(name, declaration.depth)
+        if span.declares:
+            storage[span.declares[0]] = storage_name(span.declares[0], span.depth)
+        analyzer.visit(span.node)
+        span.errors = analyzer.errors
+        span.ir = self.generators[function].fragment(span.node, storage)
+
+    @property
+    def errors(self):
+        """ Semantic errors, their token indices counted from the start of the file.
+
+        Functions defined more than once come first and the statements' errors follow in
+        source order, as SemanticAnalyzer.analyze() reports them for a module.
+        """
+        redefined, errors = [], []
+        for span, start in self.span_starts():
+            found = redefined if isinstance(span.node, Program) else errors
+            found.extend(error if error.token is None else Diagnostic(error, error.token - span.origin + start)
+                         for error in span.errors)
+        return redefined + errors
+
+    def span_starts(self):
+        """ Yield every span, the root included, in source order with the index of its first token. """
+        stack = [(self.root, 0)] if self.root is not None else []
+        while stack:
+            span, position = stack.pop()
+            yield span, position
+            children = []
+            for gap, block in zip(span.gaps, span.blocks):
+                position += gap
+                for child in block:
+                    children.append((child, position))
+                    position += child.length
+            stack.extend(reversed(children))
+
+    def source_map(self):
+        """ A SourceMap of the current text that resolves token indices without rescanning it. """
+        return SourceMap(self.text, list(accumulate(self.advances)))
+
+    def ir_codes(self):
+        """ One IRCode per function in source order, each stitched together from its statements' fragments. """
+        ir_codes = []
+        for function in self.root.blocks[0]:
+            instructions = []
+            stack = [(function, 0)]
+            while stack:
+                span, segment = stack.pop()
+                instructions.extend(Instruction(i.opcode, i.dest, i.arg1, i.arg2) for i in span.ir[segment])
+                if segment < len(span.blocks):
+                    stack.append((span, segment + 1))
+                    stack.extend((child, 0) for child in reversed(span.blocks[segment]))
+            generator = self.generators[function]
+            ir_codes.append(IRCode(generator.symbols, instructions, generator.ir_code.name))
+        return ir_codes
+
+    def ir_code(self):
+        """ The IR of a document holding a single function; see ir_codes() for modules. """
+        ir_codes = self.ir_codes()
+        if len(ir_codes) != 1:
+            raise ValueError(f"The document defines {len(ir_codes)} functions; ir_codes() lowers each of them")
+        return ir_codes[0]
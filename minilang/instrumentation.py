@@ -0,0 +1,95 @@
+""" Stage timers, counters and tracing hooks. """
+import sys
+import json
+import time
+import contextlib
+
+TRACED_PREFIXES = ('parse_', 'visit_', 'generate_', 'optimize_')
+
+def traced_class(cls, hook):
+    """ Subclass of cls whose parse_*, visit_*, generate_* and optimize_* methods report to hook.
+
+    hook(event, name, data) gets ('enter', method name, args) before each call and
+    ('exit', method name, result) after it. The original class is left alone, so code that
+    does not ask for tracing runs exactly as before.
+    """
+    def wrap(name, method):
+        def traced_method(self, *args, **kwargs):
+            hook('enter', name, args)
+            result = method(self, *args, **kwargs)
+            hook('exit', name, result)
+            return result
+        traced_method.__name__ = name
+        return traced_method
+
+    namespace = {name: wrap(name, getattr(cls, name)) for name in dir(cls)
+                 if name.startswith(TRACED_PREFIXES) and callable(getattr(cls, name))}
+    return type(f"Traced{cls.__name__}", (cls,), namespace)
+
+class Instrumentation:
+    """ Stage timers, counters and an optional trace hook for one compilation, reported as JSON.
+
+    stage(name) adds wall-clock and CPU time to a named stage; count() accumulates counters.
+    With a trace hook, stages report 'stage_start'/'stage_end' events and traced() returns
+    traced_class() versions of the stage classes; without one, traced() returns the classes
+    themselves, so tracing costs nothing when it is off.
+    """
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.stages = {}  # name -> {'wall': seconds, 'cpu': seconds, 'calls': n}
+        self.counters = {}
+        self.traced_classes = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace is not None:
+            self.trace('stage_start', name, None)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            timing['wall'] += time.perf_counter() - wall
+            timing['cpu'] += time.process_time() - cpu
+            timing['calls'] += 1
+            if self.trace is not None:
+                self.trace('stage_end', name, timing)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def traced(self, cls):
+        if self.trace is None:
+            return cls
+        if cls not in self.traced_classes:
+            self.traced_classes[cls] = traced_class(cls, self.trace)
+        return self.traced_classes[cls]
+
+    def merge(self, report):
+        """ Fold another compilation's report() into this one, e.g. to total a batch. """
+        for name, timing in report['stages'].items():
+            total = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            for key in total:
+                total[key] += timing[key]
+        for name, value in report['counters'].items():
+            self.count(name, value)
+
+    def report(self):
+        return {'stages': {name: dict(timing) for name, timing in self.stages.items()},
+                'counters': dict(self.counters),
+                'wall': sum(timing['wall'] for timing in self.stages.values()),
+                'cpu': sum(timing['cpu'] for timing in self.stages.values())}
+
+    def to_json(self):
+        return json.dumps(self.report(), sort_keys=True)
+
+def stderr_trace(event, name, data):
+    """ Trace hook for --trace: one line per event on stderr. """
+    if event == 'enter':
+        sys.stderr.write(f"> {name}\n")
+    elif event == 'exit':
+        sys.stderr.write(f"< {name}\n")
+    elif event == 'stage_end':
+        sys.stderr.write(f"= {name}: {data['wall'] * 1000:.3f} ms wall, {data['cpu'] * 1000:.3f} ms cpu\n")
+    else:
+        sys.stderr.write(f"[{name}]\n")
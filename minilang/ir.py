@@ -0,0 +1,307 @@
+""" Stage 4: the IR instruction set and the AST-walking IR generator. """
+from array import array
+
+from .syntax import NodeVisitor, Number, Operator, Program
+from .semantic import SymbolTable
+
+# IR opcodes. Binary operators get one opcode each, in token_patterns['OPERATOR'] order
+IR_DECLARE, IR_COPY, IR_IF, IR_GOTO, IR_LABEL, IR_RETURN = range(6)
+BINARY_OPERATORS = ('+', '-', '*', '/', '=', '<', '>', '!')
+IR_BINARY = {operator: 6 + index for index, operator in enumerate(BINARY_OPERATORS)}
+IR_OPERATOR = {opcode: operator for operator, opcode in IR_BINARY.items()}
+COMMUTATIVE = frozenset(IR_BINARY[operator] for operator in '+*=!')
+
+def divide(left, right):
+    """ Integer division truncating toward zero; None when dividing by zero. """
+    if right == 0:
+        return None
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+# Integer semantics of every binary opcode, shared by constant folding and execution
+BINARY_EVALUATORS = {
+    IR_BINARY['+']: lambda a, b: a + b,
+    IR_BINARY['-']: lambda a, b: a - b,
+    IR_BINARY['*']: lambda a, b: a * b,
+    IR_BINARY['/']: divide,
+    IR_BINARY['=']: lambda a, b: int(a == b),
+    IR_BINARY['<']: lambda a, b: int(a < b),
+    IR_BINARY['>']: lambda a, b: int(a > b),
+    IR_BINARY['!']: lambda a, b: int(a != b),
+}
+
+# Symbol kinds: every IR operand is an integer ID into an IRSymbols table
+SYM_VARIABLE, SYM_TEMP, SYM_CONSTANT, SYM_LABEL, SYM_TYPE = range(5)
+
+class IRSymbols:
+    """ Interns IR operand names to dense integer IDs, with kind and constant value kept in parallel arrays. """
+    def __init__(self):
+        self.names = []
+        self.kinds = array('B')
+        self.values = []  # int value for constants, None otherwise
+        self.ids = {}
+
+    def intern(self, name, kind):
+        key = (kind, name)
+        symbol = self.ids.get(key)
+        if symbol is None:
+            symbol = self.ids[key] = len(self.names)
+            self.names.append(name)
+            self.kinds.append(kind)
+            self.values.append(int(name) if kind == SYM_CONSTANT else None)
+        return symbol
+
+    def variable(self, name):
+        return self.intern(name, SYM_VARIABLE)
+
+    def temp(self, name):
+        return self.intern(name, SYM_TEMP)
+
+    def constant(self, value):
+        return self.intern(str(value), SYM_CONSTANT)
+
+    def label(self, name):
+        return self.intern(name, SYM_LABEL)
+
+    def type_name(self, name):
+        return self.intern(name, SYM_TYPE)
+
+    def is_constant(self, symbol):
+        return self.kinds[symbol] == SYM_CONSTANT
+
+    def __len__(self):
+        return len(self.names)
+
+class Instruction:
+    """ One IR quadruple: opcode plus up to three operand symbol IDs (None when unused).
+
+    dest is the assigned variable/temp, the declared variable, or the jump/label target.
+    """
+    __slots__ = ('opcode', 'dest', 'arg1', 'arg2')
+
+    def __init__(self, opcode, dest=None, arg1=None, arg2=None):
+        self.opcode = opcode
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __eq__(self, other):
+        return isinstance(other, Instruction) and (self.opcode, self.dest, self.arg1, self.arg2) == (
+            other.opcode, other.dest, other.arg1, other.arg2)
+
+    def __repr__(self):
+        return f"Instruction({self.opcode}, {self.dest}, {self.arg1}, {self.arg2})"
+
+class IRCode:
+    """ A list of Instructions plus the IRSymbols table their operands refer to. """
+    def __init__(self, symbols=None, instructions=None, name=None):
+        self.symbols = symbols if symbols is not None else IRSymbols()
+        self.instructions = instructions if instructions is not None else []
+        self.name = name  # Name of the function this code belongs to
+
+    def emit(self, opcode, dest=None, arg1=None, arg2=None):
+        self.instructions.append(Instruction(opcode, dest, arg1, arg2))
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __getitem__(self, index):
+        return self.instructions[index]
+
+    def format(self, instruction):
+        """ Render one instruction in the textual IR syntax (display only). """
+        names = self.symbols.names
+        opcode = instruction.opcode
+        if opcode == IR_DECLARE:
+            return f"declare {names[instruction.arg1]} {names[instruction.dest]}"
+        if opcode == IR_COPY:
+            return f"{names[instruction.dest]} = {names[instruction.arg1]}"
+        if opcode == IR_IF:
+            return f"if {names[instruction.arg1]} goto {names[instruction.dest]}"
+        if opcode == IR_GOTO:
+            return f"goto {names[instruction.dest]}"
+        if opcode == IR_LABEL:
+            return f"{names[instruction.dest]}:"
+        if opcode == IR_RETURN:
+            return f"return {names[instruction.arg1]}"
+        return (f"{names[instruction.dest]} = {names[instruction.arg1]} "
+                f"{IR_OPERATOR[opcode]} {names[instruction.arg2]}")
+
+    def to_text(self):
+        return [self.format(instruction) for instruction in self.instructions]
+
+class IntermediateCodeGenerator(NodeVisitor):
+    """ Lowers the AST to IR.
+
+    Expressions are lowered through a hash-consed DAG of the current basic block (local value
+    numbering): an operation on two constants is folded, and one already computed in the block
+    reuses the temp that holds it, until an assignment changes one of its operands. A label
+    starts a new block with an empty table.
+    """
+    def __init__(self):
+        self.temp_counter = 0
+        self.label_counter = 0
+        self.ir_code = IRCode()
+        self.symbols = self.ir_code.symbols
+        self.scopes = SymbolTable()  # which declaration, and so which storage, each name refers to
+        self.available = {}  # (opcode, left, right) -> the temp holding that value in the current block
+        self.readers = {}  # variable -> the keys in available that read it
+
+    def generate_temp(self):
+        temp_name = f"t{self.temp_counter}"
+        self.temp_counter += 1
+        return self.symbols.temp(temp_name)
+
+    def generate_label(self):
+        label = f"L{self.label_counter}"
+        self.label_counter += 1
+        return self.symbols.label(label)
+
+    def binary(self, operator, left, right):
+        """ Symbol holding left operator right: a folded constant, a temp that already holds it, or a new temp. """
+        opcode = IR_BINARY[operator]
+        kinds = self.symbols.kinds
+        left_kind, right_kind = kinds[left], kinds[right]
+        if left_kind == SYM_CONSTANT and right_kind == SYM_CONSTANT:
+            values = self.symbols.values
+            value = BINARY_EVALUATORS[opcode](values[left], values[right])
+            if value is not None:  # a division by zero is left to trap at run time
+                return self.symbols.constant(value)
+        key = (opcode, right, left) if right < left and opcode in COMMUTATIVE else (opcode, left, right)
+        available = self.available
+        temp = available.get(key)
+        if temp is None:
+            temp = available[key] = self.generate_temp()
+            self.ir_code.instructions.append(Instruction(opcode, temp, left, right))
+            readers = self.readers
+            if left_kind == SYM_VARIABLE:
+                if left in readers:
+                    readers[left].append(key)
+                else:
+                    readers[left] = [key]
+            if right_kind == SYM_VARIABLE and right != left:
+                if right in readers:
+                    readers[right].append(key)
+                else:
+                    readers[right] = [key]
+        return temp
+
+    def assign(self, variable, value):
+        """ Emit variable = value, forgetting the computations that read the old value of variable. """
+        for key in self.readers.pop(variable, ()):
+            self.available.pop(key, None)
+        self.ir_code.emit(IR_COPY, variable, value)
+
+    def start_block(self, label):
+        """ Emit label; control can arrive from elsewhere, so nothing computed before it is reused. """
+        self.available.clear()
+        self.readers.clear()
+        self.ir_code.emit(IR_LABEL, label)
+
+    def generate_ir(self, ast):
+        """ Generate intermediate code from the AST. """
+        if isinstance(ast, Program):
+            self.ir_code.name = ast.name
+            # Iterate over all statements in the program
+            for statement in ast.statements:
+                self.visit(statement)
+        return self.ir_code
+
+    def visit_statement(self, node):
+        """ Visit a statement node. """
+        self.visit(node)
+
+    def declare_variable(self, name, var_type):
+        """ IR symbol for the variable a declaration of name introduces in the current scope. """
+        return self.symbols.variable(self.scopes.storage(self.scopes.declare(name, var_type)))
+
+    def variable(self, name):
+        """ IR symbol for a use of name: the storage of the declaration in scope, or name itself if none is. """
+        symbol = self.scopes.lookup(name)
+        return self.symbols.variable(name if symbol is None else self.scopes.storage(symbol))
+
+    def visit_declaration_statement(self, node):
+        variable = self.declare_variable(node.variable, node.var_type)
+        self.ir_code.emit(IR_DECLARE, variable, self.symbols.type_name(node.var_type))
+        if isinstance(node.value, Number):
+            temp = self.generate_temp()
+            self.ir_code.emit(IR_COPY, temp, self.symbols.constant(node.value.value))
+            self.assign(variable, temp)
+        else:
+            self.assign(variable, self.visit(node.value))
+
+    def visit_if_statement(self, node):
+        condition = self.visit(node.condition)
+        true_label = self.generate_label()
+        false_label = self.generate_label()
+        emit = self.ir_code.emit
+        emit(IR_IF, true_label, condition)
+        emit(IR_GOTO, false_label)
+        self.start_block(true_label)
+        scopes = self.scopes
+        scopes.push_scope()
+        for stmt in node.then:
+            self.visit(stmt)
+        scopes.pop_scope()
+        emit(IR_GOTO, false_label)
+        self.start_block(false_label)
+        scopes.push_scope()
+        for stmt in node.else_:
+            self.visit(stmt)
+        scopes.pop_scope()
+
+    def visit_while_statement(self, node):
+        # The condition is tested at the top; the body ends with a back edge to it
+        start_label = self.generate_label()
+        body_label = self.generate_label()
+        end_label = self.generate_label()
+        emit = self.ir_code.emit
+        self.start_block(start_label)
+        condition = self.visit(node.condition)
+        emit(IR_IF, body_label, condition)
+        emit(IR_GOTO, end_label)
+        self.start_block(body_label)
+        self.scopes.push_scope()
+        for stmt in node.body:
+            self.visit(stmt)
+        self.scopes.pop_scope()
+        emit(IR_GOTO, start_label)
+        self.start_block(end_label)
+
+    def visit_return_statement(self, node):
+        expression = self.visit(node.expression)
+        self.ir_code.emit(IR_RETURN, None, expression)
+
+    def visit_assignment_statement(self, node):
+        value = self.visit(node.value)
+        self.assign(self.variable(node.variable), value)
+
+    def visit_expression(self, node):
+        """ Visit an expression node; returns the symbol ID holding its value. """
+        return self.visit(node)
+
+    def visit_identifier(self, node):
+        return self.variable(node.name)
+
+    def visit_number(self, node):
+        return self.symbols.constant(node.value)
+
+    def visit_operator(self, node):
+        # Post-order walk with an explicit stack; operations are lowered in the same
+        # order a recursive left-then-right walk would lower them
+        values, pending = [], [node]
+        while pending:
+            current = pending.pop()
+            if current.__class__ is Operator:
+                pending.append((current,))
+                pending.append(current.right)
+                pending.append(current.left)
+            elif current.__class__ is tuple:
+                right = values.pop()
+                values[-1] = self.binary(current[0].operator, values[-1], right)
+            else:
+                values.append(self.visit(current))
+        return values[0]
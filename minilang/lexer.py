@@ -0,0 +1,757 @@
+""" Stage 1: the generated DFA scanner, the streaming lexers and diagnostics with source positions. """
+import sys
+import operator
+import codecs
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, compress, repeat
+
+token_patterns = {
+    'KEYWORD': r'\b(if|else|while|function|return|input|output)\b',
+    'IDENTIFIER': r'\b[a-zA-Z_][a-zA-Z0-9_]*\b',
+    'NUMBER': r'\b\d+\b',
+    'OPERATOR': r'[+\-*/=<>!]',
+    'DELIMITER': r'[;(),{}]',
+    'WHITESPACE': r'\s+',
+    'COMMENT': r'//.*|/\*.*?\*/',
+    'MISMATCH': r'.',
+}
+
+# How a non-ASCII character can match the patterns: whether it is \d, \s and \w. Every digit is
+# a word character and no whitespace is, so these are the only combinations that occur.
+UNICODE_PROPERTIES = ((False, False, False), (False, False, True), (True, False, True), (False, True, False))
+ANY_CHARACTER = (frozenset(range(128)), frozenset(UNICODE_PROPERTIES))
+
+class PatternParser:
+    """ Parses the regular-expression subset token_patterns is written in.
+
+    Literals, escapes, character classes with ranges, '.', \\d \\s \\w \\b, groups, '|' and the
+    quantifiers * + ? (optionally lazy). Nodes are tuples: ('set', chars), ('boundary',),
+    ('cat', items), ('alt', branches) and (quantifier, item, lazy). A character set is a pair:
+    the ASCII codes it holds, and which UNICODE_PROPERTIES tuples it holds beyond ASCII.
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def parse(self):
+        node = self.parse_alternation()
+        if self.pos != len(self.pattern):
+            self.fail("unbalanced ')'")
+        return node
+
+    def fail(self, problem):
+        raise ValueError(f"Unsupported pattern {self.pattern!r}: {problem} at offset {self.pos}")
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def next(self):
+        char = self.peek()
+        if char is None:
+            self.fail("unexpected end")
+        self.pos += 1
+        return char
+
+    def parse_alternation(self):
+        branches = [self.parse_sequence()]
+        while self.peek() == '|':
+            self.pos += 1
+            branches.append(self.parse_sequence())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def parse_sequence(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            node = self.parse_atom()
+            while self.peek() in ('*', '+', '?'):
+                quantifier = {'*': 'star', '+': 'plus', '?': 'optional'}[self.next()]
+                lazy = self.peek() == '?'
+                self.pos += lazy
+                node = (quantifier, node, lazy)
+            items.append(node)
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def parse_atom(self):
+        char = self.next()
+        if char == '(':
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            node = self.parse_alternation()
+            if self.next() != ')':
+                self.fail("unclosed group")
+            return node
+        if char == '[':
+            return ('set', self.parse_class())
+        if char == '.':
+            return ('set', (ANY_CHARACTER[0] - {10}, ANY_CHARACTER[1]))
+        if char == '\\':
+            escape = self.next()
+            return ('boundary',) if escape == 'b' else ('set', self.escape(escape))
+        if char in '*+?{}[]^$':
+            self.fail(f"{char!r}")
+        return ('set', self.literal(char))
+
+    def literal(self, char):
+        if ord(char) > 127:
+            self.fail(f"non-ASCII literal {char!r}")
+        return frozenset([ord(char)]), frozenset()
+
+    def escape(self, escape):
+        if escape in 'dsw':
+            index = 'dsw'.index(escape)
+            test = (str.isdigit, str.isspace, lambda char: char.isalnum() or char == '_')[index]
+            codes = (code for code in range(128) if test(chr(code)))
+            return frozenset(codes), frozenset(props for props in UNICODE_PROPERTIES if props[index])
+        if escape.isalnum():
+            self.fail(f"escape \\{escape}")
+        return self.literal(escape)
+
+    def parse_class(self):
+        negated = self.peek() == '^'
+        self.pos += negated
+        codes, props = set(), set()
+        while True:
+            char = self.next()
+            if char == ']' and (codes or props):
+                break
+            if char == '\\':
+                char = self.next()
+                if char in 'dsw':
+                    more_codes, more_props = self.escape(char)
+                    codes |= more_codes
+                    props |= more_props
+                    continue
+            if self.peek() == '-' and self.pattern[self.pos + 1:self.pos + 2] not in ('', ']'):
+                self.pos += 1
+                last = self.next()
+                if last == '\\':
+                    last = self.next()
+                codes.update(range(ord(char), ord(last) + 1))
+            else:
+                codes.add(ord(char))
+        if max(codes, default=0) > 127:
+            self.fail("non-ASCII class member")
+        if negated:
+            return ANY_CHARACTER[0] - codes, ANY_CHARACTER[1] - props
+        return frozenset(codes), frozenset(props)
+
+def pattern_words(node):
+    """ The strings a repetition-free pattern of literals matches, e.g. the keywords of KEYWORD. """
+    kind = node[0]
+    if kind == 'boundary':
+        return ['']
+    if kind == 'set' and len(node[1][0]) == 1 and not node[1][1]:
+        return [chr(*node[1][0])]
+    if kind == 'alt':
+        return [word for branch in node[1] for word in pattern_words(branch)]
+    if kind == 'cat':
+        words = ['']
+        for item in node[1]:
+            words = [prefix + suffix for prefix in words for suffix in pattern_words(item)]
+        return words
+    raise ValueError("A keyword pattern must spell out every keyword")
+
+def is_lazy(node):
+    if node[0] in ('star', 'plus', 'optional'):
+        return node[2] or is_lazy(node[1])
+    return node[0] in ('cat', 'alt') and any(map(is_lazy, node[1]))
+
+class CharacterClasses(dict):
+    """ str.translate() table from characters to scanner classes; non-ASCII entries are added on first use.
+
+    With utf8, a non-ASCII character maps to its class once per byte of its UTF-8 encoding, so
+    that decoded bytes translate to one class per byte.
+    """
+    def __init__(self, ascii_classes, property_classes, utf8=False):
+        super().__init__(enumerate(ascii_classes))
+        self.property_classes = property_classes
+        self.utf8 = utf8
+
+    def __missing__(self, code):
+        char = chr(code)
+        cls = self.property_classes[(char.isdecimal(), char.isspace(), char.isalnum())]
+        if self.utf8:
+            cls = chr(cls) * len(char.encode('utf-8', 'surrogateescape'))
+        self[code] = cls
+        return cls
+
+class DFAScanner:
+    """ Table-driven scanner generated from a token specification such as token_patterns.
+
+    The patterns are compiled into one minimized DFA over character classes: characters every
+    pattern treats alike share a class, and str.translate() maps the source to classes at C
+    speed. The scanner then does one table lookup per character and acts only when a token
+    ends; lexemes and (kind, lexeme) tuples are built afterwards, in bulk. Matching follows
+    the re alternation the regex lexer uses: the first pattern (in order) that matches at all
+    wins, with its longest match (shortest for lazy patterns), and \\b is decided by looking
+    one character ahead. So COMMENT still never matches, since OPERATOR claims the '/'
+    first. Keywords are not part of the DFA: the keyword pattern's words are looked up among
+    the scanned lexemes. utf8=True scans UTF-8 bytes instead of a str, with the same meaning:
+    every byte of a character takes the character's class, so both split a source alike.
+    """
+    SKIPPED = ('WHITESPACE', 'COMMENT')
+    MISMATCH = 'MISMATCH'
+
+    def __init__(self, patterns, keywords='KEYWORD', utf8=False):
+        parsed = {name: PatternParser(pattern).parse() for name, pattern in patterns.items()}
+        words = pattern_words(parsed.pop(keywords)) if keywords in parsed else []
+        self.kinds = [None, *parsed]  # token kind of each code; 0 means no pattern matched
+        self.mismatch = self.kinds.index(self.MISMATCH) if self.MISMATCH in parsed else -1
+        self.utf8 = utf8
+        self.build(list(parsed.values()))
+        self.keywords = {}
+        for word in words:
+            codes, _, _ = self.scan(word.encode() if utf8 else word)
+            if len(codes) != 1:
+                raise ValueError(f"Keyword {word!r} does not scan as a single token")
+            self.keywords[word] = keywords
+
+    def build(self, patterns):
+        # Intern the character sets; \w comes first, since \b needs to know which classes are word characters
+        word = PatternParser(r'\w').parse()[1]
+        sets = {word: 0}
+
+        def intern(node):
+            kind = node[0]
+            if kind == 'set':
+                return ('set', sets.setdefault(node[1], len(sets)))
+            if kind in ('cat', 'alt'):
+                return (kind, [intern(item) for item in node[1]])
+            if kind in ('star', 'plus', 'optional'):
+                return (kind, intern(node[1]), node[2])
+            return node
+
+        alternatives = []  # (kind code, lazy, node), one per top-level '|' branch, in priority order
+        for code, node in enumerate(patterns, 1):
+            for branch in (node[1] if node[0] == 'alt' else [node]):
+                alternatives.append((code, is_lazy(branch), intern(branch)))
+
+        # Character classes: characters that are in exactly the same sets
+        signatures = {}
+        ascii_classes = [signatures.setdefault(tuple(code in codes for codes, _ in sets), len(signatures))
+                         for code in range(128)]
+        property_classes = {props: signatures.setdefault(tuple(props in more for _, more in sets), len(signatures))
+                            for props in UNICODE_PROPERTIES}
+        self.eof = len(signatures)  # class of the end of input, which no set holds
+        columns = self.eof + 1
+        in_set = [signature for signature in signatures] + [(False,) * len(sets)]
+        is_word = [signature[0] for signature in in_set]
+        self.classes = CharacterClasses(ascii_classes, property_classes, self.utf8)
+        self.ascii_classes = bytes(ascii_classes) * 2  # bytes.translate() table for all-ASCII bytes
+        # Classes of the characters tokens() splits words at: str.split() cuts at any whitespace,
+        # bytes.split() at ASCII whitespace only
+        if self.utf8:
+            separators = {ascii_classes[code] for code in range(128) if bytes([code]).isspace()}
+        else:
+            separators = {ascii_classes[code] for code in range(128) if chr(code).isspace()}
+            separators.update(cls for props, cls in property_classes.items() if props[1])
+
+        # Thompson NFA; owner[node] is the alternative a node belongs to (-1 for the shared start)
+        moves, empty, boundary, owner = [], [], [], []
+        accepting = {}
+
+        def state(alternative):
+            moves.append([])
+            empty.append([])
+            boundary.append([])
+            owner.append(alternative)
+            return len(owner) - 1
+
+        def fragment(node, alternative):
+            kind = node[0]
+            start = state(alternative)
+            if kind == 'set':
+                end = state(alternative)
+                moves[start].append((node[1], end))
+            elif kind == 'boundary':
+                end = state(alternative)
+                boundary[start].append(end)
+            elif kind == 'cat':
+                end = start
+                for item in node[1]:
+                    first, last = fragment(item, alternative)
+                    empty[end].append(first)
+                    end = last
+            elif kind == 'alt':
+                end = state(alternative)
+                for branch in node[1]:
+                    first, last = fragment(branch, alternative)
+                    empty[start].append(first)
+                    empty[last].append(end)
+            else:
+                end = state(alternative)
+                first, last = fragment(node[1], alternative)
+                empty[start].append(first)
+                empty[last].append(end)
+                if kind != 'plus':
+                    empty[start].append(end)
+                if kind != 'optional':
+                    empty[last].append(first)
+            return start, end
+
+        root = state(-1)
+        for index, (_, _, node) in enumerate(alternatives):
+            first, last = fragment(node, index)
+            empty[root].append(first)
+            accepting[last] = index
+
+        def closure(nodes, at_boundary):
+            found, pending = set(nodes), list(nodes)
+            while pending:
+                node = pending.pop()
+                for target in (empty[node] + boundary[node] if at_boundary else empty[node]):
+                    if target not in found:
+                        found.add(target)
+                        pending.append(target)
+            return frozenset(found)
+
+        # Subset construction. A DFA state is an NFA state set (closed over empty moves, not \b) plus
+        # whether the previous character was a word character; \b is resolved against the next one.
+        start_sets = closure([root], False)
+        numbers, states = {}, []
+
+        def number(key):
+            if key not in numbers:
+                numbers[key] = len(states)
+                states.append(key)
+            return numbers[key]
+
+        starts = [number((start_sets, False)), number((start_sets, True))]
+        steps, accepts = [], []
+        index = 0
+        while index < len(states):
+            nodes, after_word = states[index]
+            row, row_accepts = [], []
+            for cls in range(columns):
+                reached = closure(nodes, after_word != is_word[cls])
+                matched = [accepting[node] for node in reached if node in accepting]
+                kind = 0
+                if matched:
+                    best = min(matched)
+                    kind, lazy = alternatives[best][:2]
+                    # Lower-priority alternatives have lost; a lazy one stops at its first match
+                    reached = [node for node in reached if owner[node] < best or owner[node] == best and not lazy]
+                targets = [target for node in reached for member, target in moves[node] if in_set[cls][member]]
+                if targets:
+                    row.append(('go', number((closure(targets, False), is_word[cls]))))
+                else:
+                    row.append(('end', kind))
+                row_accepts.append(kind)
+            steps.append(row)
+            accepts.append(row_accepts)
+            index += 1
+        # A token that ends on character c is followed by the state the start state steps to on c
+        for index, (_, after_word) in enumerate(states):
+            row = steps[index]
+            for cls in range(columns):
+                if row[cls][0] == 'end':
+                    restart = steps[starts[after_word]][cls]
+                    row[cls] = ('end', row[cls][1], restart[1] if restart[0] == 'go' else starts[False])
+
+        # Moore minimization: split states until every block agrees on actions and target blocks
+        def shape(entry):
+            return entry[:2] if entry[0] == 'end' else ('go',)
+
+        keys = [(tuple(map(shape, steps[index])), tuple(accepts[index])) for index in range(len(states))]
+        ordered = {key: new for new, key in enumerate(dict.fromkeys(keys))}
+        block = [ordered[key] for key in keys]
+        while True:
+            keys = [(block[index], tuple(block[entry[-1]] for entry in steps[index])) for index in range(len(states))]
+            ordered = {key: new for new, key in enumerate(dict.fromkeys(keys))}
+            refined = [ordered[key] for key in keys]
+            if max(refined) == max(block):
+                break
+            block = refined
+        count = max(block) + 1
+
+        # Flat tables indexed by state * columns + class. A token ending is a negative entry, which
+        # indexes the kind it ended, whether that kind is kept, and the state to restart in
+        self.columns = columns
+        self.table = [0] * (count * columns)
+        self.accepts = [0] * (count * columns)
+        endings = {}
+        for index in range(len(states)):
+            base = block[index] * columns
+            for cls, entry in enumerate(steps[index]):
+                self.accepts[base + cls] = accepts[index][cls]
+                if entry[0] == 'go':
+                    self.table[base + cls] = block[entry[1]] * columns
+                else:
+                    # No match at all means backing up, flagged by a negative restart
+                    ending = (entry[1], block[entry[2]] * columns if entry[1] else -1)
+                    self.table[base + cls] = ~endings.setdefault(ending, len(endings))
+        for code in range(1, len(self.kinds)):
+            endings.setdefault((code, -1), len(endings))
+        endings = sorted(endings, key=endings.get, reverse=True)  # so that entry ~i is list index -1 - i
+        self.entry_kinds = [code for code, _ in endings]
+        self.restarts = [restart for _, restart in endings]
+        self.kept = [code > 0 and self.kinds[code] not in self.SKIPPED for code in self.entry_kinds]
+        self.kind_entries = {code: ~index for index, code in enumerate(reversed(self.entry_kinds))}
+        self.starts = [block[starts[False]] * columns, block[starts[True]] * columns]
+        self.is_word = is_word
+        self.separated = self.whitespace_separates(separators)
+
+    def whitespace_separates(self, separators):
+        """ Whether whitespace always ends a token and is skipped, so each whitespace-separated word scans alone. """
+        table, columns, eof = self.table, self.columns, self.eof
+        if not separators or any(self.is_word[cls] for cls in separators):
+            return False
+        # States inside a run of whitespace: the run must be one skipped token that any other class ends
+        gaps, pending = set(), [table[start + cls] for start in self.starts for cls in separators]
+        while pending:
+            state = pending.pop()
+            if state < 0:
+                return False
+            if state in gaps:
+                continue
+            gaps.add(state)
+            for cls in range(columns):
+                entry = table[state + cls]
+                if cls in separators:
+                    pending.append(entry)
+                elif (entry >= 0 or self.kept[entry] or not self.entry_kinds[entry]
+                      or cls != eof and self.restarts[entry] != table[self.starts[False] + cls]):
+                    return False
+        # Anywhere else, whitespace must end the token just as the end of the input would
+        for state in range(0, len(table), columns):
+            if state in gaps or state in self.starts:
+                continue
+            at_end = table[state + eof]
+            for cls in separators:
+                entry = table[state + cls]
+                if (entry >= 0 or self.entry_kinds[entry] != self.entry_kinds[at_end]
+                        or self.accepts[state + cls] != self.accepts[state + eof]
+                        or self.entry_kinds[entry] and self.restarts[entry] not in gaps):
+                    return False
+        return True
+
+    def classify(self, text):
+        """ The source as one class code per character, plus the end-of-input class. """
+        if not self.utf8:
+            classes = text.translate(self.classes).encode('latin-1')
+        elif (data := bytes(text)).isascii():
+            classes = data.translate(self.ascii_classes)
+        else:
+            # Bytes that are not UTF-8 decode to one escape each, which is no \d, \s or \w
+            classes = data.decode('utf-8', 'surrogateescape').translate(self.classes).encode('latin-1')
+        return classes + bytes([self.eof])
+
+    def scan(self, text, start=0, end=None):
+        """ Token codes, start offsets and end offsets of text[start:end], skipped tokens left out. """
+        source = text[start:end] if start or end is not None else text
+        classes = self.classify(source)
+        # Four characters back always hold the whole UTF-8 character before start
+        after_word = start > 0 and self.is_word[self.classify(text[max(start - 4, 0):start])[-2]]
+        table, restarts, accepts, is_word = self.table, self.restarts, self.accepts, self.is_word
+        # One entry per token, skipped ones included: the table entry that ended it and where it ended
+        ends, entries = [], []
+        end_at, ended_by = ends.append, entries.append
+        view = memoryview(classes)
+        last = len(classes) - 1
+        state, position = self.starts[after_word], 0
+        while True:
+            for position, cls in enumerate(view[position:], position):
+                state = table[state + cls]
+                if state < 0:
+                    end_at(position)
+                    ended_by(state)
+                    state = restarts[state]
+                    if state < 0:
+                        break
+            else:
+                break
+            # No pattern matched right up to here: back up to the longest match, which ended earlier
+            ends.pop()
+            entries.pop()
+            token = ends[-1] if ends else 0
+            if token == last:
+                break
+            state = self.starts[is_word[classes[token - 1]] if token else after_word]
+            for position in range(token, last + 1):
+                cls = classes[position]
+                if accepts[state + cls]:
+                    code, position_matched = accepts[state + cls], position
+                state = table[state + cls]
+                if state < 0:
+                    break
+            end_at(position_matched)
+            ended_by(self.kind_entries[code])
+            position = position_matched
+            state = self.starts[is_word[classes[position - 1]]]
+        selected = list(map(self.kept.__getitem__, entries))
+        codes = list(compress(map(self.entry_kinds.__getitem__, entries), selected))
+        starts = list(compress([0, *ends], selected))
+        ends = list(compress(ends, selected))
+        if start:
+            starts = [offset + start for offset in starts]
+            ends = [offset + start for offset in ends]
+        if self.utf8 and self.mismatch in codes:
+            return self.join_sequences(text, codes, starts, ends)
+        return codes, starts, ends
+
+    def join_sequences(self, text, codes, starts, ends):
+        """ Merge the unrecognized bytes of one UTF-8 sequence into a single MISMATCH token.
+
+        The bytes of a non-ASCII character all take its class, so MISMATCH's '.' matches an
+        unrecognized character one byte at a time; each continuation byte joins the mismatch
+        right before it, so a diagnostic names the whole character, as the str scanner's does.
+        """
+        mismatch = self.mismatch
+        joined_codes, joined_starts, joined_ends = [], [], []
+        for code, start, end in zip(codes, starts, ends):
+            if (code == mismatch and joined_codes and joined_codes[-1] == mismatch
+                    and joined_ends[-1] == start and 0x80 <= text[start] < 0xC0):
+                joined_ends[-1] = end
+                continue
+            joined_codes.append(code)
+            joined_starts.append(start)
+            joined_ends.append(end)
+        return joined_codes, joined_starts, joined_ends
+
+    def label(self, text, codes, starts, ends):
+        """ (kind, lexeme) for each scanned token, unrecognized characters included as MISMATCH. """
+        lexemes = map(text.__getitem__, map(slice, starts, ends))
+        if self.utf8:
+            lexemes = map(str, lexemes, repeat('utf-8'), repeat('replace'))  # invalid UTF-8 is a mismatch too
+        lexemes = list(lexemes)
+        kinds = map(self.kinds.__getitem__, codes)
+        if self.keywords:
+            kinds = map(self.keywords.get, lexemes, kinds)
+        return list(zip(kinds, lexemes))
+
+    def recognized(self, tokens, starts, errors, origin=0):
+        """ Which tokens are real ones; reports the others (see report_lexical_error) in order.
+
+        origin is where text starts in the whole source, so diagnostics carry whole-source offsets.
+        """
+        valid = [kind != self.MISMATCH for kind, _ in tokens]
+        for (_, lexeme), start in compress(zip(tokens, starts), map(operator.not_, valid)):
+            report_lexical_error(lexeme, errors, origin + start)
+        return valid
+
+    def tokenize(self, text, errors=None, start=0, end=None, origin=0):
+        """ (kind, lexeme) tokens of text[start:end] and their start offsets. """
+        codes, starts, ends = self.scan(text, start, end)
+        tokens = self.label(text, codes, starts, ends)
+        if self.mismatch in codes:
+            valid = self.recognized(tokens, starts, errors, origin)
+            tokens, starts = list(compress(tokens, valid)), list(compress(starts, valid))
+        return tokens, starts
+
+    def tokens(self, text, errors=None, origin=0):
+        """ (kind, lexeme) tokens of text, in bulk.
+
+        When whitespace separates tokens, text.split() cuts the source into words at C speed. Each
+        distinct word is scanned once, all of them in one pass, and the token list is stitched
+        together from the words' tokens. Source where most words are distinct is scanned directly,
+        and so is source with unrecognized symbols, whose diagnostics need their offsets.
+        """
+        if not self.separated:
+            return self.tokenize(text, errors, origin=origin)[0]
+        words = text.split() if isinstance(text, (str, bytes)) else bytes(text).split()
+        vocabulary = list(dict.fromkeys(words))
+        if len(vocabulary) * 2 > len(words):
+            return self.tokenize(text, errors, origin=origin)[0]  # too few repeats to pay for the detour
+        joined = (b' ' if self.utf8 else ' ').join(vocabulary)
+        codes, starts, ends = self.scan(joined)
+        if self.mismatch in codes:
+            return self.tokenize(text, errors, origin=origin)[0]
+        scanned = self.label(joined, codes, starts, ends)
+        # A word's tokens run from the first one starting inside it to the first one of the next word
+        word_starts = accumulate(map((1).__add__, map(len, vocabulary)), initial=0)
+        firsts = list(map(bisect_left, repeat(starts), word_starts))
+        spelled = dict(zip(vocabulary, map(scanned.__getitem__, map(slice, firsts, firsts[1:]))))
+        return list(chain.from_iterable(map(spelled.__getitem__, words)))
+
+# Generated once per process; the bytes twin scans mmap'd files without decoding them first
+token_scanner = DFAScanner(token_patterns)
+token_scanner_bytes = DFAScanner(token_patterns, utf8=True)
+
+def lex(code, errors=None):
+    return token_scanner.tokens(code, errors)
+
+class Diagnostic(str):
+    """ An error message that remembers where in the source it points.
+
+    offset is a position in the source text; token is the index of the offending token in
+    the token stream, for the stages that only see tokens. Either may be None. A Diagnostic
+    compares and prints as its plain message: SourceMap.render() adds the line and column.
+    Tokens stay (kind, lexeme) pairs rather than carrying their offsets, because lex() gets
+    its speed from scanning each distinct word once, which never sees where a word occurs;
+    the offsets are recovered only for a source that ends up with a token diagnostic.
+    """
+    __slots__ = ('token', 'offset')
+
+    def __new__(cls, message, token=None, offset=None):
+        diagnostic = super().__new__(cls, message)
+        diagnostic.token = token
+        diagnostic.offset = offset
+        return diagnostic
+
+class SourceMap:
+    """ Resolves positions in one source to (line, column), both counted from 1, when a diagnostic is rendered.
+
+    Nothing is indexed up front. The first lookup collects the offset every line starts at,
+    and each lookup after that is a binary search. Token indices are resolved through the
+    tokens' start offsets: offsets if the caller has them (IncrementalDocument.source_map()
+    or TokenBuffer.starts), or else one rescan of the source on the first token lookup. The
+    rescan runs the DFA without building lexemes, at about a third of lex()'s speed on
+    typical source; it is paid once per source, however many diagnostics it has.
+    """
+    def __init__(self, source, offsets=None):
+        self.source = source
+        self.offsets = offsets
+        self.line_starts = None
+
+    def offset(self, diagnostic):
+        """ Source offset a Diagnostic points at, or None. """
+        if diagnostic.offset is not None or diagnostic.token is None:
+            return diagnostic.offset
+        if self.offsets is None:
+            scanner = token_scanner if isinstance(self.source, str) else token_scanner_bytes
+            codes, starts, _ = scanner.scan(self.source)
+            if scanner.mismatch in codes:
+                starts = list(compress(starts, [code != scanner.mismatch for code in codes]))
+            self.offsets = starts
+        if diagnostic.token < len(self.offsets):
+            return self.offsets[diagnostic.token]
+        return len(self.source)  # the parser ran out of tokens
+
+    def location(self, offset):
+        if self.line_starts is None:
+            lines = self.source.split('\n' if isinstance(self.source, str) else b'\n')
+            self.line_starts = array('Q', accumulate(map((1).__add__, map(len, lines)), initial=0))
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def render(self, diagnostic):
+        """ The message prefixed with 'line:column: ' when it points somewhere in the source. """
+        offset = self.offset(diagnostic) if isinstance(diagnostic, Diagnostic) else None
+        if offset is None:
+            return str(diagnostic)
+        line, column = self.location(offset)
+        return f"{line}:{column}: {diagnostic}"
+
+def report_lexical_error(value, errors=None, offset=None):
+    """ Append an unrecognized-symbol diagnostic to errors, or write it to stderr when no list is given. """
+    message = f"Error: Unrecognized symbol '{value}'"
+    if errors is None:
+        sys.stderr.write(message + '\n')
+    else:
+        errors.append(Diagnostic(message, offset=offset))
+
+def lex_stream(source, chunk_size=1 << 16, errors=None):
+    """ Lazily tokenize a string, a bytes-like object / mmap, or a text or binary file object.
+
+    Sources are scanned chunk_size characters at a time, up to the last complete
+    line, since no MiniLang token spans a newline; memory stays bounded by the
+    chunk size plus the longest line. File objects are read the same way.
+    Unrecognized symbols are appended to errors (see report_lexical_error).
+    """
+    if isinstance(source, str):
+        yield from scan_lines(source, token_scanner, chunk_size, errors)
+        return
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        if isinstance(source, memoryview):
+            source = bytes(source)
+        yield from scan_lines(source, token_scanner_bytes, chunk_size, errors)
+        return
+
+    decoder = None
+    pending = ''
+    consumed = 0  # characters tokenized so far
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            chunk = decoder.decode(chunk)
+        pending += chunk
+        cut = pending.rfind('\n') + 1
+        if cut:
+            yield from token_scanner.tokens(pending[:cut], errors, consumed)
+            pending = pending[cut:]
+            consumed += cut
+    if decoder is not None:
+        pending += decoder.decode(b'', final=True)
+    yield from token_scanner.tokens(pending, errors, consumed)
+
+def scan_lines(source, scanner, chunk_size, errors):
+    """ Tokens of an in-memory source, scanned a chunk of whole lines at a time. """
+    newline = b'\n' if scanner.utf8 else '\n'
+    start = 0
+    while start < len(source):
+        cut = source.find(newline, start + chunk_size) + 1 or len(source)
+        yield from scanner.tokens(source[start:cut], errors, start)
+        start = cut
+
+def lex_file(path, errors=None):
+    """ Lazily tokenize a source file through a read-only memory map. """
+    with open(path, 'rb') as f:
+        try:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            return
+        with source:
+            yield from lex_stream(source, errors=errors)
+
+# Token kinds that survive lexing, in the order of their integer codes
+TOKEN_KINDS = ('KEYWORD', 'IDENTIFIER', 'NUMBER', 'OPERATOR', 'DELIMITER')
+TOKEN_CODES = {kind: code for code, kind in enumerate(TOKEN_KINDS)}
+
+class TokenBuffer:
+    """ Packed token stream: one byte per kind code plus start/end offsets into the source.
+
+    Lexemes are sliced out of the source and interned only when asked for, so a
+    token costs a few bytes instead of a tuple and two strings.
+    """
+    def __init__(self, source):
+        self.source = source
+        offset_type = 'I' if len(source) < 1 << 32 else 'Q'
+        self.kinds = array('B')
+        self.starts = array(offset_type)
+        self.ends = array(offset_type)
+
+    @classmethod
+    def from_source(cls, source, errors=None):
+        buffer = cls(source)
+        scanner = token_scanner if isinstance(source, str) else token_scanner_bytes
+        codes = [TOKEN_CODES.get(kind) for kind in scanner.kinds]
+        identifier, keyword, keywords = TOKEN_CODES['IDENTIFIER'], TOKEN_CODES['KEYWORD'], scanner.keywords
+        kinds, starts, ends = buffer.kinds, buffer.starts, buffer.ends
+        for code, start, end in zip(*scanner.scan(source)):
+            code = codes[code]
+            if code is None:
+                report_lexical_error(buffer.decode(source[start:end]), errors, start)
+                continue
+            if code == identifier and buffer.decode(source[start:end]) in keywords:
+                code = keyword
+            kinds.append(code)
+            starts.append(start)
+            ends.append(end)
+        return buffer
+
+    def decode(self, value):
+        return value if isinstance(value, str) else value.decode(errors='replace')
+
+    def lexeme(self, index):
+        return sys.intern(self.decode(self.source[self.starts[index]:self.ends[index]]))
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        return (TOKEN_KINDS[self.kinds[index]], self.lexeme(index))
+
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield self[index]
+
+    def __sizeof__(self):
+        # Token storage only; the source text is shared with the caller
+        return object.__sizeof__(self) + sum(
+            part.buffer_info()[1] * part.itemsize for part in (self.kinds, self.starts, self.ends))
@@ -0,0 +1,217 @@
+""" Binary object files for compiled functions: the writer and the memory-mapped loader. """
+import sys
+import mmap
+import struct
+from array import array
+from itertools import accumulate
+
+from .backend import (EXECUTABLE_MNEMONICS, JUMP_TARGET, LABEL, REGISTER_PREFIX, format_assembly, is_constant,
+                      is_register, parse_assembly, register_name)
+
+# Compiled object files: a header, a function table, a string table, per-function label tables and
+# fixed-width instructions. Every section is a run of little-endian structs, so a loader can map the
+# file and decode any table entry or instruction in place.
+OBJECT_MAGIC = b'MLO'
+OBJECT_VERSION = 1
+# magic, format version, then the counts of functions, strings, string bytes, labels and instructions
+OBJECT_HEADER = struct.Struct('<3sB5I')
+OBJECT_FUNCTION = struct.Struct('<5I')  # name string, first instruction, instruction count, first label, label count
+OBJECT_LABEL = struct.Struct('<2I')  # name string, instruction offset within the function
+OBJECT_STRING_OFFSET = struct.Struct('<I')
+OBJECT_STRING_BOUNDS = struct.Struct('<2I')  # two adjacent offsets: where a string starts and ends
+# opcode, the two operand kinds (first in the low nibble), then each operand's value
+OBJECT_INSTRUCTION = struct.Struct('<2B2i')
+OBJECT_OPCODES = ('declare',) + EXECUTABLE_MNEMONICS
+OBJECT_OPCODE_IDS = {mnemonic: opcode for opcode, mnemonic in enumerate(OBJECT_OPCODES)}
+
+# Operand kinds (a nibble each): a register number, a constant that fits the 32-bit value, a string table index
+# (variables, temps and declared types), a label table index, or a larger constant kept as a string
+OPERAND_NONE, OPERAND_REGISTER, OPERAND_CONSTANT, OPERAND_NAME, OPERAND_LABEL, OPERAND_BIG_CONSTANT = range(6)
+OBJECT_VALUE_RANGE = range(-1 << 31, 1 << 31)
+
+class ObjectWriter:
+    """ Assembles generated assembly text for one or more functions into the binary object format. """
+    def __init__(self):
+        self.string_ids = {}
+        self.functions = bytearray()
+        self.labels = bytearray()
+        self.instructions = bytearray()
+        self.function_count = self.label_count = self.instruction_count = 0
+        self.operands = {}  # operand text -> (kind, value), shared by every function
+
+    def intern(self, text):
+        index = self.string_ids.get(text)
+        if index is None:
+            index = self.string_ids[text] = len(self.string_ids)
+        return index
+
+    def operand(self, text):
+        """ (kind, value) encoding of a non-label operand. """
+        encoded = self.operands.get(text)
+        if encoded is None:
+            if is_register(text):
+                encoded = (OPERAND_REGISTER, int(text[len(REGISTER_PREFIX):]))
+            elif is_constant(text) and int(text) in OBJECT_VALUE_RANGE:
+                encoded = (OPERAND_CONSTANT, int(text))
+            else:
+                encoded = (OPERAND_BIG_CONSTANT if is_constant(text) else OPERAND_NAME, self.intern(text))
+            self.operands[text] = encoded
+        return encoded
+
+    def add_function(self, name, assembly_code):
+        code = [parse_assembly(line) for line in assembly_code]
+        # Number the labels first so forward jumps resolve; each records the instruction it precedes
+        labels = {}
+        count = 0
+        for instruction in code:
+            if instruction[0] == LABEL:
+                labels[instruction[1]] = (len(labels), count)
+            else:
+                count += 1
+        for label, (_, offset) in labels.items():
+            self.labels += OBJECT_LABEL.pack(self.intern(label), offset)
+        self.functions += OBJECT_FUNCTION.pack(self.intern(name), self.instruction_count, count,
+                                               self.label_count, len(labels))
+        self.function_count += 1
+        self.label_count += len(labels)
+        self.instruction_count += count
+
+        pack, operand, none = OBJECT_INSTRUCTION.pack, self.operand, (OPERAND_NONE, 0)
+        for instruction in code:
+            mnemonic = instruction[0]
+            if mnemonic == LABEL:
+                continue
+            opcode = OBJECT_OPCODE_IDS.get(mnemonic)
+            if opcode is None or len(instruction) > 3:
+                raise ValueError(f"Unknown assembly instruction: {format_assembly(instruction)}")
+            if mnemonic == 'declare':
+                var_type, _, variable = instruction[1].partition(' ')
+                first, second = (OPERAND_NAME, self.intern(var_type)), (OPERAND_NAME, self.intern(variable))
+            elif mnemonic in JUMP_TARGET:
+                first, second = (OPERAND_LABEL, labels[instruction[1]][0]), none
+            else:
+                first = operand(instruction[1]) if len(instruction) > 1 else none
+                second = operand(instruction[2]) if len(instruction) > 2 else none
+            self.instructions += pack(opcode, first[0] | second[0] << 4, first[1], second[1])
+
+    def to_bytes(self):
+        encoded = [text.encode('utf-8') for text in self.string_ids]
+        offsets = array('I', accumulate(map(len, encoded), initial=0))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        strings = b''.join(encoded)
+        header = OBJECT_HEADER.pack(OBJECT_MAGIC, OBJECT_VERSION, self.function_count, len(encoded),
+                                    len(strings), self.label_count, self.instruction_count)
+        padding = b'\0' * (-len(strings) % 4)  # keep the label and instruction tables 4-byte aligned
+        return b''.join((header, self.functions, offsets.tobytes(), strings, padding, self.labels, self.instructions))
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+class ObjectFile:
+    """ A compiled object file mapped read-only into memory.
+
+    Nothing is decoded up front: tables and instructions are unpacked from a memoryview of the map
+    when asked for, and strings are decoded once on first use. Use it as a context manager (or call
+    close()) so the map is released.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty files cannot be mapped
+                raise ValueError(f"{path}: not a MiniLang object file") from None
+        self.view = memoryview(self.mapping)
+        try:
+            (magic, version, self.function_count, string_count, string_bytes, self.label_count,
+             self.instruction_count) = OBJECT_HEADER.unpack_from(self.view)
+        except struct.error:
+            magic = version = None
+        if magic != OBJECT_MAGIC or version != OBJECT_VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a MiniLang object file (or an incompatible version)")
+        self.function_table = OBJECT_HEADER.size
+        self.string_offsets = self.function_table + self.function_count * OBJECT_FUNCTION.size
+        self.string_data = self.string_offsets + (string_count + 1) * OBJECT_STRING_OFFSET.size
+        self.label_table = self.string_data + string_bytes + (-string_bytes % 4)
+        self.instruction_table = self.label_table + self.label_count * OBJECT_LABEL.size
+        if self.instruction_table + self.instruction_count * OBJECT_INSTRUCTION.size > len(self.view):
+            self.close()
+            raise ValueError(f"{path}: truncated object file")
+        self.strings = [None] * string_count
+        self.function_ids = None
+
+    def close(self):
+        self.view.release()
+        self.mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, index):
+        text = self.strings[index]
+        if text is None:
+            start, end = OBJECT_STRING_BOUNDS.unpack_from(self.view, self.string_offsets + index * OBJECT_STRING_OFFSET.size)
+            text = self.strings[index] = str(self.view[self.string_data + start:self.string_data + end], 'utf-8')
+        return text
+
+    def function_entry(self, index):
+        return OBJECT_FUNCTION.unpack_from(self.view, self.function_table + index * OBJECT_FUNCTION.size)
+
+    def function_names(self):
+        return [self.string(self.function_entry(index)[0]) for index in range(self.function_count)]
+
+    def function(self, name):
+        """ (first instruction, instruction count, first label, label count) of the named function. """
+        if self.function_ids is None:
+            self.function_ids = {name: index for index, name in enumerate(self.function_names())}
+        index = self.function_ids.get(name)
+        if index is None:
+            raise KeyError(f"No function {name!r} in object file")
+        return self.function_entry(index)[1:]
+
+    def labels(self, name):
+        """ [(label name, instruction offset)] of the named function, in label-index order. """
+        _, _, first, count = self.function(name)
+        start = self.label_table + first * OBJECT_LABEL.size
+        return [(self.string(label), offset)
+                for label, offset in OBJECT_LABEL.iter_unpack(self.view[start:start + count * OBJECT_LABEL.size])]
+
+    def instructions(self, name):
+        """ Iterate the named function's (opcode, kinds, value1, value2) records; kinds packs both operand kinds. """
+        first, count, _, _ = self.function(name)
+        start = self.instruction_table + first * OBJECT_INSTRUCTION.size
+        return OBJECT_INSTRUCTION.iter_unpack(self.view[start:start + count * OBJECT_INSTRUCTION.size])
+
+    def operand_text(self, kind, value, labels):
+        if kind == OPERAND_REGISTER:
+            return register_name(value)
+        if kind == OPERAND_CONSTANT:
+            return str(value)
+        if kind == OPERAND_LABEL:
+            return labels[value][0]
+        return self.string(value)
+
+    def disassemble(self, name):
+        """ The named function's assembly text, as generate_assembly() produced it. """
+        labels = self.labels(name)
+        at = {}
+        for label, offset in labels:
+            at.setdefault(offset, []).append(label)
+        assembly_code = []
+        for index, (opcode, kinds, value1, value2) in enumerate(self.instructions(name)):
+            assembly_code.extend(f"{label}:" for label in at.get(index, ()))
+            texts = [self.operand_text(kind, value, labels)
+                     for kind, value in ((kinds & 15, value1), (kinds >> 4, value2)) if kind != OPERAND_NONE]
+            mnemonic = OBJECT_OPCODES[opcode]
+            if mnemonic == 'declare':
+                assembly_code.append(f"declare {' '.join(texts)}")
+            else:
+                assembly_code.append(format_assembly((mnemonic, *texts)))
+        end = self.function(name)[1]
+        assembly_code.extend(f"{label}:" for label in at.get(end, ()))
+        return assembly_code
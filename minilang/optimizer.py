@@ -0,0 +1,624 @@
+""" Stage 5: control-flow analysis and the IR optimizer. """
+import heapq
+from collections import Counter
+
+from .ir import (BINARY_EVALUATORS, IRCode, IR_BINARY, IR_COPY, IR_DECLARE, IR_GOTO, IR_IF, IR_LABEL, IR_OPERATOR,
+                 IR_RETURN, Instruction, IntermediateCodeGenerator, SYM_CONSTANT, SYM_LABEL, SYM_TEMP)
+
+def instruction_uses(instruction):
+    """ Operand IDs read by an instruction (constants included). """
+    opcode = instruction.opcode
+    if opcode in IR_OPERATOR:
+        return (instruction.arg1, instruction.arg2)
+    if opcode == IR_COPY or opcode == IR_IF or opcode == IR_RETURN:
+        return (instruction.arg1,)
+    return ()
+
+def instruction_def(instruction):
+    """ The variable/temp an instruction assigns, or None. """
+    opcode = instruction.opcode
+    if opcode == IR_COPY or opcode in IR_OPERATOR:
+        return instruction.dest
+    return None
+
+class BasicBlock:
+    __slots__ = ('index', 'instructions', 'successors', 'predecessors')
+
+    def __init__(self, index):
+        self.index = index
+        self.instructions = []
+        self.successors = []
+        self.predecessors = []
+
+class ControlFlowGraph:
+    """ Basic blocks of an instruction list, linked by jump and fall-through edges. Block 0 is the entry. """
+    def __init__(self, instructions):
+        self.blocks = []
+        block = None
+        for instruction in instructions:
+            if block is None or (instruction.opcode == IR_LABEL and block.instructions):
+                block = BasicBlock(len(self.blocks))
+                self.blocks.append(block)
+            block.instructions.append(instruction)
+            if instruction.opcode in (IR_IF, IR_GOTO, IR_RETURN):
+                block = None
+
+        label_blocks = {}
+        for block in self.blocks:
+            first = block.instructions[0]
+            if first.opcode == IR_LABEL:
+                label_blocks[first.dest] = block.index
+
+        for block in self.blocks:
+            last = block.instructions[-1]
+            following = block.index + 1 if block.index + 1 < len(self.blocks) else None
+            if last.opcode == IR_GOTO:
+                successors = [label_blocks.get(last.dest)]
+            elif last.opcode == IR_IF:
+                successors = [label_blocks.get(last.dest), following]
+            elif last.opcode == IR_RETURN:
+                successors = []
+            else:
+                successors = [following]
+            for successor in successors:
+                if successor is not None and successor not in block.successors:
+                    block.successors.append(successor)
+                    self.blocks[successor].predecessors.append(block.index)
+
+    def instructions(self):
+        return [instruction for block in self.blocks for instruction in block.instructions]
+
+    def shared_symbols(self):
+        """ Variables/temps mentioned in more than one block; only these need to cross block boundaries. """
+        first_block = {}
+        shared = set()
+        for block in self.blocks:
+            for instruction in block.instructions:
+                for symbol in (instruction.dest, instruction.arg1, instruction.arg2):
+                    if symbol is not None and first_block.setdefault(symbol, block.index) != block.index:
+                        shared.add(symbol)
+        return shared
+
+    def reachable(self):
+        seen = [False] * len(self.blocks)
+        stack = [0] if self.blocks else []
+        while stack:
+            index = stack.pop()
+            if not seen[index]:
+                seen[index] = True
+                stack.extend(self.blocks[index].successors)
+        return seen
+
+    def dominators(self):
+        """ Immediate dominator of every block: None for the entry and for unreachable blocks.
+
+        The iterative algorithm of Cooper, Harvey and Kennedy, over blocks in reverse postorder.
+        """
+        order, seen = [], [False] * len(self.blocks)
+        stack = [(0, iter(self.blocks[0].successors))] if self.blocks else []
+        if stack:
+            seen[0] = True
+        while stack:
+            index, successors = stack[-1]
+            successor = next(successors, None)
+            if successor is None:
+                order.append(index)
+                stack.pop()
+            elif not seen[successor]:
+                seen[successor] = True
+                stack.append((successor, iter(self.blocks[successor].successors)))
+        order.reverse()
+        rank = {index: position for position, index in enumerate(order)}
+
+        idom = [None] * len(self.blocks)
+        if order:
+            idom[0] = 0
+        changed = True
+        while changed:
+            changed = False
+            for index in order[1:]:
+                new = None
+                for predecessor in self.blocks[index].predecessors:
+                    if idom[predecessor] is None:
+                        continue
+                    if new is None:
+                        new = predecessor
+                        continue
+                    other = predecessor
+                    while other != new:  # walk both up to their common dominator
+                        while rank[other] > rank[new]:
+                            other = idom[other]
+                        while rank[new] > rank[other]:
+                            new = idom[new]
+                    new = other
+                if idom[index] != new:
+                    idom[index] = new
+                    changed = True
+        if order:
+            idom[0] = None
+        return idom
+
+    def natural_loops(self):
+        """ (header, body) of every natural loop, innermost first; body is a set of block indices.
+
+        An edge to a block that dominates its source is a back edge. The loop's body is its
+        header plus every block that reaches the back edge without passing through the header;
+        back edges to the same header make one loop.
+        """
+        idom = self.dominators()
+
+        def dominates(dominator, index):
+            while index is not None:
+                if index == dominator:
+                    return True
+                index = idom[index]
+            return False
+
+        bodies = {}
+        for block in self.blocks:
+            if idom[block.index] is None and block.index != 0:
+                continue  # unreachable
+            for successor in block.successors:
+                if not dominates(successor, block.index):
+                    continue
+                body = bodies.setdefault(successor, {successor})
+                pending = [block.index]
+                while pending:
+                    index = pending.pop()
+                    if index not in body:
+                        body.add(index)
+                        pending.extend(predecessor for predecessor in self.blocks[index].predecessors
+                                       if idom[predecessor] is not None or predecessor == 0)
+        return sorted(bodies.items(), key=lambda loop: len(loop[1]))
+
+    def solve_forward(self, meet, transfer):
+        """ Worklist solver for a forward problem. Returns the in-state of every block.
+
+        meet receives the out-states of the already-processed predecessors (plus an
+        empty state for the entry block); transfer maps a block and in-state to an out-state.
+        The lowest-numbered pending block goes first: blocks are in source order, so a loop
+        settles before the code after it is revisited, instead of one sweep of the rest of
+        the function per loop.
+        """
+        count = len(self.blocks)
+        out_states = [None] * count
+        in_states = [None] * count
+        worklist = list(range(count))  # a heap, already ordered
+        queued = [True] * count
+        while worklist:
+            index = heapq.heappop(worklist)
+            queued[index] = False
+            block = self.blocks[index]
+            incoming = [out_states[p] for p in block.predecessors if out_states[p] is not None]
+            if index == 0:
+                incoming.append({})
+            in_states[index] = meet(incoming)
+            out_state = transfer(block, in_states[index])
+            if out_state != out_states[index]:
+                out_states[index] = out_state
+                for successor in block.successors:
+                    if not queued[successor]:
+                        queued[successor] = True
+                        heapq.heappush(worklist, successor)
+        return in_states
+
+    def solve_liveness(self):
+        """ Backward worklist liveness. Returns the live-out set of every block. """
+        count = len(self.blocks)
+        uses, defs = [], []
+        for block in self.blocks:
+            used, defined = set(), set()
+            for instruction in reversed(block.instructions):
+                target = instruction_def(instruction)
+                if target is not None:
+                    defined.add(target)
+                    used.discard(target)
+                used.update(instruction_uses(instruction))
+            uses.append(used)
+            defs.append(defined)
+
+        live_in = [set() for _ in range(count)]
+        live_out = [set() for _ in range(count)]
+        worklist = [-index for index in reversed(range(count))]  # highest-numbered block first
+        queued = [True] * count
+        while worklist:
+            index = -heapq.heappop(worklist)
+            queued[index] = False
+            block = self.blocks[index]
+            out_set = set()
+            for successor in block.successors:
+                out_set |= live_in[successor]
+            live_out[index] = out_set
+            in_set = uses[index] | (out_set - defs[index])
+            if in_set != live_in[index]:
+                live_in[index] = in_set
+                for predecessor in block.predecessors:
+                    if not queued[predecessor]:
+                        queued[predecessor] = True
+                        heapq.heappush(worklist, -predecessor)
+        return live_out
+
+NOT_A_CONSTANT = 'NAC'
+
+def induction_step(instruction, variable, kinds, values):
+    """ c if instruction computes variable + c or variable - (-c) for a constant c, else None. """
+    opcode, left, right = instruction.opcode, instruction.arg1, instruction.arg2
+    if opcode == IR_BINARY['+']:
+        if left == variable and kinds[right] == SYM_CONSTANT:
+            return values[right]
+        if right == variable and kinds[left] == SYM_CONSTANT:
+            return values[left]
+    elif opcode == IR_BINARY['-'] and left == variable and kinds[right] == SYM_CONSTANT:
+        return -values[right]
+    return None
+
+class OptimizedIntermediateCodeGenerator(IntermediateCodeGenerator):
+    def __init__(self):
+        super().__init__()
+
+    def optimize_ir(self, ir_code):
+        """ Run the CFG-based passes to a fixpoint, then tidy up jumps and labels. """
+        symbols = ir_code.symbols
+        instructions = list(ir_code)
+        changed = True
+        while changed:
+            changed = False
+            for optimization in (self.propagate_constants, self.propagate_copies,
+                                 self.eliminate_dead_code, self.simplify_control_flow, self.optimize_loops):
+                instructions, pass_changed = optimization(instructions, symbols)
+                changed = changed or pass_changed
+        return IRCode(symbols, instructions, ir_code.name)
+
+    def propagate_constants(self, instructions, symbols):
+        """ Global constant propagation and folding; constant conditions become plain jumps. """
+        kinds, values = symbols.kinds, symbols.values
+
+        def value_of(operand, state):
+            if kinds[operand] == SYM_CONSTANT:
+                return values[operand]
+            value = state.get(operand)
+            return None if value is NOT_A_CONSTANT else value
+
+        def step(instruction, state):
+            opcode = instruction.opcode
+            if opcode == IR_COPY:
+                value = value_of(instruction.arg1, state)
+                state[instruction.dest] = NOT_A_CONSTANT if value is None else value
+            elif opcode in IR_OPERATOR:
+                left = value_of(instruction.arg1, state)
+                right = value_of(instruction.arg2, state)
+                value = None
+                if left is not None and right is not None:
+                    value = BINARY_EVALUATORS[opcode](left, right)
+                state[instruction.dest] = NOT_A_CONSTANT if value is None else value
+            elif opcode == IR_DECLARE:
+                state[instruction.dest] = NOT_A_CONSTANT
+
+        def meet(states):
+            # A variable is constant only if every processed path agrees on it
+            merged = dict(states[0]) if states else {}
+            for state in states[1:]:
+                for symbol in merged.keys() | state.keys():
+                    if merged.get(symbol) != state.get(symbol):
+                        merged[symbol] = NOT_A_CONSTANT
+            return merged
+
+        def transfer(block, in_state):
+            state = dict(in_state)
+            for instruction in block.instructions:
+                step(instruction, state)
+            return {symbol: value for symbol, value in state.items() if symbol in shared}
+
+        cfg = ControlFlowGraph(instructions)
+        shared = cfg.shared_symbols()
+        in_states = cfg.solve_forward(meet, transfer)
+
+        changed = False
+        result = []
+        for block, in_state in zip(cfg.blocks, in_states):
+            state = dict(in_state or {})
+            for instruction in block.instructions:
+                opcode = instruction.opcode
+                rewritten = instruction
+                if opcode == IR_COPY or opcode == IR_RETURN:
+                    value = value_of(instruction.arg1, state)
+                    if value is not None and instruction.arg1 != symbols.constant(value):
+                        rewritten = Instruction(opcode, instruction.dest, symbols.constant(value))
+                elif opcode in IR_OPERATOR:
+                    left = value_of(instruction.arg1, state)
+                    right = value_of(instruction.arg2, state)
+                    folded = None
+                    if left is not None and right is not None:
+                        folded = BINARY_EVALUATORS[opcode](left, right)
+                    if folded is not None:
+                        rewritten = Instruction(IR_COPY, instruction.dest, symbols.constant(folded))
+                    else:
+                        arg1 = instruction.arg1 if left is None else symbols.constant(left)
+                        arg2 = instruction.arg2 if right is None else symbols.constant(right)
+                        if (arg1, arg2) != (instruction.arg1, instruction.arg2):
+                            rewritten = Instruction(opcode, instruction.dest, arg1, arg2)
+                elif opcode == IR_IF:
+                    value = value_of(instruction.arg1, state)
+                    if value is not None:
+                        changed = True
+                        if value:
+                            result.append(Instruction(IR_GOTO, instruction.dest))
+                        continue
+                step(instruction, state)
+                if rewritten is not instruction:
+                    changed = True
+                result.append(rewritten)
+        return result, changed
+
+    def propagate_copies(self, instructions, symbols):
+        """ Global copy propagation: after x = y, uses of x read y until either is reassigned. """
+        kinds = symbols.kinds
+
+        def step(instruction, copies, sources):
+            # sources maps a copied symbol to the destinations currently holding it
+            target = instruction.dest if instruction.opcode == IR_DECLARE else instruction_def(instruction)
+            if target is None:
+                return
+            source = copies.pop(target, None)
+            if source is not None:
+                sources[source].discard(target)
+            for dest in sources.pop(target, ()):
+                del copies[dest]
+            if (instruction.opcode == IR_COPY and kinds[instruction.arg1] != SYM_CONSTANT
+                    and instruction.arg1 != target):
+                copies[target] = instruction.arg1
+                sources.setdefault(instruction.arg1, set()).add(target)
+
+        def index_sources(copies):
+            sources = {}
+            for dest, source in copies.items():
+                sources.setdefault(source, set()).add(dest)
+            return sources
+
+        def meet(states):
+            # Must-analysis: a copy is available only if every processed path provides it
+            if not states:
+                return {}
+            merged = dict(min(states, key=len))
+            for state in states:
+                for dest in list(merged):
+                    if state.get(dest) != merged[dest]:
+                        del merged[dest]
+            return merged
+
+        def transfer(block, in_state):
+            copies = dict(in_state)
+            sources = index_sources(copies)
+            for instruction in block.instructions:
+                step(instruction, copies, sources)
+            return {dest: source for dest, source in copies.items() if dest in shared}
+
+        cfg = ControlFlowGraph(instructions)
+        shared = cfg.shared_symbols()
+        in_states = cfg.solve_forward(meet, transfer)
+
+        changed = False
+        result = []
+        for block, in_state in zip(cfg.blocks, in_states):
+            copies = dict(in_state or {})
+            sources = index_sources(copies)
+            for instruction in block.instructions:
+                if copies and instruction_uses(instruction):
+                    arg1 = copies.get(instruction.arg1, instruction.arg1)
+                    arg2 = copies.get(instruction.arg2, instruction.arg2)
+                    if (arg1, arg2) != (instruction.arg1, instruction.arg2):
+                        instruction = Instruction(instruction.opcode, instruction.dest, arg1, arg2)
+                        changed = True
+                step(instruction, copies, sources)
+                result.append(instruction)
+        return result, changed
+
+    def eliminate_dead_code(self, instructions, symbols):
+        """ Liveness-driven removal of assignments nobody reads, including self-assignments. """
+        cfg = ControlFlowGraph(instructions)
+        live_out = cfg.solve_liveness()
+        changed = False
+        for block, live in zip(cfg.blocks, live_out):
+            live = set(live)
+            kept = []
+            for instruction in reversed(block.instructions):
+                target = instruction_def(instruction)
+                if target is not None:
+                    removable = target not in live or (instruction.opcode == IR_COPY and instruction.arg1 == target)
+                    if removable and instruction.opcode == IR_BINARY['/']:
+                        # Keep divisions that might trap on a zero divisor
+                        removable = symbols.kinds[instruction.arg2] == SYM_CONSTANT and symbols.values[instruction.arg2] != 0
+                    if removable:
+                        changed = True
+                        continue
+                    live.discard(target)
+                live.update(instruction_uses(instruction))
+                kept.append(instruction)
+            kept.reverse()
+            block.instructions = kept
+        return cfg.instructions(), changed
+
+    def simplify_control_flow(self, instructions, symbols):
+        """ Drop unreachable blocks, gotos to the next label and labels nothing jumps to. """
+        cfg = ControlFlowGraph(instructions)
+        reachable = cfg.reachable()
+        live_code = [instruction for block, seen in zip(cfg.blocks, reachable) if seen
+                     for instruction in block.instructions]
+
+        # Remove unnecessary gotos to the next line (e.g., redundant jumps)
+        optimized_code = []
+        for i, instruction in enumerate(live_code):
+            if instruction.opcode == IR_GOTO and i + 1 < len(live_code):
+                following = live_code[i + 1]
+                if following.opcode == IR_LABEL and following.dest == instruction.dest:
+                    continue
+            optimized_code.append(instruction)
+
+        targets = {instruction.dest for instruction in optimized_code
+                   if instruction.opcode == IR_GOTO or instruction.opcode == IR_IF}
+        final_code = [instruction for instruction in optimized_code
+                      if instruction.opcode != IR_LABEL or instruction.dest in targets]
+        return final_code, len(final_code) != len(instructions)
+
+    def optimize_loops(self, instructions, symbols):
+        """ Loop-invariant code motion and strength reduction on every natural loop.
+
+        Both put code in a preheader, which runs once each time the loop is entered: it sits just
+        ahead of the header, and jumps into the loop from outside are sent to it. A computation
+        is hoisted there if it assigns a temp that nothing else assigns and that the header does
+        not read first, and the loop assigns none of its operands; a division only by a non-zero
+        constant, so that no trap is moved onto a path that skips the loop. Strength reduction
+        finds basic induction variables, whose only assignment in the loop is i = i + c or
+        i = i - c, and turns each i * k with an invariant k into a new temp, set to i * k in the
+        preheader and advanced by c * k right after each step of i. Loops enclosing one that
+        changed wait for the next round, in which the new preheader is part of them.
+        """
+        labels = {instruction.dest: position for position, instruction in enumerate(instructions)
+                  if instruction.opcode == IR_LABEL}
+        if not any((instruction.opcode == IR_GOTO or instruction.opcode == IR_IF)
+                   and labels.get(instruction.dest, position + 1) <= position
+                   for position, instruction in enumerate(instructions)):
+            return instructions, False  # every loop needs a backward jump
+
+        cfg = ControlFlowGraph(instructions)
+        live_out = cfg.solve_liveness()
+        definitions = Counter(instruction.dest if instruction.opcode == IR_DECLARE else instruction_def(instruction)
+                              for instruction in instructions)
+        preheaders = {}  # header block -> (preheader label or None, instructions)
+        replacements = {}  # id(instruction) -> the instructions it becomes
+        changed_blocks = set()
+        for header, body in cfg.natural_loops():
+            if body & changed_blocks:
+                continue
+            plan = self.plan_loop(cfg, header, body, live_out[header], definitions, symbols)
+            if plan is None:
+                continue
+            preheader, rewritten = plan
+            label = None
+            for predecessor in cfg.blocks[header].predecessors:
+                last = cfg.blocks[predecessor].instructions[-1]
+                if predecessor not in body and (last.opcode == IR_GOTO or last.opcode == IR_IF) and \
+                        last.dest == cfg.blocks[header].instructions[0].dest:
+                    label = label if label is not None else self.new_symbol(symbols, SYM_LABEL)
+                    replacements[id(last)] = [Instruction(last.opcode, label, last.arg1)]
+            preheaders[header] = (label, preheader)
+            replacements.update(rewritten)
+            changed_blocks |= body
+        if not preheaders:
+            return instructions, False
+
+        result = []
+        for block in cfg.blocks:
+            if block.index in preheaders:
+                label, preheader = preheaders[block.index]
+                if label is not None:
+                    result.append(Instruction(IR_LABEL, label))
+                result.extend(preheader)
+            for instruction in block.instructions:
+                rewritten = replacements.get(id(instruction))
+                result.extend([instruction] if rewritten is None else rewritten)
+        return result, True
+
+    def plan_loop(self, cfg, header, body, header_live_out, definitions, symbols):
+        """ (preheader instructions, {id(instruction): replacement}) for one loop, or None if nothing applies. """
+        kinds, values = symbols.kinds, symbols.values
+        blocks = cfg.blocks
+        first = blocks[header].instructions[0]
+        if first.opcode != IR_LABEL or header - 1 in body and blocks[header - 1].instructions[-1].opcode not in (
+                IR_GOTO, IR_RETURN):
+            return None  # no label to keep the back edges on, or a back edge falls into the header
+        loop = [(index, position, instruction) for index in sorted(body)
+                for position, instruction in enumerate(blocks[index].instructions)]
+        assigned = Counter(instruction.dest if instruction.opcode == IR_DECLARE else instruction_def(instruction)
+                           for _, _, instruction in loop)
+        read_first = set(header_live_out)  # what the header reads before assigning it
+        for instruction in reversed(blocks[header].instructions):
+            read_first.discard(instruction_def(instruction))
+            read_first.update(instruction_uses(instruction))
+
+        # Loop-invariant code motion, repeated so that computations on hoisted temps follow them out
+        hoisted, hoisted_targets = [], set()
+
+        def invariant(operand):
+            return kinds[operand] == SYM_CONSTANT or not assigned[operand] or operand in hoisted_targets
+
+        changed = True
+        while changed:
+            changed = False
+            for _, _, instruction in loop:
+                target = instruction_def(instruction)
+                if (target is None or target in hoisted_targets or kinds[target] != SYM_TEMP
+                        or definitions[target] != 1 or target in read_first
+                        or not all(map(invariant, instruction_uses(instruction)))):
+                    continue
+                if instruction.opcode == IR_BINARY['/'] and not (
+                        kinds[instruction.arg2] == SYM_CONSTANT and values[instruction.arg2] != 0):
+                    continue
+                hoisted.append(instruction)
+                hoisted_targets.add(target)
+                changed = True
+        rewritten = {id(instruction): [] for instruction in hoisted}
+
+        # Basic induction variables: (the instruction that steps them, the constant step)
+        sites = {}
+        for index, position, instruction in loop:
+            target = instruction_def(instruction)
+            if target is not None and assigned[target] == 1:
+                sites[target] = (index, position, instruction)
+        steps = {}
+        for variable, (index, position, instruction) in sites.items():
+            increment = instruction
+            if instruction.opcode == IR_COPY and instruction.arg1 in sites:
+                source_index, source_position, increment = sites[instruction.arg1]
+                if (source_index, kinds[instruction.arg1]) != (index, SYM_TEMP) or source_position > position \
+                        or definitions[instruction.arg1] != 1:
+                    continue
+            step = induction_step(increment, variable, kinds, values)
+            if step is not None:
+                steps[variable] = (instruction, step)
+
+        # Strength reduction of i * k to an addition per step of i
+        reduced = {}  # (variable, factor) -> the temp that tracks variable * factor
+        preheader = list(hoisted)
+        for _, _, instruction in loop:
+            if instruction.opcode != IR_BINARY['*'] or id(instruction) in rewritten:
+                continue
+            for variable, factor in ((instruction.arg1, instruction.arg2), (instruction.arg2, instruction.arg1)):
+                if variable in steps and invariant(factor):
+                    break
+            else:
+                continue
+            tracker = reduced.get((variable, factor))
+            if tracker is None:
+                step_instruction, step = steps[variable]
+                tracker = reduced[variable, factor] = self.new_symbol(symbols, SYM_TEMP)
+                preheader.append(Instruction(instruction.opcode, tracker, variable, factor))
+                if kinds[factor] == SYM_CONSTANT:
+                    advance = symbols.constant(step * values[factor])
+                else:
+                    advance = self.new_symbol(symbols, SYM_TEMP)
+                    preheader.append(Instruction(instruction.opcode, advance, factor, symbols.constant(step)))
+                following = rewritten.setdefault(id(step_instruction), [step_instruction])
+                following.append(Instruction(IR_BINARY['+'], tracker, tracker, advance))
+            rewritten[id(instruction)] = [Instruction(IR_COPY, instruction.dest, tracker)]
+        if not rewritten:
+            return None
+        return preheader, rewritten
+
+    def new_symbol(self, symbols, kind):
+        """ A temp or label (kind) whose name nothing in symbols uses yet. """
+        while True:
+            if kind == SYM_TEMP:
+                name = f"t{self.temp_counter}"
+                self.temp_counter += 1
+            else:
+                name = f"L{self.label_counter}"
+                self.label_counter += 1
+            if (kind, name) not in symbols.ids:
+                return symbols.intern(name, kind)
+
+    def generate_ir(self, ast):
+        # Generate initial IR
+        ir_code = super().generate_ir(ast)
+        # Apply optimizations
+        return self.optimize_ir(ir_code)
@@ -0,0 +1,28 @@
+""" The regex lexer lex() used before the generated DFA scanner, kept as its reference and benchmark.
+
+It lives apart from the lexer so that importing the lexer does not import and compile `re` patterns.
+"""
+import re
+
+from .lexer import token_patterns, report_lexical_error
+
+token_regex = re.compile('|'.join(f'(?P<{key}>{pattern})' for key, pattern in token_patterns.items()))
+token_regex_bytes = re.compile(token_regex.pattern.encode())
+
+def lex_regex(code, errors=None):
+    """ What lex() returned before the DFA scanner: the tokens of the token_regex alternation. """
+    return list(scan_tokens(code, errors=errors))
+
+def scan_tokens(text, regex=token_regex, errors=None):
+    """ Yield (kind, value) tokens for one in-memory chunk of source, by regex. """
+    for mo in regex.finditer(text):
+        kind = mo.lastgroup
+        if kind == 'WHITESPACE' or kind == 'COMMENT':
+            continue
+        value = mo.group()
+        if regex is token_regex_bytes:
+            value = value.decode()
+        if kind == 'MISMATCH':
+            report_lexical_error(value, errors, mo.start())
+            continue
+        yield (kind, value)
@@ -0,0 +1,204 @@
+""" Stage 3: the scoped symbol table and semantic analysis. """
+from array import array
+
+from .lexer import Diagnostic
+from .syntax import Module, NodeVisitor, Operator, Program
+
+def storage_name(name, depth):
+    """ Name a variable declared depth scopes in is stored under in the IR.
+
+    Variables visible at the same time have different depths, so x.1 can never be confused with
+    the x it shadows; the '.' keeps these names apart from anything a program can declare.
+    """
+    return name if depth == 0 else f"{name}.{depth}"
+
+class SymbolTable:
+    """ Block-scoped variables for one function.
+
+    Names are interned to dense name IDs, and each declared variable gets a dense symbol ID
+    with its name ID, type and scope depth in parallel arrays. visible maps a name ID to the
+    innermost symbol in scope, so a lookup is one dict probe for the name plus array indexing.
+    Opening a scope records a mark in an undo log; closing it restores the bindings its
+    declarations shadowed, so both cost nothing beyond the declarations made in between.
+    Redeclaring a name in the same scope updates that variable's type rather than adding one.
+    """
+    def __init__(self):
+        self.name_ids = {}
+        self.names = []
+        self.visible = array('i')       # name ID -> innermost symbol in scope, or -1
+        self.name_of = array('I')       # symbol -> name ID
+        self.types = []                 # symbol -> declared type name
+        self.depths = array('I')        # symbol -> scope depth (0 is the function body)
+        self.undo = []                  # (name ID, shadowed symbol) for every binding made
+        self.marks = []                 # undo log length when each open scope began
+
+    def intern(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+            self.visible.append(-1)
+        return name_id
+
+    def push_scope(self):
+        self.marks.append(len(self.undo))
+
+    def pop_scope(self):
+        mark = self.marks.pop()
+        undo, visible = self.undo, self.visible
+        while len(undo) > mark:
+            name_id, shadowed = undo.pop()
+            visible[name_id] = shadowed
+
+    def declare(self, name, var_type):
+        """ Bind name in the innermost scope; returns its symbol ID. """
+        name_id = self.intern(name)
+        symbol = self.visible[name_id]
+        depth = len(self.marks)
+        if symbol >= 0 and self.depths[symbol] == depth:
+            self.types[symbol] = var_type
+            return symbol
+        self.undo.append((name_id, symbol))
+        symbol = self.visible[name_id] = len(self.types)
+        self.name_of.append(name_id)
+        self.types.append(var_type)
+        self.depths.append(depth)
+        return symbol
+
+    def lookup(self, name):
+        """ Symbol ID name refers to here, or None if no declaration of it is in scope. """
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            return None
+        symbol = self.visible[name_id]
+        return symbol if symbol >= 0 else None
+
+    def storage(self, symbol):
+        return storage_name(self.names[self.name_of[symbol]], self.depths[symbol])
+
+    def __len__(self):
+        return len(self.types)
+
+class SemanticAnalyzer(NodeVisitor):
+    def __init__(self):
+        self.symbols = SymbolTable()
+        self.errors = []
+
+    def analyze(self, ast):
+        if isinstance(ast, Module):
+            self.visit_module(ast)
+        elif isinstance(ast, Program):
+            self.visit_program(ast)
+        return self.errors
+
+    def visit_module(self, node):
+        # Functions share no variables: each is checked against a symbol table of its own
+        self.check_functions([(function.name, function.token) for function in node.functions])
+        for function in node.functions:
+            self.symbols = SymbolTable()
+            self.visit_program(function)
+
+    def visit_program(self, node):
+        for statement in node.statements:
+            self.visit(statement)
+
+    def visit_statement(self, node):
+        self.visit(node)
+
+    def visit_declaration_statement(self, node):
+        var_type = node.var_type
+        variable = node.variable
+        self.symbols.declare(variable, var_type)
+
+        value_type = self.visit(node.value)
+        self.check_declaration(variable, var_type, value_type, node.token)
+
+    def visit_if_statement(self, node):
+        self.visit(node.condition)
+        # Each branch is a scope of its own: its declarations end with it
+        symbols = self.symbols
+        symbols.push_scope()
+        for stmt in node.then:
+            self.visit(stmt)
+        symbols.pop_scope()
+        symbols.push_scope()
+        for stmt in node.else_:
+            self.visit(stmt)
+        symbols.pop_scope()
+
+    def visit_while_statement(self, node):
+        self.visit(node.condition)
+        # The body is a scope of its own, like an if statement's branches
+        self.symbols.push_scope()
+        for stmt in node.body:
+            self.visit(stmt)
+        self.symbols.pop_scope()
+
+    def visit_return_statement(self, node):
+        self.visit(node.expression)
+
+    def visit_assignment_statement(self, node):
+        self.lookup(node.variable, node.token)
+        self.visit(node.value)
+
+    def visit_expression(self, node):
+        return self.visit(node)
+
+    def visit_identifier(self, node):
+        return self.lookup(node.name, node.token)
+
+    def visit_number(self, node):
+        return 'int'
+
+    def visit_operator(self, node):
+        # Post-order walk with an explicit stack: operands are checked left to right,
+        # each operator once both of its operand types are known
+        types, pending = [], [node]
+        while pending:
+            current = pending.pop()
+            if current.__class__ is Operator:
+                pending.append((current,))
+                pending.append(current.right)
+                pending.append(current.left)
+            elif current.__class__ is tuple:
+                right_type = types.pop()
+                types[-1] = self.check_operator(current[0].operator, types[-1], right_type, current[0].token)
+            else:
+                types.append(self.visit(current))
+        return types[0]
+
+    # Checks shared with SyntaxDirectedTranslator, which applies them without building nodes.
+    # token is the index of the token a diagnostic points at (see Diagnostic).
+
+    def resolve(self, name, token=None):
+        """ Symbol ID of the variable name refers to, reporting it if no declaration is in scope. """
+        symbol = self.symbols.lookup(name)
+        if symbol is None:
+            self.errors.append(Diagnostic(f"Semantic Error: Variable '{name}' used before declaration.", token))
+        return symbol
+
+    def lookup(self, name, token=None):
+        """ Type of a variable, reporting it if no declaration is in scope. """
+        symbol = self.resolve(name, token)
+        return None if symbol is None else self.symbols.types[symbol]
+
+    def check_functions(self, definitions):
+        """ Report every function defined again; definitions are (name, token) pairs in source order. """
+        defined = set()
+        for name, token in definitions:
+            if name in defined:
+                self.errors.append(Diagnostic(f"Semantic Error: Function '{name}' defined more than once.", token))
+            defined.add(name)
+        return self.errors
+
+    def check_declaration(self, variable, var_type, value_type, token=None):
+        if value_type != var_type:
+            self.errors.append(Diagnostic(f"Semantic Error: Type mismatch in declaration of '{variable}'.", token))
+
+    def check_operator(self, operator, left_type, right_type, token=None):
+        """ Result type of a binary operation, reporting mismatched operand types. """
+        if left_type != right_type:
+            self.errors.append(Diagnostic(
+                f"Semantic Error: Type mismatch in operation '{operator}' between '{left_type}' and '{right_type}'.",
+                token))
+        return left_type
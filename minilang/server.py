@@ -0,0 +1,308 @@
+""" The asyncio compile server, its pool workers, an asyncio client and the load generator. """
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import signal
+import tempfile
+import asyncio
+import concurrent.futures
+import hashlib
+
+from .lexer import SourceMap
+from .cache import CACHE_STAGES
+from .client import SERVER_LINE_LIMIT, SERVER_OUTPUTS
+from .driver import compile_source, failure_diagnostic, module_listing, worker_cache
+from .benchmark import generate_program
+
+def parse_request(line):
+    """ Decode and validate one request line, filling in defaults for the options it leaves out. """
+    try:
+        request = json.loads(line)
+    except (UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise ValueError(f"not a JSON request: {error}") from None
+    if not isinstance(request, dict) or not isinstance(request.get('source'), str):
+        raise ValueError("a request must be a JSON object with a 'source' string")
+    emit = request.setdefault('emit', ['assembly'])
+    if isinstance(emit, str):
+        emit = request['emit'] = [emit]
+    unknown = [output for output in emit if output not in SERVER_OUTPUTS]
+    if unknown or not emit:
+        raise ValueError(f"'emit' must list outputs from {', '.join(SERVER_OUTPUTS)}")
+    request.setdefault('optimize', True)
+    request.setdefault('registers', 4)
+    request.setdefault('fused', False)
+    if not isinstance(request['registers'], int) or request['registers'] < 2:
+        raise ValueError("'registers' must be an integer of at least 2")
+    return request
+
+def compile_request(job):
+    """ Server pool worker: compile a (request, options) job as far as its outputs need.
+
+    Returns the reply as a JSON object string, without the request id; encoding here keeps large
+    outputs off the server's event loop. Each requested stage is one compile_source() call, and
+    the worker's cache hands every call the stages the previous ones already ran.
+    """
+    request, options = job
+    start = time.perf_counter()
+    code, emit = request['source'], request['emit']
+    cache = worker_cache(options)
+    reply = {'failed': False}
+    diagnostics = []
+    result = {'errors': []}
+    try:
+        # Diagnostics alone need the front end; every other output needs its own stage
+        for until in sorted({output if output in CACHE_STAGES else 'ast' for output in emit}, key=CACHE_STAGES.index):
+            result = compile_source(code, request['optimize'], request['registers'], cache,
+                                    diagnostics=diagnostics, fused=request['fused'], until=until)
+            if until == 'tokens' and 'tokens' in emit:
+                reply['tokens'] = result['tokens']
+            elif until == 'ast' and 'ast' in emit:
+                reply['ast'] = result['ast'].to_dict()
+            elif until == 'ir':
+                reply['ir'] = module_listing([(ir_code.name, ir_code.to_text()) for ir_code in result['ir']])
+            elif until == 'assembly':
+                reply['assembly'] = result['assembly']
+        errors = result['errors']
+    except (SyntaxError, ValueError, ZeroDivisionError, RecursionError) as error:
+        reply['failed'] = True
+        errors = diagnostics + [failure_diagnostic(error)]
+    source_map = SourceMap(code)
+    reply['errors'] = [source_map.render(error) for error in errors]
+    reply['seconds'] = time.perf_counter() - start
+    try:
+        return json.dumps(reply)
+    except RecursionError:  # an AST too deep for the JSON encoder
+        return json.dumps({'failed': True, 'errors': ["RecursionError: AST too deeply nested to encode"],
+                           'seconds': reply['seconds']})
+
+class CompileServer:
+    """ Compile daemon answering newline-delimited JSON requests on a Unix socket.
+
+    A request is {"id": ..., "source": "...", "emit": [...], "optimize": ..., "registers": ..., "fused": ...};
+    emit picks any of SERVER_OUTPUTS and every key but source is optional. Each reply is one line
+    with the request's id, the outputs asked for, the rendered diagnostics, "failed" and the
+    worker's compile time in "seconds". Requests are read and answered concurrently by asyncio;
+    the compiling happens on a pool of worker processes that stay alive between requests, so the
+    generated scanner tables and their stage caches stay warm. Replies to repeated requests come
+    straight from a small cache in the server process.
+    """
+    def __init__(self, path, workers=None, cache_dir=None, cache_size=64 << 20, cache_entries=256):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.options = {'cache_dir': cache_dir, 'cache_size': cache_size, 'cache_entries': cache_entries}
+        self.cache_entries = cache_entries
+        self.replies = {}  # request hash -> reply without its id, least recently used first
+        self.pool = None
+        self.server = None
+        self.requests = self.reply_hits = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        # Start every worker now, so the first requests do not pay for process start-up
+        warm_up = (parse_request('{"source": "function main() { return 0; }"}'), self.options)
+        await asyncio.gather(*(loop.run_in_executor(self.pool, compile_request, warm_up)
+                               for _ in range(self.workers)))
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # a socket left behind by a server that did not shut down cleanly
+        self.server = await asyncio.start_unix_server(self.handle, self.path, limit=SERVER_LINE_LIMIT)
+
+    async def serve_forever(self):
+        await self.start()
+        with contextlib.suppress(NotImplementedError):  # shut down cleanly on SIGTERM where supported
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    async def handle(self, reader, writer):
+        """ Serve one connection; its requests run concurrently and replies go out as they finish. """
+        lock = asyncio.Lock()
+        pending = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self.respond(line, writer, lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ValueError, ConnectionError):  # a line over SERVER_LINE_LIMIT, or the client went away
+            pass
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def respond(self, line, writer, lock):
+        self.requests += 1
+        request_id = None
+        try:
+            request = parse_request(line)
+            request_id = request.pop('id', None)
+            key = hashlib.blake2b(json.dumps(request, sort_keys=True).encode('utf-8', 'surrogatepass'),
+                                  digest_size=16).digest()
+            body = self.replies.pop(key, None)
+            if body is None:
+                loop = asyncio.get_running_loop()
+                body = await loop.run_in_executor(self.pool, compile_request, (request, self.options))
+            else:
+                self.reply_hits += 1
+            self.replies[key] = body
+            while len(self.replies) > self.cache_entries:
+                del self.replies[next(iter(self.replies))]
+        except ValueError as error:
+            body = json.dumps({'failed': True, 'errors': [f"Bad request: {error}"]})
+        except Exception as error:  # a compiler bug or a dead worker must not leave the client waiting
+            body = json.dumps({'failed': True, 'errors': [f"Internal error: {type(error).__name__}: {error}"]})
+        # Splice the id into the cached body rather than decoding and re-encoding it
+        reply = f'{{"id": {json.dumps(request_id)}, {body[1:]}\n'
+        async with lock:
+            writer.write(reply.encode('utf-8', 'surrogatepass'))
+            await writer.drain()
+
+class CompileClient:
+    """ Client for a CompileServer. Requests on the one connection may be in flight together. """
+    def __init__(self, path):
+        self.path = path
+        self.reader = self.writer = self.receiver = None
+        self.waiting = {}  # request id -> future for its reply
+        self.next_id = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=SERVER_LINE_LIMIT)
+        self.receiver = asyncio.create_task(self.receive())
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        self.writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self.writer.wait_closed()
+        await asyncio.gather(self.receiver, return_exceptions=True)
+
+    async def receive(self):
+        try:
+            while line := await self.reader.readline():
+                reply = json.loads(line)
+                future = self.waiting.pop(reply['id'], None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("compile server closed the connection"))
+            self.waiting.clear()
+
+    async def compile(self, source, emit=('assembly',), **options):
+        """ Send one request and wait for its reply; options are optimize, registers and fused. """
+        request_id = self.next_id = self.next_id + 1
+        future = self.waiting[request_id] = asyncio.get_running_loop().create_future()
+        request = {'id': request_id, 'source': source, 'emit': list(emit), **options}
+        self.writer.write(json.dumps(request).encode('utf-8', 'surrogatepass') + b'\n')
+        await self.writer.drain()
+        return await future
+
+def latency_percentiles(latencies, points=(50, 90, 99)):
+    """ Nearest-rank percentiles of a list of latencies, plus the maximum. """
+    ordered = sorted(latencies)
+    if not ordered:
+        return {}
+    summary = {f"p{point}": ordered[max(0, -(-point * len(ordered) // 100) - 1)] for point in points}
+    summary['max'] = ordered[-1]
+    return summary
+
+async def load_test(path, sources, requests=1000, concurrency=16, emit=('assembly',)):
+    """ Send requests from concurrency clients, each waiting for one reply before its next request.
+
+    Requests cycle through sources. Returns the client-side latencies, failures and throughput.
+    """
+    latencies = []
+    failed = 0
+    issued = iter(range(requests))
+
+    async def client():
+        nonlocal failed
+        async with CompileClient(path) as connection:
+            for index in issued:
+                start = time.perf_counter()
+                reply = await connection.compile(sources[index % len(sources)], emit)
+                latencies.append(time.perf_counter() - start)
+                failed += reply['failed']
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {'requests': len(latencies), 'failed': failed, 'seconds': elapsed,
+            'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+            'latency': latency_percentiles(latencies)}
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(description="Serve compile requests on a Unix socket.")
+    parser.add_argument('socket', help="path of the Unix socket to listen on")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--cache-dir', help="also keep stage outputs in this on-disk cache")
+    parser.add_argument('--cache-size', type=int, default=64, help="on-disk cache size limit in MiB (default: 64)")
+    parser.add_argument('--cache-entries', type=int, default=256,
+                        help="artifacts kept in each worker, and replies kept by the server (default: 256)")
+    args = parser.parse_args(argv)
+    server = CompileServer(args.socket, args.jobs, args.cache_dir, args.cache_size << 20, args.cache_entries)
+    print(f"Serving compile requests on {args.socket} with {server.workers} worker(s)", file=sys.stderr)
+    with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError):
+        asyncio.run(server.serve_forever())
+    return 0
+
+def load_test_main(argv):
+    parser = argparse.ArgumentParser(description="Measure compile server latency under concurrent load.")
+    parser.add_argument('--socket', help="server to test (default: start one on a temporary socket)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes for the started server")
+    parser.add_argument('--requests', type=int, default=2000, help="requests to send (default: 2000)")
+    parser.add_argument('--concurrency', type=int, default=16, help="clients sending at once (default: 16)")
+    parser.add_argument('--distinct', type=int, default=100,
+                        help="different generated programs the requests cycle through (default: 100)")
+    parser.add_argument('--statements', type=int, default=30, help="statements per generated program")
+    parser.add_argument('--emit', default='assembly',
+                        help=f"comma-separated outputs to request: {', '.join(SERVER_OUTPUTS)}")
+    args = parser.parse_args(argv)
+    sources = [generate_program(statements=args.statements, declarations=5, seed=seed)
+               for seed in range(args.distinct)]
+    emit = [output.strip() for output in args.emit.split(',') if output.strip()]
+
+    async def run():
+        if args.socket:
+            return await load_test(args.socket, sources, args.requests, args.concurrency, emit), None
+        with tempfile.TemporaryDirectory() as directory:
+            server = CompileServer(os.path.join(directory, 'compile.sock'), args.jobs)
+            await server.start()
+            try:
+                return await load_test(server.path, sources, args.requests, args.concurrency, emit), server
+            finally:
+                await server.close()
+
+    results, server = asyncio.run(run())
+    latency = ', '.join(f"{name} {seconds * 1000:.2f} ms" for name, seconds in results['latency'].items())
+    print(f"{results['requests']} requests from {args.concurrency} client(s) in {results['seconds']:.2f}s: "
+          f"{results['requests_per_second']:.0f} requests/s, {results['failed']} failed")
+    print(f"Latency: {latency}")
+    if server is not None:
+        print(f"Server: {server.workers} worker(s), {server.reply_hits} of {server.requests} replies from its cache")
+    return 1 if results['failed'] else 0
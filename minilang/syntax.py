@@ -0,0 +1,420 @@
+""" Stage 2: AST nodes and the recursive-descent parser. """
+import sys
+from collections import deque
+
+from .lexer import Diagnostic, TOKEN_KINDS
+
+class Node:
+    """ Base class for AST nodes. Subclasses declare __slots__ and the dict keys to_dict() emits.
+
+    token, for the nodes semantic analysis reports on, is the index of the node's token in
+    the token stream (see Diagnostic). It is not one of a subclass's own __slots__, so it is
+    left out of to_dict(), equality and repr().
+    """
+    __slots__ = ('token',)
+    type = None  # Value of the 'type' key in to_dict()
+    fields = ()  # Dict keys, in output order, matching __slots__
+    visit_method = 'generic_visit'
+
+    def to_dict(self):
+        node = {'type': self.type}
+        for key, slot in zip(self.fields, self.__slots__):
+            node[key] = node_to_dict(getattr(self, slot))
+        return node
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        args = ', '.join(repr(getattr(self, slot)) for slot in self.__slots__)
+        return f"{type(self).__name__}({args})"
+
+def node_to_dict(value):
+    if isinstance(value, Node):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [node_to_dict(item) for item in value]
+    return value
+
+def count_nodes(node):
+    """ Number of AST nodes in the tree rooted at node. """
+    count, pending = 0, [node]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, Node):
+            count += 1
+            pending.extend(getattr(value, slot) for slot in value.__slots__)
+        elif isinstance(value, list):
+            pending.extend(value)
+    return count
+
+class Program(Node):
+    __slots__ = ('name', 'statements')
+    type, fields, visit_method = 'program', __slots__, 'visit_program'
+
+    def __init__(self, name, statements, token=None):
+        self.name = name
+        self.statements = statements
+        self.token = token
+
+class Module(Node):
+    """ A source file: its functions, in source order. """
+    __slots__ = ('functions',)
+    type, fields, visit_method = 'module', __slots__, 'visit_module'
+
+    def __init__(self, functions):
+        self.functions = functions
+
+class DeclarationStatement(Node):
+    __slots__ = ('var_type', 'variable', 'value')
+    type, fields, visit_method = 'declaration', __slots__, 'visit_declaration_statement'
+
+    def __init__(self, var_type, variable, value, token=None):
+        self.var_type = var_type
+        self.variable = variable
+        self.value = value
+        self.token = token
+
+class IfStatement(Node):
+    __slots__ = ('condition', 'then', 'else_')
+    type, fields, visit_method = 'if', ('condition', 'then', 'else'), 'visit_if_statement'
+
+    def __init__(self, condition, then, else_):
+        self.condition = condition
+        self.then = then
+        self.else_ = else_
+
+class WhileStatement(Node):
+    __slots__ = ('condition', 'body')
+    type, fields, visit_method = 'while', __slots__, 'visit_while_statement'
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class ReturnStatement(Node):
+    __slots__ = ('expression',)
+    type, fields, visit_method = 'return', __slots__, 'visit_return_statement'
+
+    def __init__(self, expression):
+        self.expression = expression
+
+class AssignmentStatement(Node):
+    __slots__ = ('variable', 'value')
+    type, fields, visit_method = 'assignment', __slots__, 'visit_assignment_statement'
+
+    def __init__(self, variable, value, token=None):
+        self.variable = variable
+        self.value = value
+        self.token = token
+
+class Operator(Node):
+    __slots__ = ('operator', 'left', 'right')
+    type, fields, visit_method = 'operator', __slots__, 'visit_operator'
+
+    def __init__(self, operator, left, right, token=None):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.token = token
+
+class Identifier(Node):
+    __slots__ = ('name',)
+    type, fields, visit_method = 'identifier', __slots__, 'visit_identifier'
+
+    def __init__(self, name, token=None):
+        self.name = name
+        self.token = token
+
+class Number(Node):
+    __slots__ = ('value',)
+    type, fields, visit_method = 'number', __slots__, 'visit_number'
+
+    def __init__(self, value):
+        self.value = value
+
+NODE_CLASSES = (Module, Program, DeclarationStatement, IfStatement, WhileStatement, ReturnStatement,
+                AssignmentStatement, Operator, Identifier, Number)
+
+class NodeVisitor:
+    """ Dispatches visit(node) through a table from node class to visit_* method.
+
+    The table is built once per visitor subclass, so overriding a visit_* method
+    in a subclass is picked up without any per-node name lookups.
+    """
+    dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = {node_class: getattr(cls, node_class.visit_method, cls.generic_visit)
+                        for node_class in NODE_CLASSES}
+        cls.dispatch[type(None)] = cls.generic_visit
+
+    def visit(self, node):
+        return self.dispatch[node.__class__](self, node)
+
+    def generic_visit(self, node):
+        return None
+
+class Parser:
+    # Token kinds as the grammar compares them; PackedParser swaps in integer codes
+    KEYWORD, IDENTIFIER, NUMBER, OPERATOR, DELIMITER = TOKEN_KINDS
+    # Binding power of each binary operator; higher binds tighter
+    PRECEDENCE = {'=': 1, '!': 1, '<': 1, '>': 1, '+': 2, '-': 2, '*': 3, '/': 3}
+
+    def __init__(self, tokens):
+        # tokens may be a list or any iterator (e.g. lex_stream); only a small
+        # lookahead window is ever held in memory
+        self.token_stream = iter(tokens)
+        self.lookahead = deque()
+        self.pos = 0
+
+    def peek(self, offset=0):
+        while len(self.lookahead) <= offset:
+            token = next(self.token_stream, None)
+            if token is None:
+                return None
+            self.lookahead.append(token)
+        return self.lookahead[offset]
+
+    def current_token(self):
+        return self.peek()
+
+    def current_kind(self):
+        token = self.peek()
+        return token[0] if token else None
+
+    def current_value(self):
+        token = self.peek()
+        return token[1] if token else None
+
+    def eat(self, token_type):
+        token = self.current_token()
+        if token and token[0] == token_type:
+            self.lookahead.popleft()
+            self.pos += 1
+            return token
+        return None
+
+    def eat_value(self, token_type):
+        token = self.eat(token_type)
+        return token[1] if token else None
+
+    def parse_program(self):
+        keyword = self.eat_value(self.KEYWORD)
+        if keyword == 'function':
+            self.eat(self.KEYWORD)
+            token = self.pos
+            name = self.eat_value(self.IDENTIFIER)
+            self.eat(self.DELIMITER)
+            self.eat(self.DELIMITER)
+            self.eat(self.DELIMITER)
+            
+            statements = self.parse_statements()
+            self.eat(self.DELIMITER)
+            return Program(name, statements, token)
+        return None
+
+    def parse_module(self):
+        """ Parse function definitions up to the end of the input; None if it does not start with one. """
+        functions = []
+        while self.current_kind() is not None:
+            if functions and self.current_value() != 'function':
+                raise SyntaxError(Diagnostic(f"Expected a function definition, found {self.current_token()}",
+                                             self.pos))
+            function = self.parse_program()
+            if function is None:
+                return None
+            functions.append(function)
+        return Module(functions) if functions else None
+
+    def parse_statements(self):
+        statements = []
+        kind = self.current_kind()
+        while kind is not None and kind != self.DELIMITER:
+            statement = self.parse_statement()
+            if not statement:
+                # Nothing was consumed; stop instead of looping on the same token forever
+                raise SyntaxError(Diagnostic(f"Unexpected token in statement: {self.current_token()}", self.pos))
+            statements.append(statement)
+            kind = self.current_kind()
+        return statements
+
+    def parse_statement(self):
+        kind = self.current_kind()
+        if kind is None:
+            return None
+        value = self.current_value()
+
+        if kind == self.IDENTIFIER and value in ['int', 'float', 'string']:
+            return self.parse_declaration_statement()
+        if value == 'if':
+            return self.parse_if_statement()
+        if value == 'while':
+            return self.parse_while_statement()
+        if value == 'return':
+            return self.parse_return_statement()
+        if kind == self.IDENTIFIER:
+            return self.parse_assignment_statement()
+        return None
+
+    def parse_declaration_statement(self):
+        var_type = self.eat_value(self.IDENTIFIER)
+        token = self.pos
+        variable = self.eat_value(self.IDENTIFIER)
+        self.eat(self.OPERATOR)
+        value = self.parse_expression()
+        self.eat(self.DELIMITER)
+        return DeclarationStatement(var_type, variable, value, token)
+
+    def parse_if_statement(self):
+        self.eat(self.KEYWORD)
+        self.eat(self.DELIMITER)
+        condition = self.parse_expression()
+        self.eat(self.DELIMITER)
+        self.eat(self.DELIMITER)
+        then_block = self.parse_statements()
+        self.eat(self.DELIMITER)
+        self.eat(self.KEYWORD)
+        self.eat(self.DELIMITER)
+        else_block = self.parse_statements()
+        self.eat(self.DELIMITER)
+        return IfStatement(condition, then_block, else_block)
+
+    def parse_while_statement(self):
+        self.eat(self.KEYWORD)
+        self.eat(self.DELIMITER)
+        condition = self.parse_expression()
+        self.eat(self.DELIMITER)
+        self.eat(self.DELIMITER)
+        body = self.parse_statements()
+        self.eat(self.DELIMITER)
+        return WhileStatement(condition, body)
+
+    def parse_return_statement(self):
+        self.eat(self.KEYWORD)
+        expression = self.parse_expression()
+        self.eat(self.DELIMITER)
+        return ReturnStatement(expression)
+
+    def parse_assignment_statement(self):
+        token = self.pos
+        variable = self.eat_value(self.IDENTIFIER)
+        self.eat(self.OPERATOR)
+        value = self.parse_expression()
+        self.eat(self.DELIMITER)
+        return AssignmentStatement(variable, value, token)
+
+    def parse_expression(self):
+        """ Operator-precedence (shunting-yard) parse using explicit operand and operator stacks.
+
+        Binary operators are left-associative; '*' and '/' bind tighter than '+' and '-',
+        which bind tighter than the comparisons. Nothing recurses, so neither parenthesis
+        depth nor chain length is bounded by the interpreter's recursion limit.
+        """
+        operands, operators = [], []  # operators holds operator lexemes and '(' markers
+        positions = []  # token index of each entry in operators
+        current_kind, eat_value = self.current_kind, self.eat_value
+        IDENTIFIER, NUMBER, OPERATOR, DELIMITER = self.IDENTIFIER, self.NUMBER, self.OPERATOR, self.DELIMITER
+        precedence_of = self.PRECEDENCE
+        depth = 0
+        while True:
+            # Operand position: any number of opening parentheses, then a term
+            kind = current_kind()
+            while kind == DELIMITER and self.current_value() == '(':
+                self.eat(DELIMITER)
+                operators.append('(')
+                positions.append(None)
+                depth += 1
+                kind = current_kind()
+            # parse_term(), inlined: this loop runs once per operand
+            if kind == IDENTIFIER:
+                token = self.pos
+                operands.append(Identifier(eat_value(IDENTIFIER), token))
+            elif kind == NUMBER:
+                operands.append(Number(eat_value(NUMBER)))
+            else:
+                raise SyntaxError(Diagnostic(f"Expected an expression, found {self.current_token()}", self.pos))
+
+            # Operator position: close parentheses, then continue with a binary operator or stop
+            kind = current_kind()
+            while depth and kind == DELIMITER and self.current_value() == ')':
+                self.eat(DELIMITER)
+                operator = operators.pop()
+                while operator != '(':
+                    right = operands.pop()
+                    operands[-1] = Operator(operator, operands[-1], right, positions.pop())
+                    operator = operators.pop()
+                positions.pop()
+                depth -= 1
+                kind = current_kind()
+            if kind != OPERATOR:
+                break
+            token = self.pos
+            operator = eat_value(OPERATOR)
+            precedence = precedence_of[operator]
+            while operators and operators[-1] != '(' and precedence_of[operators[-1]] >= precedence:
+                right = operands.pop()
+                operands[-1] = Operator(operators.pop(), operands[-1], right, positions.pop())
+            operators.append(operator)
+            positions.append(token)
+
+        # Like a missing delimiter elsewhere, an unclosed '(' is closed where the expression ends
+        while operators:
+            operator = operators.pop()
+            token = positions.pop()
+            if operator != '(':
+                right = operands.pop()
+                operands[-1] = Operator(operator, operands[-1], right, token)
+        return operands[0]
+
+    def parse_term(self):
+        kind = self.current_kind()
+        if kind == self.IDENTIFIER:
+            token = self.pos
+            return Identifier(self.eat_value(self.IDENTIFIER), token)
+        elif kind == self.NUMBER:
+            return Number(self.eat_value(self.NUMBER))
+        return None
+
+class PackedParser(Parser):
+    """ Parser fast path over a TokenBuffer: kind checks are integer compares on the packed array. """
+    KEYWORD, IDENTIFIER, NUMBER, OPERATOR, DELIMITER = range(len(TOKEN_KINDS))
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.kinds = buffer.kinds
+        self.count = len(buffer)
+        self.pos = 0
+        if isinstance(buffer.source, str):
+            # Bypass TokenBuffer.lexeme()'s decode step for text sources
+            source, starts, ends, intern = buffer.source, buffer.starts, buffer.ends, sys.intern
+            self.lexeme = lambda index: intern(source[starts[index]:ends[index]])
+        else:
+            self.lexeme = buffer.lexeme
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.buffer[index] if index < self.count else None
+
+    def current_kind(self):
+        return self.kinds[self.pos] if self.pos < self.count else None
+
+    def current_value(self):
+        return self.lexeme(self.pos) if self.pos < self.count else None
+
+    def eat(self, token_type):
+        # Returns True rather than a token so that discarded punctuation never builds a lexeme
+        pos = self.pos
+        if pos < self.count and self.kinds[pos] == token_type:
+            self.pos = pos + 1
+            return True
+        return None
+
+    def eat_value(self, token_type):
+        pos = self.pos
+        if pos < self.count and self.kinds[pos] == token_type:
+            self.pos = pos + 1
+            return self.lexeme(pos)
+        return None
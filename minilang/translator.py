@@ -0,0 +1,257 @@
+""" Single-pass front end: parsing, checking and IR generation without an AST. """
+
+from .lexer import Diagnostic
+from .syntax import Parser
+from .semantic import SemanticAnalyzer, SymbolTable
+from .ir import IR_COPY, IR_DECLARE, IR_GOTO, IR_IF, IR_RETURN, IntermediateCodeGenerator
+
+class SyntaxDirectedTranslator(Parser):
+    """ Single-pass front end: checks and emits IR for each construct as it is parsed.
+
+    No AST is built. parse_program() returns the IRCode, and analyzer.errors holds the
+    semantic errors. Both match what SemanticAnalyzer and IntermediateCodeGenerator
+    produce from Parser's tree, down to error order, symbol IDs and temporary numbering.
+    Apart from the IR it emits and the symbol table, it holds only the current
+    expression's operator stacks and one stack frame per enclosing if or while statement.
+    Over lex_stream() the tokens are never materialized either.
+    """
+    def __init__(self, tokens):
+        super().__init__(tokens)
+        self.analyzer = SemanticAnalyzer()
+        self.start_function()
+
+    def start_function(self):
+        """ A fresh generator and symbol table for the next function; analyzer.errors carries on. """
+        self.generator = IntermediateCodeGenerator()
+        # Both halves see the same declarations in the same order, so they can share one table
+        self.scopes = self.generator.scopes = self.analyzer.symbols = SymbolTable()
+
+    def finish(self):
+        """ Lex whatever follows the program, so every lexical error is reported; returns the token count. """
+        return self.pos + len(self.lookahead) + sum(1 for _ in self.token_stream)
+
+    def parse_program(self):
+        keyword = self.eat_value(self.KEYWORD)
+        if keyword == 'function':
+            self.eat(self.KEYWORD)
+            self.generator.ir_code.name = self.eat_value(self.IDENTIFIER)
+            self.eat(self.DELIMITER)
+            self.eat(self.DELIMITER)
+            self.eat(self.DELIMITER)
+
+            self.parse_statements()
+            self.eat(self.DELIMITER)
+            return self.generator.ir_code
+        return None
+
+    def parse_module(self):
+        """ Parser.parse_module, translating: returns an IRCode per function, or None.
+
+        Each function gets IR and a symbol table of its own, as IntermediateCodeGenerator and
+        SemanticAnalyzer.visit_module give it, and functions defined twice are reported ahead
+        of the other errors, as visit_module reports them.
+        """
+        functions, definitions = [], []
+        errors = self.analyzer.errors
+        while self.current_kind() is not None:
+            if functions:
+                if self.current_value() != 'function':
+                    raise SyntaxError(Diagnostic(f"Expected a function definition, found {self.current_token()}",
+                                                 self.pos))
+                self.start_function()
+            token = self.pos + 1  # the name after 'function'
+            ir_code = self.parse_program()
+            if ir_code is None:
+                return None
+            functions.append(ir_code)
+            definitions.append((ir_code.name, token))
+        errors[:0] = SemanticAnalyzer().check_functions(definitions)
+        return functions or None
+
+    def parse_statements(self):
+        # Parser.parse_statements without collecting the statements
+        kind = self.current_kind()
+        while kind is not None and kind != self.DELIMITER:
+            if not self.parse_statement():
+                raise SyntaxError(Diagnostic(f"Unexpected token in statement: {self.current_token()}", self.pos))
+            kind = self.current_kind()
+
+    def parse_declaration_statement(self):
+        generator, symbols, emit = self.generator, self.generator.symbols, self.generator.ir_code.emit
+        var_type = self.eat_value(self.IDENTIFIER)
+        token = self.pos
+        variable = self.eat_value(self.IDENTIFIER)
+        self.eat(self.OPERATOR)
+        symbol = generator.declare_variable(variable, var_type)
+        emit(IR_DECLARE, symbol, symbols.type_name(var_type))
+        term, value, value_type = self.parse_expression()
+        if term is not None and term[0] == self.NUMBER:
+            # A lone number is copied through a temporary allocated before the constant is interned
+            temp = generator.generate_temp()
+            emit(IR_COPY, temp, symbols.constant(term[1]))
+            generator.assign(symbol, temp)
+            value_type = 'int'
+        else:
+            if term is not None:
+                value, value_type = self.resolve(term)
+            generator.assign(symbol, value)
+        self.analyzer.check_declaration(variable, var_type, value_type, token)
+        self.eat(self.DELIMITER)
+        return True
+
+    def parse_if_statement(self):
+        generator = self.generator
+        emit = generator.ir_code.emit
+        self.eat(self.KEYWORD)
+        self.eat(self.DELIMITER)
+        condition = self.parse_value()
+        self.eat(self.DELIMITER)
+        self.eat(self.DELIMITER)
+        true_label = generator.generate_label()
+        false_label = generator.generate_label()
+        emit(IR_IF, true_label, condition)
+        emit(IR_GOTO, false_label)
+        generator.start_block(true_label)
+        self.scopes.push_scope()
+        self.parse_statements()
+        self.scopes.pop_scope()
+        self.eat(self.DELIMITER)
+        self.eat(self.KEYWORD)
+        self.eat(self.DELIMITER)
+        emit(IR_GOTO, false_label)
+        generator.start_block(false_label)
+        self.scopes.push_scope()
+        self.parse_statements()
+        self.scopes.pop_scope()
+        self.eat(self.DELIMITER)
+        return True
+
+    def parse_while_statement(self):
+        generator = self.generator
+        emit = generator.ir_code.emit
+        start_label = generator.generate_label()
+        body_label = generator.generate_label()
+        end_label = generator.generate_label()
+        generator.start_block(start_label)
+        self.eat(self.KEYWORD)
+        self.eat(self.DELIMITER)
+        condition = self.parse_value()
+        self.eat(self.DELIMITER)
+        self.eat(self.DELIMITER)
+        emit(IR_IF, body_label, condition)
+        emit(IR_GOTO, end_label)
+        generator.start_block(body_label)
+        self.scopes.push_scope()
+        self.parse_statements()
+        self.scopes.pop_scope()
+        self.eat(self.DELIMITER)
+        emit(IR_GOTO, start_label)
+        generator.start_block(end_label)
+        return True
+
+    def parse_return_statement(self):
+        self.eat(self.KEYWORD)
+        self.generator.ir_code.emit(IR_RETURN, None, self.parse_value())
+        self.eat(self.DELIMITER)
+        return True
+
+    def parse_assignment_statement(self):
+        token = self.pos
+        variable = self.eat_value(self.IDENTIFIER)
+        self.analyzer.lookup(variable, token)
+        self.eat(self.OPERATOR)
+        value = self.parse_value()
+        self.generator.assign(self.generator.variable(variable), value)
+        self.eat(self.DELIMITER)
+        return True
+
+    def parse_value(self):
+        """ Translate an expression; returns the symbol ID holding its value. """
+        term, value, _ = self.parse_expression()
+        if term is not None:
+            value, _ = self.resolve(term)
+        return value
+
+    def resolve(self, term):
+        """ Check and intern a (kind, lexeme, token) term as visit_identifier/visit_number would; returns (symbol, type). """
+        kind, lexeme, token = term
+        if kind == self.IDENTIFIER:
+            symbol = self.analyzer.resolve(lexeme, token)
+            if symbol is None:
+                return self.generator.symbols.variable(lexeme), None
+            return self.generator.symbols.variable(self.scopes.storage(symbol)), self.scopes.types[symbol]
+        return self.generator.symbols.constant(lexeme), 'int'
+
+    def parse_expression(self):
+        """ Translate an expression with Parser.parse_expression's grammar; returns (term, value, type).
+
+        Operands are checked and interned and operators lowered in the post-order the
+        tree walkers use. A lone term comes back unresolved as (kind, lexeme, token), for the
+        caller to resolve (see parse_declaration_statement); otherwise term is None.
+        """
+        operands, operators = [], []  # operands are (symbol, type) pairs, except a pending term on top
+        positions = []  # token index of each entry in operators
+        pending = False
+        current_kind, eat_value = self.current_kind, self.eat_value
+        IDENTIFIER, NUMBER, OPERATOR, DELIMITER = self.IDENTIFIER, self.NUMBER, self.OPERATOR, self.DELIMITER
+        precedence_of = self.PRECEDENCE
+        binary = self.generator.binary
+        check_operator = self.analyzer.check_operator
+
+        def reduce(operator):
+            nonlocal pending
+            if pending:
+                operands[-1] = self.resolve(operands[-1])
+                pending = False
+            right_value, right_type = operands.pop()
+            left_value, left_type = operands[-1]
+            operands[-1] = (binary(operator, left_value, right_value), check_operator(operator, left_type, right_type, positions.pop()))
+
+        depth = 0
+        while True:
+            kind = current_kind()
+            while kind == DELIMITER and self.current_value() == '(':
+                self.eat(DELIMITER)
+                operators.append('(')
+                positions.append(None)
+                depth += 1
+                kind = current_kind()
+            if kind != IDENTIFIER and kind != NUMBER:
+                raise SyntaxError(Diagnostic(f"Expected an expression, found {self.current_token()}", self.pos))
+            token = self.pos
+            operands.append((kind, eat_value(kind), token))
+            pending = True
+
+            kind = current_kind()
+            while depth and kind == DELIMITER and self.current_value() == ')':
+                self.eat(DELIMITER)
+                operator = operators.pop()
+                while operator != '(':
+                    reduce(operator)
+                    operator = operators.pop()
+                positions.pop()
+                depth -= 1
+                kind = current_kind()
+            if kind != OPERATOR:
+                break
+            token = self.pos
+            operator = eat_value(OPERATOR)
+            if pending:
+                # The left operand is visited before anything to its right
+                operands[-1] = self.resolve(operands[-1])
+                pending = False
+            precedence = precedence_of[operator]
+            while operators and operators[-1] != '(' and precedence_of[operators[-1]] >= precedence:
+                reduce(operators.pop())
+            operators.append(operator)
+            positions.append(token)
+
+        while operators:
+            operator = operators.pop()
+            if operator != '(':
+                reduce(operator)
+            else:
+                positions.pop()
+        if pending:
+            return operands[0], None, None
+        return (None,) + operands[0]
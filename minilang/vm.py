@@ -0,0 +1,296 @@
+""" Stage 7: the virtual machine that runs IR, assembly and object files. """
+import time
+import operator
+
+from .ir import (IR_BINARY, IR_COPY, IR_GOTO, IR_IF, IR_LABEL, IR_OPERATOR, IR_RETURN,
+                 IntermediateCodeGenerator, SYM_CONSTANT, divide)
+from .optimizer import OptimizedIntermediateCodeGenerator
+from .backend import ASSEMBLY_MNEMONICS, AssemblyCodeGenerator, JUMP_TARGET, register_name
+from .objfile import OBJECT_OPCODES, OPERAND_BIG_CONSTANT, OPERAND_CONSTANT, OPERAND_LABEL, OPERAND_REGISTER
+
+def vm_divide(left, right):
+    quotient = divide(left, right)
+    if quotient is None:
+        raise ZeroDivisionError("Division by zero")
+    return quotient
+
+# Runtime operation for every IR opcode / assembly mnemonic that computes a value
+VM_OPERATIONS = {
+    IR_BINARY['+']: operator.add,
+    IR_BINARY['-']: operator.sub,
+    IR_BINARY['*']: operator.mul,
+    IR_BINARY['/']: vm_divide,
+    IR_BINARY['=']: lambda a, b: int(a == b),
+    IR_BINARY['<']: lambda a, b: int(a < b),
+    IR_BINARY['>']: lambda a, b: int(a > b),
+    IR_BINARY['!']: lambda a, b: int(a != b),
+}
+VM_OPERATIONS.update({ASSEMBLY_MNEMONICS[opcode]: operation for opcode, operation in list(VM_OPERATIONS.items())})
+
+# Branch conditions on the flag slot written by CMP (-1, 0 or 1)
+VM_BRANCH_TESTS = {
+    'IFGT': lambda flag: flag > 0,
+    'IFLT': lambda flag: flag < 0,
+    'IFEQ': lambda flag: flag == 0,
+    'IFNE': lambda flag: flag != 0,
+    'IFGE': lambda flag: flag >= 0,
+    'IFLE': lambda flag: flag <= 0,
+}
+
+# Slots every program reserves ahead of its variables, registers and constants
+VM_RESULT, VM_RETURNED, VM_FLAG = range(3)
+
+def vm_move(dest, source, _):
+    def move(slots, pc):
+        slots[dest] = slots[source]
+        return pc + 1
+    return move
+
+def vm_binary(operation):
+    def factory(dest, left, right):
+        def binary(slots, pc):
+            slots[dest] = operation(slots[left], slots[right])
+            return pc + 1
+        return binary
+    return factory
+
+def vm_compare(left, right, _):
+    def compare(slots, pc):
+        a, b = slots[left], slots[right]
+        slots[VM_FLAG] = (a > b) - (a < b)
+        return pc + 1
+    return compare
+
+def vm_branch(test):
+    def factory(slot, target, _):
+        def branch(slots, pc):
+            return target if test(slots[slot]) else pc + 1
+        return branch
+    return factory
+
+def vm_jump(target, _, __):
+    def jump(slots, pc):
+        return target
+    return jump
+
+def vm_return(source, end, _):
+    def return_(slots, pc):
+        slots[VM_RESULT] = slots[source]
+        slots[VM_RETURNED] = 1
+        return end
+    return return_
+
+# Handler table: VM operation name -> factory binding resolved operands into a closure
+VM_HANDLERS = {
+    'MOVE': vm_move,
+    'COMPARE': vm_compare,
+    'JUMP': vm_jump,
+    'RETURN': vm_return,
+}
+VM_HANDLERS.update({('BINARY', key): vm_binary(operation) for key, operation in VM_OPERATIONS.items()})
+VM_HANDLERS.update({('BRANCH', mnemonic): vm_branch(test) for mnemonic, test in VM_BRANCH_TESTS.items()})
+
+class VMProgram:
+    """ Executable form of IR or assembly: precompiled handler closures plus the initial slot array. """
+    def __init__(self, code, initial_slots, slot_names):
+        self.code = code
+        self.initial_slots = initial_slots
+        self.slot_names = slot_names
+
+class VMLoader:
+    """ Resolves operand names to slot indexes and labels to instruction indexes while building a VMProgram. """
+    def __init__(self):
+        self.slot_names = ['<result>', '<returned>', '<flag>']
+        self.initial_slots = [0, 0, 0]
+        self.slot_ids = {}
+        self.operations = []  # (handler key, operands) with label names still unresolved
+        self.labels = {}
+
+    def slot(self, key, name, value=0):
+        index = self.slot_ids.get(key)
+        if index is None:
+            index = self.slot_ids[key] = len(self.slot_names)
+            self.slot_names.append(name)
+            self.initial_slots.append(value)
+        return index
+
+    def emit(self, handler, *operands):
+        self.operations.append((handler, operands))
+
+    def mark(self, label):
+        self.labels[label] = len(self.operations)
+
+    def finish(self):
+        end = len(self.operations)
+        code = []
+        for handler, operands in self.operations:
+            operands = list(operands) + [None] * (3 - len(operands))
+            if handler == 'JUMP':
+                operands[0] = self.labels[operands[0]]
+            elif handler[0] == 'BRANCH':
+                operands[1] = self.labels[operands[1]]
+            elif handler == 'RETURN':
+                operands[1] = end
+            code.append(VM_HANDLERS[handler](*operands))
+        return VMProgram(code, self.initial_slots, self.slot_names)
+
+class VirtualMachine:
+    """ Executes IRCode, assembly text or object-file functions through a precompiled handler-table dispatch loop. """
+    def __init__(self):
+        self.steps = 0  # Instructions executed by the last run()
+
+    def load_ir(self, ir_code):
+        loader = VMLoader()
+        symbols = ir_code.symbols
+
+        def slot(symbol):
+            if symbols.kinds[symbol] == SYM_CONSTANT:
+                return loader.slot(('const', symbols.values[symbol]), symbols.names[symbol], symbols.values[symbol])
+            return loader.slot(('symbol', symbol), symbols.names[symbol])
+
+        for instruction in ir_code:
+            opcode = instruction.opcode
+            if opcode == IR_COPY:
+                loader.emit('MOVE', slot(instruction.dest), slot(instruction.arg1))
+            elif opcode in IR_OPERATOR:
+                loader.emit(('BINARY', opcode), slot(instruction.dest), slot(instruction.arg1), slot(instruction.arg2))
+            elif opcode == IR_IF:
+                # "if t goto L" branches when t is non-zero, i.e. CMP t, 0 / IFNE L
+                loader.emit('COMPARE', slot(instruction.arg1), slot(symbols.constant(0)))
+                loader.emit(('BRANCH', 'IFNE'), VM_FLAG, instruction.dest)
+            elif opcode == IR_GOTO:
+                loader.emit('JUMP', instruction.dest)
+            elif opcode == IR_RETURN:
+                loader.emit('RETURN', slot(instruction.arg1))
+            elif opcode == IR_LABEL:
+                loader.mark(instruction.dest)
+        return loader.finish()
+
+    def load_assembly(self, assembly_code):
+        loader = VMLoader()
+
+        def slot(operand):
+            if operand.lstrip('-').isdigit():
+                return loader.slot(('const', int(operand)), operand, int(operand))
+            return loader.slot(('name', operand), operand)
+
+        for line in assembly_code:
+            if line.endswith(':'):
+                loader.mark(line[:-1])
+                continue
+            mnemonic, _, rest = line.partition(' ')
+            operands = rest.split(', ') if rest else []
+            if mnemonic == 'declare':
+                continue
+            if mnemonic not in JUMP_TARGET:
+                operands = [slot(operand) for operand in operands]
+            if not self.emit_assembly(loader, mnemonic, operands):
+                raise ValueError(f"Unknown assembly instruction: {line}")
+        return loader.finish()
+
+    def load_object(self, object_file, name='main'):
+        """ Build a VMProgram from a function in an ObjectFile, decoding its instructions in place. """
+        loader = VMLoader()
+        string = object_file.string
+        marks = {}
+        for index, (_, offset) in enumerate(object_file.labels(name)):
+            marks.setdefault(offset, []).append(index)
+
+        def slot(kind, value):
+            if kind == OPERAND_CONSTANT:
+                return loader.slot(('const', value), str(value), value)
+            if kind == OPERAND_REGISTER:
+                return loader.slot(('register', value), register_name(value))
+            if kind == OPERAND_BIG_CONSTANT:
+                constant = int(string(value))
+                return loader.slot(('const', constant), string(value), constant)
+            return loader.slot(('name', value), string(value))
+
+        index = -1
+        for index, (opcode, kinds, value1, value2) in enumerate(object_file.instructions(name)):
+            for label in marks.get(index, ()):
+                loader.mark(label)
+            mnemonic = OBJECT_OPCODES[opcode]
+            if mnemonic == 'declare':
+                continue
+            if kinds == OPERAND_LABEL:
+                operands = (value1,)
+            elif kinds < 16:
+                operands = (slot(kinds, value1),)
+            else:
+                operands = (slot(kinds & 15, value1), slot(kinds >> 4, value2))
+            self.emit_assembly(loader, mnemonic, operands)
+        for label in marks.get(index + 1, ()):
+            loader.mark(label)
+        return loader.finish()
+
+    @staticmethod
+    def emit_assembly(loader, mnemonic, operands):
+        """ Emit one assembly instruction whose operands are resolved slots (a label for jumps).
+
+        Returns False for a mnemonic the VM does not know.
+        """
+        if mnemonic == 'LOAD' or mnemonic == 'STORE':
+            loader.emit('MOVE', operands[1], operands[0])
+        elif mnemonic in VM_OPERATIONS:
+            loader.emit(('BINARY', mnemonic), operands[0], operands[0], operands[1])
+        elif mnemonic == 'CMP':
+            loader.emit('COMPARE', operands[0], operands[1])
+        elif mnemonic in VM_BRANCH_TESTS:
+            loader.emit(('BRANCH', mnemonic), VM_FLAG, operands[0])
+        elif mnemonic == 'GOTO':
+            loader.emit('JUMP', operands[0])
+        elif mnemonic == 'RETURN':
+            loader.emit('RETURN', operands[0])
+        else:
+            return False
+        return True
+
+    def run(self, program, max_steps=None):
+        """ Execute a VMProgram; returns the returned value, or None if control falls off the end. """
+        code = program.code
+        slots = list(program.initial_slots)
+        end = len(code)
+        pc = 0
+        steps = 0
+        if max_steps is None:
+            while pc < end:
+                pc = code[pc](slots, pc)
+                steps += 1
+        else:
+            while pc < end:
+                if steps >= max_steps:
+                    raise RuntimeError(f"Step limit of {max_steps} instructions exceeded")
+                pc = code[pc](slots, pc)
+                steps += 1
+        self.steps = steps
+        return slots[VM_RESULT] if slots[VM_RETURNED] else None
+
+    def benchmark(self, program, repeat=1000):
+        """ Run a program repeatedly and report executed instructions per second. """
+        instructions = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            self.run(program)
+            instructions += self.steps
+        seconds = time.perf_counter() - start
+        return {'runs': repeat, 'instructions': instructions, 'seconds': seconds,
+                'instructions_per_second': instructions / seconds if seconds else float('inf')}
+
+    def outcome(self, program, max_steps=None):
+        """ ('return', value) or ('error', exception name), for comparing executions. """
+        try:
+            return ('return', self.run(program, max_steps))
+        except ZeroDivisionError as error:
+            return ('error', type(error).__name__)
+
+def check_equivalence(ast, num_registers=4, max_steps=None):
+    """ Execute unoptimized and optimized IR, plus the assembly for each, and check all outcomes agree. """
+    vm = VirtualMachine()
+    outcomes = {}
+    for label, generator_class in (('ir', IntermediateCodeGenerator), ('optimized_ir', OptimizedIntermediateCodeGenerator)):
+        ir_code = generator_class().generate_ir(ast)
+        assembly_code = AssemblyCodeGenerator(num_registers).generate_assembly(ir_code)
+        outcomes[label] = vm.outcome(vm.load_ir(ir_code), max_steps)
+        outcomes[label.replace('ir', 'assembly')] = vm.outcome(vm.load_assembly(assembly_code), max_steps)
+    return len(set(outcomes.values())) == 1, outcomes
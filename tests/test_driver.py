@@ -0,0 +1,40 @@
+import pytest
+
+from minilang import compile_batch, driver
+
+OK = "function main() { int x = 5; return x + 1; }\n"
+
+def test_batch_reports_each_failure_and_keeps_going(tmp_path, monkeypatch):
+    compile_source = driver.compile_source
+
+    def crash_on_bad(code, *args, **kwargs):
+        if 'bad' in code:
+            raise TypeError("compiler bug")
+        return compile_source(code, *args, **kwargs)
+
+    monkeypatch.setattr(driver, 'compile_source', crash_on_bad)
+    paths = []
+    for name, code in (('ok.ml', OK), ('bad.ml', "function bad() { return 1; }\n"),
+                       ('syntax.ml', "function main() { return ; }\n")):
+        (tmp_path / name).write_text(code)
+        paths.append(str(tmp_path / name))
+    paths.append(str(tmp_path / 'missing.ml'))
+
+    results, summary = compile_batch(paths, workers=len(paths) + 1)
+    assert [result['failed'] for result in results] == [False, True, True, True]
+    assert summary['failed'] == 3
+    assert results[0]['assembly'] and not results[0]['errors']
+    assert 'TypeError: compiler bug' in results[1]['errors'][0]
+    assert 'Expected an expression' in results[2]['errors'][0]
+    assert results[3]['errors'][0].startswith('FileNotFoundError')
+
+@pytest.mark.parametrize('options', [['--registers', '0'], ['--registers', '1'], ['--emit', 'asn'],
+                                     ['--emit', 'asm,ir,objj'], ['--emit', ',']])
+def test_bad_options_are_rejected_before_compiling(tmp_path, capsys, options):
+    path = tmp_path / 'ok.ml'
+    path.write_text(OK)
+    with pytest.raises(SystemExit) as exited:
+        driver.compile_main([str(path), '-o', str(tmp_path / 'out'), *options])
+    assert exited.value.code == 2
+    assert 'error: --' in capsys.readouterr().err
+    assert not (tmp_path / 'out').exists()
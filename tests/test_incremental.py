@@ -0,0 +1,124 @@
+import random
+from bisect import bisect_left
+from itertools import accumulate
+
+import pytest
+
+from minilang import IntermediateCodeGenerator, Parser, SemanticAnalyzer, SourceMap, VirtualMachine, lex
+from minilang.benchmark import generate_program
+from minilang.incremental import IncrementalDocument, PrefixSums
+
+SNIPPETS = [" x", "v1", "7", " + 2", ";", "}", "{", "\n", "int v9 = 3;", "v2 = v1 * 3;\n", "return 5;", "=", "(",
+            "if (v1 < 2) { int v1 = 9; v2 = v1 * 2; } else { v2 = v1; }\n", "while (v3 > 9) { v3 = v3 - 1; }\n",
+            "int v1 = 4;", "@", "else", "int"]
+
+class SmallChunks(PrefixSums):
+    CHUNK = 3  # so that a few dozen values already span many chunks
+
+def test_prefix_sums_match_a_plain_list():
+    rng = random.Random(0)
+    for _ in range(100):
+        values = [rng.randint(0, 5) for _ in range(rng.randint(0, 40))]
+        sums = SmallChunks(values)
+        for _ in range(40):
+            first = rng.randint(0, len(values))
+            last = rng.randint(first, len(values))
+            new = [rng.randint(0, 5) for _ in range(rng.randint(0, 12))]
+            values[first:last] = new
+            sums.splice(first, last, new)
+            if values:
+                index = rng.randrange(len(values))
+                values[index] += 2
+                sums.add(index, 2)
+            assert list(sums) == values and len(sums) == len(values) and sums.total == sum(values)
+            totals = list(accumulate(values))
+            assert [sums.prefix(count) for count in range(len(values) + 1)] == [0, *totals]
+            assert [sums.bisect(target) for target in range(-1, sum(values) + 2)] == \
+                [bisect_left(totals, target) for target in range(-1, sum(values) + 2)]
+
+def outcome(ir_code):
+    vm = VirtualMachine()
+    try:
+        return vm.outcome(vm.load_ir(ir_code), 10000)
+    except RuntimeError:  # step limit: an edit can make a loop endless
+        return 'endless'
+
+def check_against_a_rebuild(document):
+    assert document.tokens == lex(document.text, [])
+    try:
+        ast = Parser(lex(document.text, [])).parse_module()
+    except SyntaxError:
+        ast = None
+    if ast is None:
+        assert document.root is None
+        return
+    assert document.ast == ast
+    errors = SemanticAnalyzer().analyze(ast)
+    assert document.errors == errors
+    source_map = document.source_map()
+    assert [source_map.render(error) for error in document.errors] == \
+        [SourceMap(document.text).render(error) for error in errors]
+    ir_codes = document.ir_codes()
+    assert [ir_code.name for ir_code in ir_codes] == [function.name for function in ast.functions]
+    for ir_code, function in zip(ir_codes, ast.functions):
+        assert outcome(ir_code) == outcome(IntermediateCodeGenerator().generate_ir(function))
+
+@pytest.mark.parametrize('seed', range(6))
+def test_edits_match_a_rebuild(seed):
+    rng = random.Random(seed)
+    code = generate_program(25, depth=2, declarations=6, seed=seed, functions=1 + seed % 3)
+    document = IncrementalDocument(code)
+    for _ in range(60):
+        text = document.text
+        offset = rng.randrange(len(text) + 1)
+        removed = rng.choice([0, 0, 1, 3]) if offset < len(text) else 0
+        try:
+            document.edit(offset, min(removed, len(text) - offset), rng.choice(SNIPPETS))
+        except SyntaxError:
+            pass  # the text no longer parses; the next edit that fixes it rebuilds the document
+        check_against_a_rebuild(document)
+
+def test_each_function_of_a_module_is_compiled():
+    code = ("function f() { int x = 1; return x; }\n"
+            "function g() { int y = 2; return y * 3; }\n"
+            "function f() { return z; }\n")
+    document = IncrementalDocument(code)
+    assert [ir_code.name for ir_code in document.ir_codes()] == ['f', 'g', 'f']
+    assert document.errors == ["Semantic Error: Function 'f' defined more than once.",
+                               "Semantic Error: Variable 'z' used before declaration."]
+    with pytest.raises(ValueError, match="3 functions"):
+        document.ir_code()
+    # An edit in the second function's body leaves the other functions alone
+    stats = document.edit(code.index('y * 3') + 4, 1, '5')
+    assert stats['reparsed'] == 1
+    assert outcome(document.ir_codes()[1]) == ('return', 10)
+    check_against_a_rebuild(document)
+    # So does declaring x in g: f's x is in another function's scope
+    stats = document.edit(code.index('int y'), 0, 'int x = 4; ')
+    assert stats['reanalyzed'] == stats['reparsed']
+    check_against_a_rebuild(document)
+    # Adding a function, or junk after the last one, takes a full parse
+    document.edit(len(document.text), 0, "function h() { return 7; }\n")
+    assert [ir_code.name for ir_code in document.ir_codes()] == ['f', 'g', 'f', 'h']
+    with pytest.raises(SyntaxError, match="Expected a function definition"):
+        document.edit(len(document.text), 0, "return 1;")
+    assert document.root is None
+
+def worst_edit_stats(statements, edits=100):
+    """ The most tokens relexed and statements reparsed and reanalyzed by any of a run of one-digit edits. """
+    code = generate_program(statements, declarations=10)
+    document = IncrementalDocument(code)
+    digits = [offset for offset, char in enumerate(code) if char.isdigit()]
+    rng = random.Random(0)
+    worst = dict.fromkeys(('relexed', 'reparsed', 'reanalyzed'), 0)
+    for _ in range(edits):
+        stats = document.edit(rng.choice(digits), 1, str(rng.randint(1, 9)))
+        for key in worst:
+            worst[key] = max(worst[key], stats[key])
+    return worst
+
+def test_edit_work_does_not_grow_with_the_file():
+    # Timings at growing sizes are left to --benchmark --incremental
+    small = worst_edit_stats(300)
+    assert small['reparsed'] >= 1
+    assert worst_edit_stats(3000) == small
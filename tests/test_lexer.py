@@ -0,0 +1,72 @@
+import io
+import mmap
+
+import pytest
+
+from minilang.lexer import Diagnostic, SourceMap, TokenBuffer, lex, lex_file, lex_stream, token_scanner
+
+UTF8_SOURCE = 'function main() {\n    int x = 1 é 2;\n    return x € 3;\n}\n'
+UTF8_TOKENS = [('KEYWORD', 'function'), ('IDENTIFIER', 'main'), ('DELIMITER', '('), ('DELIMITER', ')'),
+               ('DELIMITER', '{'), ('IDENTIFIER', 'int'), ('IDENTIFIER', 'x'), ('OPERATOR', '='), ('NUMBER', '1'),
+               ('NUMBER', '2'), ('DELIMITER', ';'), ('KEYWORD', 'return'), ('IDENTIFIER', 'x'), ('NUMBER', '3'),
+               ('DELIMITER', ';'), ('DELIMITER', '}')]
+
+@pytest.fixture
+def utf8_file(tmp_path):
+    path = tmp_path / 'utf8.ml'
+    path.write_bytes(UTF8_SOURCE.encode('utf-8'))
+    return path
+
+def open_mmap(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+SOURCES = {
+    'lex_file': lambda path, errors: list(lex_file(path, errors)),
+    'mmap': lambda path, errors: list(lex_stream(open_mmap(path), errors=errors)),
+    'bytes': lambda path, errors: list(lex_stream(path.read_bytes(), errors=errors)),
+    'binary file': lambda path, errors: list(lex_stream(io.BytesIO(path.read_bytes()), chunk_size=7, errors=errors)),
+    'token buffer': lambda path, errors: list(TokenBuffer.from_source(path.read_bytes(), errors)),
+}
+
+@pytest.mark.parametrize('source', SOURCES)
+def test_non_ascii_characters_are_lexical_errors(utf8_file, source):
+    errors = []
+    assert SOURCES[source](utf8_file, errors) == UTF8_TOKENS
+    assert errors == ["Error: Unrecognized symbol 'é'", "Error: Unrecognized symbol '€'"]
+
+# An em space, word characters with diacritics inside and next to ASCII words, a non-ASCII digit
+UNICODE_SOURCE = 'function main() {\n    int\u2003x = 1;\n    ,\u00e9lt@if na\u00efve;\n    return x + \u0663;\n}\n'
+
+@pytest.mark.parametrize('source', SOURCES)
+def test_bytes_sources_lex_like_a_str(tmp_path, source):
+    path = tmp_path / 'unicode.ml'
+    path.write_bytes(UNICODE_SOURCE.encode('utf-8'))
+    errors, text_errors = [], []
+    assert SOURCES[source](path, errors) == lex(UNICODE_SOURCE, text_errors)
+    assert errors == text_errors
+    assert ('IDENTIFIER', 'x') in lex(UNICODE_SOURCE, []) and ('IDENTIFIER', 'lt') not in lex(UNICODE_SOURCE, [])
+
+def test_bytes_diagnostics_point_at_the_whole_character(utf8_file):
+    errors = []
+    list(lex_file(utf8_file, errors))
+    data = utf8_file.read_bytes()
+    assert [data[error.offset:].decode()[0] for error in errors] == ['é', '€']
+    text_errors = []
+    lex(UTF8_SOURCE, text_errors)
+    assert errors == text_errors
+
+def test_invalid_utf8_is_reported_not_raised(tmp_path):
+    path = tmp_path / 'latin1.ml'
+    path.write_bytes(b'x \xe9\xff y\n')
+    errors = []
+    assert list(lex_file(path, errors)) == [('IDENTIFIER', 'x'), ('IDENTIFIER', 'y')]
+    assert errors
+
+def test_source_map_resolves_token_indices_with_or_without_offsets():
+    code = 'function main() {\n  int @ x = 1;\n  return y;\n}\n'
+    tokens, offsets = token_scanner.tokenize(code, [])
+    error = Diagnostic("Undeclared variable 'y'", tokens.index(('IDENTIFIER', 'y')))
+    assert SourceMap(code).render(error) == "3:10: Undeclared variable 'y'"
+    assert SourceMap(code, offsets).render(error) == "3:10: Undeclared variable 'y'"
+    assert SourceMap(code).render(Diagnostic("Unexpected end", len(tokens))) == "5:1: Unexpected end"
@@ -0,0 +1,37 @@
+import pytest
+
+from minilang import (AssemblyCodeGenerator, IntermediateCodeGenerator, ObjectFile, ObjectWriter,
+                      OptimizedIntermediateCodeGenerator, Parser, VirtualMachine, generate_program, lex)
+
+FUNCTIONS = {
+    'main': "function main() { int x = 3; int y = x * 5000000000; if (y > 7) { x = x + 1; } else { } return x; }",
+    'loop': "function loop() { int i = 0; int s = 0; while (i < 10) { s = s + i; i = i + 1; } return s; }",
+    'generated': generate_program(80, depth=2, seed=5).replace('function main', 'function generated', 1),
+}
+
+def assemble(code, optimize=False):
+    generator = OptimizedIntermediateCodeGenerator() if optimize else IntermediateCodeGenerator()
+    ir_code = generator.generate_ir(Parser(lex(code)).parse_program())
+    return AssemblyCodeGenerator(4).generate_assembly(ir_code)
+
+@pytest.mark.parametrize('optimize', [False, True])
+def test_object_file_round_trip(tmp_path, optimize):
+    assembly = {name: assemble(code, optimize) for name, code in FUNCTIONS.items()}
+    writer = ObjectWriter()
+    for name, assembly_code in assembly.items():
+        writer.add_function(name, assembly_code)
+    path = tmp_path / 'module.mlo'
+    writer.write(path)
+    vm = VirtualMachine()
+    with ObjectFile(path) as object_file:
+        assert list(object_file.function_names()) == list(FUNCTIONS)
+        for name, assembly_code in assembly.items():
+            assert object_file.disassemble(name) == assembly_code
+            expected = vm.outcome(vm.load_assembly(assembly_code), 100000)
+            assert vm.outcome(vm.load_object(object_file, name), 100000) == expected
+
+def test_a_file_that_is_not_an_object_file_is_rejected(tmp_path):
+    path = tmp_path / 'empty.mlo'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError, match="not a MiniLang object file"):
+        ObjectFile(path)
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import minilang
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+def test_import_loads_no_stage_and_prints_nothing():
+    output = run_python("import sys, minilang; print(sorted(m for m in sys.modules if m.startswith('minilang.')))")
+    assert output == "[]\n"
+
+def test_an_export_loads_only_its_own_stage():
+    output = run_python("import sys; from minilang import lex; "
+                        "print('minilang.optimizer' in sys.modules, 'minilang.backend' in sys.modules)")
+    assert output == "False False\n"
+
+def test_every_export_resolves():
+    for name in minilang.__all__:
+        assert getattr(minilang, name) is not None
+
+def test_command_line_compiles_a_file(tmp_path):
+    path = tmp_path / 'main.ml'
+    path.write_text("function main() { int x = 2; return x * 21; }\n")
+    result = subprocess.run([sys.executable, '-m', 'minilang', str(path)], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,114 @@
+import pytest
+
+from minilang import (AssemblyCodeGenerator, IntermediateCodeGenerator, OptimizedIntermediateCodeGenerator,
+                      PackedParser, Parser, SemanticAnalyzer, SyntaxDirectedTranslator, TokenBuffer, VirtualMachine,
+                      check_equivalence, compile_source, generate_program, lex, lex_regex, lex_stream)
+from minilang.benchmark import executed_instructions
+
+CODE = """function main() {
+    int x = 6;
+    int y = x * 7;
+    if (y > 40) {
+        y = y - 2;
+    } else {
+    }
+    int i = 0;
+    int s = 0;
+    while (i < 5) {
+        s = s + i * 3;
+        i = i + 1;
+    }
+    return y + s;
+}"""
+
+GENERATED = [
+    {'statements': 60, 'depth': 3, 'seed': 1},
+    {'statements': 40, 'chain': 12, 'nesting': 3, 'seed': 2},
+    {'statements': 80, 'declarations': 30, 'seed': 3},
+    {'statements': 40, 'declarations': 8, 'loops': 20, 'seed': 4},
+]
+
+def run(ir_code):
+    vm = VirtualMachine()
+    return vm.run(vm.load_ir(ir_code))
+
+def test_lexer_matches_the_regex_lexer():
+    for shape in GENERATED:
+        code = generate_program(**shape)
+        assert lex(code) == lex_regex(code)
+    assert lex(CODE)[:3] == [('KEYWORD', 'function'), ('IDENTIFIER', 'main'), ('DELIMITER', '(')]
+
+def test_parsers_agree():
+    ast = Parser(lex(CODE)).parse_program()
+    assert ast.name == 'main' and len(ast.statements) == 7
+    assert PackedParser(TokenBuffer.from_source(CODE)).parse_program() == ast
+
+def test_semantic_errors():
+    assert SemanticAnalyzer().analyze(Parser(lex(CODE)).parse_program()) == []
+    ast = Parser(lex("function main() { int x = 1; return y; }")).parse_program()
+    assert SemanticAnalyzer().analyze(ast) == ["Semantic Error: Variable 'y' used before declaration."]
+
+def test_ir_and_fused_front_end_agree():
+    ast = Parser(lex(CODE)).parse_program()
+    ir_code = IntermediateCodeGenerator().generate_ir(ast)
+    assert run(ir_code) == 40 + 30
+    assert SyntaxDirectedTranslator(lex_stream(CODE)).parse_program().to_text() == ir_code.to_text()
+
+def test_optimizer_shrinks_and_preserves_the_result():
+    ast = Parser(lex(CODE)).parse_program()
+    plain = IntermediateCodeGenerator().generate_ir(ast)
+    optimized = OptimizedIntermediateCodeGenerator().generate_ir(ast)
+    assert len(optimized) < len(plain)
+    assert run(optimized) == run(plain)
+
+@pytest.mark.parametrize('registers', [2, 4, 8])
+def test_backend_runs_like_the_ir(registers):
+    ast = Parser(lex(CODE)).parse_program()
+    assembly = AssemblyCodeGenerator(registers).generate_assembly(IntermediateCodeGenerator().generate_ir(ast))
+    vm = VirtualMachine()
+    assert vm.run(vm.load_assembly(assembly)) == 70
+
+@pytest.mark.parametrize('shape', GENERATED)
+def test_check_equivalence_on_generated_programs(shape):
+    same, outcomes = check_equivalence(Parser(lex(generate_program(**shape))).parse_program(), max_steps=100000)
+    assert same, outcomes
+    assert set(outcomes) == {'ir', 'optimized_ir', 'assembly', 'optimized_assembly'}
+
+def test_check_equivalence_agrees_on_errors():
+    ast = Parser(lex("function main() { int x = 0; return 5 / x; }")).parse_program()
+    same, outcomes = check_equivalence(ast)
+    assert same and outcomes['ir'] == ('error', 'ZeroDivisionError')
+
+@pytest.mark.parametrize('fused', [False, True])
+def test_compile_source_outputs(fused):
+    result = compile_source(CODE, fused=fused)
+    assert result['errors'] == []
+    assert [name for name, _ in result['functions']] == ['main']
+    vm = VirtualMachine()
+    assert vm.run(vm.load_assembly(result['assembly'])) == 70
+
+def test_loop_optimizations_cut_executed_instructions():
+    executed = executed_instructions(generate_program(40, declarations=8, loops=50))
+    assert executed['optimized'] < executed['ir'] * 0.9
+
+# Source variables named like registers and like the temps that spill
+SHADOWING = [
+    "function main() { int R0 = 7; int a = 3; int b = a * 4; int c = b + 1; return c + R0; }",
+    """function main() {
+        int a = 1;
+        int b = 2;
+        int x = (a + b) * (a - b) + (a * b) * (b + a) * (b - a);
+        int t2 = 10;
+        int t3 = 20;
+        int R3 = 40;
+        int R0 = 7;
+        int y = (x + a) * (x - b) + (t2 * t3) - (R0 * R3);
+        return t2 + t3 + R3 + R0 + 0 * y;
+    }""",
+]
+
+@pytest.mark.parametrize('registers', [1, 2, 4])
+@pytest.mark.parametrize('code', SHADOWING)
+def test_variables_named_like_registers_or_spill_slots(code, registers):
+    same, outcomes = check_equivalence(Parser(lex(code)).parse_program(), registers)
+    assert same, outcomes
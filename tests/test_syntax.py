@@ -0,0 +1,37 @@
+import pytest
+
+from minilang import Parser, PackedParser, SyntaxDirectedTranslator, TokenBuffer, compile_source, lex, lex_stream
+
+MISSING_EXPRESSIONS = [
+    "int x = ;",
+    "return ;",
+    "int x = 1; return x + ;",
+    "x = ;",
+    "if () { return 1; } else { }",
+    "int x = (;",
+    "while () { }",
+]
+
+FRONT_ENDS = {
+    'parser': lambda code: Parser(lex(code)).parse_program(),
+    'packed': lambda code: PackedParser(TokenBuffer.from_source(code)).parse_program(),
+    'translator': lambda code: SyntaxDirectedTranslator(lex_stream(code)).parse_program(),
+}
+
+@pytest.mark.parametrize('front_end', FRONT_ENDS)
+@pytest.mark.parametrize('statement', MISSING_EXPRESSIONS)
+def test_missing_expression_is_a_syntax_error(front_end, statement):
+    code = f"function main() {{ {statement} return 1; }}"
+    with pytest.raises(SyntaxError, match="Expected an expression") as raised:
+        FRONT_ENDS[front_end](code)
+    assert lex(code)[raised.value.args[0].token][0] == 'DELIMITER'
+
+@pytest.mark.parametrize('fused', [False, True])
+@pytest.mark.parametrize('optimize', [False, True])
+def test_missing_expression_stops_before_ir(fused, optimize):
+    with pytest.raises(SyntaxError):
+        compile_source("function main() { return x + ; }", optimize=optimize, fused=fused)
+
+def test_parenthesized_expression_still_parses():
+    ast = Parser(lex("function main() { return (1 + 2) * 3; }")).parse_program()
+    assert ast.statements[0].expression.operator == '*'